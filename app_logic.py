@@ -1,81 +1,66 @@
-import io
 import time
-import threading
+
 from kivy.uix.screenmanager import Screen
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.button import Button
 from kivy.clock import Clock
 from kivy.core.window import Window
-from kivy.core.image import Image as CoreImage
 from kivy.graphics import Color as KivyColor
 from kivy.app import App
 from kivy.animation import Animation
+from kivy.logger import Logger
 
-# Imports for all WCA puzzles
-from pyTwistyScrambler import (
-    scrambler222, scrambler333, scrambler444, scrambler555,
-    scrambler666, scrambler777, pyraminxScrambler,
-    megaminxScrambler, squareOneScrambler,
-    skewbScrambler, clockScrambler
+from startup_timing import startup
+from profiler import profiler, profiled
+from timing import now_ns, format_ms
+from timer_state import (
+    TimerStateMachine, IDLE, INSPECTION, HOLDING, READY, RUNNING, STOPPED
+)
+from timer_engine import (
+    SOLVES_CHANGED, PUZZLE_CHANGED, SESSION_CHANGED, SCRAMBLE_CHANGED, QUEUES_CHANGED, CASES_CHANGED,
+    format_time, format_solve, session_name
 )
+from session_stats import AVERAGE_SIZES
+from solve_analytics import SolveAnalytics, ROLLING_SIZES, PERCENTILES, numpy_available
+from solve_graph import SolveGraph
+from cube_state import cube_size, scramble_state
+# Imported so styles.kv can use the widgets
+from native_graph import SolveGraphWidget, HistogramWidget
+from cube_net import CubeNetWidget
+from profiler_overlay import ProfilerOverlay
+
+# Hold-to-start thresholds offered in Settings
+HOLD_THRESHOLDS_MS = (0, 300, 500, 1000)
+
+# Scrambles generated per press of "Find Cases"
+CASE_SEARCH_SIZE = 500
 
-import matplotlib
-
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_agg import FigureCanvasAgg
-
-# Configuration for WCA Scramblers
-PUZZLE_CONFIG = {
-    "2x2x2": {"module": scrambler222, "func": "get_WCA_scramble", "args": {}},
-    "3x3x3": {"module": scrambler333, "func": "get_WCA_scramble", "args": {}},
-    "4x4x4": {"module": scrambler444, "func": "get_WCA_scramble", "args": {"n": 40}},
-    "5x5x5": {"module": scrambler555, "func": "get_WCA_scramble", "args": {"n": 60}},
-    "6x6x6": {"module": scrambler666, "func": "get_WCA_scramble", "args": {"n": 80}},
-    "7x7x7": {"module": scrambler777, "func": "get_WCA_scramble", "args": {"n": 100}},
-    "Pyraminx": {"module": pyraminxScrambler, "func": "get_WCA_scramble", "args": {}},
-    "Megaminx": {"module": megaminxScrambler, "func": "get_WCA_scramble", "args": {"n": 70}},
-    "Square-1": {"module": squareOneScrambler, "func": "get_WCA_scramble", "args": {}},
-    "Skewb": {"module": skewbScrambler, "func": "get_WCA_scramble", "args": {}},
-    "Clock": {"module": clockScrambler, "func": "get_WCA_scramble", "args": {}},
-}
-
-# Configuration for Trainer Modes
-TRAINER_CONFIG = {
-    "3x3x3 3BLD": {"module": scrambler333, "func": "get_3BLD_scramble", "args": {}},
-    "3x3x3 Edges": {"module": scrambler333, "func": "get_edges_scramble", "args": {}},
-    "3x3x3 Corners": {"module": scrambler333, "func": "get_corners_scramble", "args": {}},
-    "3x3x3 LL": {"module": scrambler333, "func": "get_LL_scramble", "args": {}},
-    "3x3x3 F2L": {"module": scrambler333, "func": "get_F2L_scramble", "args": {}},
-    "3x3x3 Cross (Easy)": {"module": scrambler333, "func": "get_easy_cross_scramble", "args": {"n": 4}},
-    "3x3x3 Cross (Difficult)": {"module": scrambler333, "func": "get_easy_cross_scramble", "args": {"n": 8}},
-    "3x3x3 LSLL": {"module": scrambler333, "func": "get_LSLL_scramble", "args": {}},
-    "3x3x3 ZBLL": {"module": scrambler333, "func": "get_ZBLL_scramble", "args": {}},
-    "3x3x3 ZZLL": {"module": scrambler333, "func": "get_ZZLL_scramble", "args": {}},
-    "3x3x3 ZBLS": {"module": scrambler333, "func": "get_ZBLS_scramble", "args": {}},
-    "3x3x3 LSE": {"module": scrambler333, "func": "get_LSE_scramble", "args": {}},
-    "3x3x3 CMLL": {"module": scrambler333, "func": "get_CMLL_scramble", "args": {}},
-    "3x3x3 CLL": {"module": scrambler333, "func": "get_CLL_scramble", "args": {}},
-    "3x3x3 ELL": {"module": scrambler333, "func": "get_ELL_scramble", "args": {}},
-    "3x3x3 EO Line": {"module": scrambler333, "func": "get_EOLine_scramble", "args": {}},
-    "4x4x4 Edges": {"module": scrambler444, "func": "get_edges_scramble", "args": {"n": 8}},
-    "5x5x5 Edges": {"module": scrambler555, "func": "get_edges_scramble", "args": {"n": 8}},
-    "6x6x6 Edges": {"module": scrambler666, "func": "get_edges_scramble", "args": {"n": 8}},
-    "7x7x7 Edges": {"module": scrambler777, "func": "get_edges_scramble", "args": {"n": 8}},
-    "Square-1 Face Turn Metric": {"module": squareOneScrambler, "func": "get_face_turn_metric_scramble",
-                                  "args": {"n": 40}},
-    "Square-1 Twist Metric": {"module": squareOneScrambler, "func": "get_twist_metric_scramble", "args": {"n": 20}},
-}
+# Latest days listed under the histogram on the Statistics screen
+DAYS_SHOWN = 7
 
 
 class SplashScreen(Screen):
     def __init__(self, **kwargs):
         super(SplashScreen, self).__init__(**kwargs)
         self.main_sm = None
+        self.app_ready = False
+        self._fading = False
 
     def on_enter(self):
-        Clock.schedule_once(self.start_fade_out, 1.0)
+        if self.app_ready:
+            self.start_fade_out()
 
-    def start_fade_out(self, dt):
-        anim = Animation(opacity=0, duration=0.5)
+    def mark_ready(self):
+        """Called by TimerScreen once its data is loaded; the splash stays up until then."""
+        self.app_ready = True
+        if self.main_sm.current == 'splash':
+            self.start_fade_out()
+
+    def start_fade_out(self, *args):
+        if self._fading:
+            return
+        self._fading = True
+        anim = Animation(opacity=0, duration=0.25)
         anim.bind(on_complete=self.switch_to_timer)
         anim.start(self)
 
@@ -87,23 +72,29 @@ class TimerScreen(Screen):
     def __init__(self, **kwargs):
         super(TimerScreen, self).__init__(**kwargs)
 
-        # State variables
-        self.running = False
-        self.start_time = 0
+        # State variables: hold/inspection/run transitions are one-shot Clock events
+        self.timer_state = TimerStateMachine(
+            schedule=lambda callback, delay: Clock.schedule_once(lambda dt: callback(), delay)
+        )
+        self.timer_state.on_state = self._on_timer_state
+        self.timer_state.on_solve = self._on_solve
         self.timer_event = None
-        self.holding = False
-        self.ready_to_start = False
-        self.hold_start_time = 0
-        self.hold_event = None
 
-        # FIX: Flag to prevent multiple generation threads running at once
-        self.is_generating = False
+        # Performance: Last centisecond value shown, the label is only touched when it changes
+        self._shown_centis = -1
+
+        # Performance: Coalesce queue saves, batches arrive in bursts
+        self._queue_save_trigger = Clock.create_trigger(self._save_queues, 1.0)
+
+        # Performance: Labels that changed after a solve are refreshed together on
+        # the next frame, so the frame that stops the timer only shows the time
+        self._pending_ui = set()
+        self._pending_scramble = None
+        self._ui_update_trigger = Clock.create_trigger(self._flush_ui_updates, 0)
 
-        # Data & Puzzle State
-        self.solve_data = {}
-        self.current_puzzle = "3x3x3"
-        self.current_scramble = ""
-        self.scramble_queue = []
+        # Performance: The next queued scramble's cube state is simulated ahead of
+        # time, while the timer is idle, and memoized until it is shown
+        self._warm_cube_state_trigger = Clock.create_trigger(self._warm_cube_state, 1.0)
 
         # Performance: Cache the LED color instruction
         self.led_color_instruction = None
@@ -142,34 +133,37 @@ class TimerScreen(Screen):
         anim.start(overlay)
 
     def _load_data(self, dt):
+        startup.mark('first frame')
         store = App.get_running_app().store
-
-        # Initialize empty data structures if they don't exist
-        if not store.exists('all_data'):
-            for puz in PUZZLE_CONFIG.keys():
-                self.solve_data[puz] = {'times': [], 'scrambles': []}
-            for puz in TRAINER_CONFIG.keys():
-                self.solve_data[puz] = {'times': [], 'scrambles': []}
-        else:
-            self.solve_data = store.get('all_data')['value']
-
-            if store.exists('current_puzzle'):
-                self.current_puzzle = store.get('current_puzzle')['value']
-            else:
-                self.current_puzzle = "3x3x3"
-
-        if self.current_puzzle not in self.solve_data:
-            self.current_puzzle = "3x3x3"
-
-        # Load Scramble Queue
-        try:
-            queues = store.get('scramble_queues')['value']
-            self.scramble_queue = queues.get(self.current_puzzle, [])
-        except KeyError:
-            self.scramble_queue = []
-
-        # Initialize UI
-        self._update_titles()
+        engine = App.get_running_app().engine
+        if store.recovered_from:
+            Logger.warning(f"Settings: damaged settings file, restored from {store.recovered_from}")
+
+        # History saved in the JsonStore by older versions is migrated on first run
+        legacy_data = store.get('all_data')['value'] if store.exists('all_data') else None
+        legacy_puzzle = store.get('current_puzzle')['value'] if store.exists('current_puzzle') else None
+        engine.load(legacy_data, legacy_puzzle)
+        if legacy_data is not None:
+            store.delete('all_data')
+        startup.mark('solve history load')
+
+        if store.exists('timer_settings'):
+            timer_settings = store.get('timer_settings')['value']
+            self.timer_state.hold_ms = timer_settings.get('hold_ms', 500)
+            self.timer_state.inspection = timer_settings.get('inspection', False)
+        self._update_timer_settings_labels()
+
+        engine.subscribe(SOLVES_CHANGED, self._on_solves_changed)
+        engine.subscribe(SESSION_CHANGED, self._on_session_changed)
+        engine.subscribe(SCRAMBLE_CHANGED, self._on_scramble_changed)
+        engine.subscribe(QUEUES_CHANGED, lambda: self._queue_save_trigger())
+        # Case banks and per-case times are saved along with the queues
+        engine.subscribe(CASES_CHANGED, lambda puzzle: self._queue_save_trigger())
+
+        # Migrate queues saved in the JsonStore by older versions
+        if store.exists('scramble_queues'):
+            engine.import_queues(store.get('scramble_queues')['value'])
+            store.delete('scramble_queues')
 
         # Cache LED Reference
         led_canvas = self.ids.led.canvas.before
@@ -180,396 +174,534 @@ class TimerScreen(Screen):
 
         self.update_stats_label()
         self.update_recent_times()
-        self.update_graph()
         self.set_led_color(0.5, 0.5, 0.5)
+        startup.mark('timer ui init')
 
         # Ensure Loading Overlay is NOT visible on startup
         self.hide_loading()
 
-        # CHECK IF FIRST RUN (Data Generation Needed)
-        if not store.exists('all_data'):
-            self.show_loading()
-            # Start thread for generation
-            threading.Thread(target=self._run_generation_thread).start()
-        else:
-            # Normal load, just get a scramble if queue is empty
-            if not self.scramble_queue:
-                self.ids.scramble_label.text = "Generating Scrambles..."
-                # Use threaded generation
-                self._fill_scramble_queue(50)
-            else:
-                self.generate_new_scramble()
-
-    def _run_generation_thread(self):
-        """Generates scramble data in a background thread for First Run."""
-        all_queues = {}
-        all_configs = {**PUZZLE_CONFIG, **TRAINER_CONFIG}
-
-        for puz_name, config in all_configs.items():
-            module = config['module']
-            func_name = config['func']
-            args = config['args']
-            func = getattr(module, func_name)
-            all_queues[puz_name] = [func(**args) for _ in range(50)]
-
-        # Schedule the UI update on the main thread
-        Clock.schedule_once(lambda dt: self._finish_setup(all_queues), 0)
-
-    def _finish_setup(self, all_queues):
-        """Called after thread finishes."""
-        store = App.get_running_app().store
-        store.put('all_data', value=self.solve_data)
-        store.put('current_puzzle', value=self.current_puzzle)
-        store.put('scramble_queues', value=all_queues)
-
-        # Load the queue for the current puzzle
-        self.scramble_queue = all_queues.get(self.current_puzzle, [])
-        self.generate_new_scramble()
-
-        # Hide the loading screen
-        self.hide_loading()
-        self.is_generating = False
-
-    def _fill_scramble_queue(self, num=50):
-        """
-        Generates scrambles for current puzzle in a background thread.
-        Uses a flag to prevent duplicate threads.
-        """
-        # Safety check: If we are already generating, don't start another one
-        if self.is_generating:
-            return
-
-        # Set flag and show UI immediately
-        self.is_generating = True
-        self.show_loading()
-
-        # Start the generation in a separate thread
-        threading.Thread(target=self._run_single_generation_thread, args=(num,)).start()
-
-    def _run_single_generation_thread(self, num):
-        """
-        The actual heavy lifting. Runs in background.
-        """
-        all_configs = {**PUZZLE_CONFIG, **TRAINER_CONFIG}
-
-        if self.current_puzzle not in all_configs:
-            return
-
-        config = all_configs[self.current_puzzle]
-        module = config['module']
-        func_name = config['func']
-        args = config['args']
-
-        func = getattr(module, func_name)
-        new_scrambles = [func(**args) for _ in range(num)]
-
-        # Return to main thread to update UI
-        Clock.schedule_once(lambda dt: self._finish_single_generation(new_scrambles), 0)
-
-    def _finish_single_generation(self, new_scrambles):
-        """
-        Called on Main Thread after generation is done.
-        """
-        self.scramble_queue.extend(new_scrambles)
-        self._save_queue()
-
-        self.is_generating = False
-        self.hide_loading()
-
-        if self.ids.scramble_label.text == "Generating Scrambles...":
-            self.generate_new_scramble()
+        # Only the current puzzle is generated up front (a single quick scramble
+        # on first run), everything else waits for switch_puzzle or idle time
+        engine.next_scramble()
+        Clock.schedule_once(lambda dt: engine.prefetch_idle(), 5.0)
 
-    def _save_data(self):
-        store = App.get_running_app().store
-        store.put('all_data', value=self.solve_data)
-        store.put('current_puzzle', value=self.current_puzzle)
+        self.manager.get_screen('splash').mark_ready()
 
-    def _save_queue(self):
-        store = App.get_running_app().store
-        try:
-            queues = store.get('scramble_queues')['value']
-        except KeyError:
-            queues = {}
-        queues[self.current_puzzle] = self.scramble_queue
-        store.put('scramble_queues', value=queues)
+    def _save_queues(self, dt):
+        # The files are written on the engine's I/O thread
+        App.get_running_app().engine.save_queues(background=True)
 
+    @profiled('TimerScreen.switch_puzzle', 'ui')
     def switch_puzzle(self, puzzle_name):
-        if self.running:
+        if self.timer_state.state == RUNNING:
             return
+        self.timer_state.cancel()
 
-        if puzzle_name not in self.solve_data:
-            self.solve_data[puzzle_name] = {'times': [], 'scrambles': []}
-
-        self.current_puzzle = puzzle_name
-        self.current_scramble = ""
-
-        store = App.get_running_app().store
-        try:
-            queues = store.get('scramble_queues')['value']
-            self.scramble_queue = queues.get(self.current_puzzle, [])
-        except KeyError:
-            self.scramble_queue = []
-
-        self._update_titles()
-
-        if not self.scramble_queue:
-            self.ids.scramble_label.text = "Generating Scrambles..."
-            # This will now show loading screen properly
-            self._fill_scramble_queue(50)
-        else:
-            self.generate_new_scramble()
+        App.get_running_app().engine.switch_puzzle(puzzle_name)
 
         self.update_stats_label()
         self.update_recent_times()
-        if self.manager.current == 'stats':
-            self.update_graph()
-
-        self._save_data()
         self.manager.current = 'timer'
 
-    def _update_titles(self):
-        self.manager.get_screen('stats').ids.stats_title.text = f"Statistics ({self.current_puzzle})"
-
     def _on_keyboard_down(self, keyboard, keycode, text, modifiers):
+        # Timestamp before anything else so the solve time excludes handler work
+        event_ns = now_ns()
         if self.manager.current != 'timer':
             return
         if keycode[1] == 'spacebar':
-            if self.running:
-                self.stop_timer()
-            elif not self.holding and not self.ready_to_start:
-                self.holding = True
-                self.ready_to_start = False
-                self.hold_start_time = time.time()
-                self.ids.status_label.text = "Holding..."
-                self.set_led_color(1, 0, 0)
-                self.hold_event = Clock.schedule_interval(self.check_hold, 0.01)
+            self.timer_state.press(event_ns)
         return True
 
     def _on_keyboard_up(self, keyboard, keycode):
+        event_ns = now_ns()
         if self.manager.current != 'timer':
             return
         if keycode[1] == 'spacebar':
-            if self.ready_to_start:
-                self.holding = False
-                self.ready_to_start = False
-                self.start_timer()
-            elif self.holding:
-                self.cancel_hold()
-
-    def check_hold(self, dt):
-        elapsed = time.time() - self.hold_start_time
-        if (0.5 - elapsed) <= 0:
-            Clock.unschedule(self.hold_event)
-            self.hold_event = None
-            self.ready_to_start = True
+            self.timer_state.release(event_ns)
+
+    def _on_timer_state(self, state):
+        """
+        Mirrors timer state changes (and inspection countdown ticks) on screen.
+        """
+        engine = App.get_running_app().engine
+        if state in (IDLE, STOPPED):
+            engine.resume_generation()
+        else:
+            # Keep idle scramble generation off the CPU around a solve
+            engine.pause_generation()
+
+        if state == IDLE:
+            self.ids.time_label.text = "Ready"
+            self.ids.status_label.text = self._idle_status_text()
+            self.set_led_color(0.5, 0.5, 0.5)
+        elif state == INSPECTION:
+            self.ids.time_label.text = self.timer_state.inspection_display()
+            self.ids.status_label.text = "Inspecting"
+            self.set_led_color(1, 0.5, 0)
+        elif state == HOLDING:
+            if self.timer_state.inspection_start_ns is not None:
+                self.ids.time_label.text = self.timer_state.inspection_display()
+            self.ids.status_label.text = "Holding..."
+            self.set_led_color(1, 0, 0)
+        elif state == READY:
             self.ids.time_label.text = "READY"
             self.ids.status_label.text = "Release to Start"
             self.set_led_color(1, 1, 0)
+        elif state == RUNNING:
+            self.start_timer()
 
-    def cancel_hold(self):
-        if self.hold_event:
-            Clock.unschedule(self.hold_event)
-            self.hold_event = None
-        self.holding = False
-        self.ready_to_start = False
-        self.ids.time_label.text = "Ready"
-        self.ids.status_label.text = "Hold Spacebar"
-        self.set_led_color(0.5, 0.5, 0.5)
+    def _idle_status_text(self):
+        return "Space for Inspection" if self.timer_state.inspection else "Hold Spacebar"
 
     def set_led_color(self, r, g, b):
         if self.led_color_instruction:
             self.led_color_instruction.rgba = (r, g, b, 1)
 
-    def generate_new_scramble(self):
-        if not self.scramble_queue:
-            self._fill_scramble_queue(10)
+    def _on_scramble_changed(self, scramble):
+        self._pending_scramble = scramble
+        self._pending_ui.add('scramble')
+        self._ui_update_trigger()
 
-        self.current_scramble = self.scramble_queue.pop()
-        self.ids.scramble_label.text = self.current_scramble
+    def _on_solves_changed(self, puzzle):
+        self._pending_ui.update(('stats', 'recent'))
+        self._ui_update_trigger()
 
-        if len(self.scramble_queue) < 10:
-            # This will now show loading screen properly
-            self._fill_scramble_queue(50)
+    def _on_session_changed(self, puzzle, session):
+        self._on_solves_changed(puzzle)
+        self.ids.delete_btn.disabled = True
 
-    def start_timer(self):
-        self.running = True
-        self.start_time = time.time()
-        self.ids.status_label.text = "Running"
-        self.set_led_color(0, 1, 0)
-        self.timer_event = Clock.schedule_interval(self.update_timer, 0.016)
+    def _flush_ui_updates(self, dt):
+        pending = self._pending_ui
+        self._pending_ui = set()
+        if 'stats' in pending:
+            self.update_stats_label()
+        if 'recent' in pending:
+            self.update_recent_times()
+        if 'scramble' in pending:
+            self._show_scramble(self._pending_scramble)
 
-    def stop_timer(self):
-        self.running = False
-        Clock.unschedule(self.timer_event)
+    def _show_scramble(self, scramble):
+        self._update_cube_net(scramble)
+        if scramble is None:
+            # The engine retries once the first batch for this puzzle lands
+            self.ids.scramble_label.text = "Generating Scrambles..."
+            return
 
-        final_time = time.time() - self.start_time
+        self.ids.scramble_label.text = scramble
+        self.hide_loading()
+        self._warm_cube_state_trigger()
+
+        report = startup.finish('first scramble')
+        if report:
+            for line in report.splitlines():
+                Logger.info(f"Startup: {line}")
+
+    def _cube_state(self, scramble):
+        """(n, sticker state) for the current puzzle, or None if it can't be simulated."""
+        n = cube_size(App.get_running_app().engine.current_puzzle)
+        if n is None or not scramble:
+            return None
+        try:
+            return n, scramble_state(n, scramble)
+        except ValueError:
+            # Notation the simulator doesn't know (e.g. a trainer's algorithm format)
+            return None
+
+    def _update_cube_net(self, scramble):
+        net = self.ids.cube_net
+        cube = self._cube_state(scramble)
+        if cube is None:
+            net.opacity = 0
+            net.clear()
+            return
+        net.opacity = 1
+        net.show(*cube)
 
-        self.solve_data[self.current_puzzle]['times'].append(final_time)
-        self.solve_data[self.current_puzzle]['scrambles'].append(self.current_scramble)
+    def _warm_cube_state(self, dt):
+        if self.timer_state.state in (IDLE, STOPPED):
+            self._cube_state(App.get_running_app().engine.upcoming_scramble())
 
-        times = self.solve_data[self.current_puzzle]['times']
-        if len(times) > 50:
-            self.solve_data[self.current_puzzle]['times'] = times[-50:]
-            self.solve_data[self.current_puzzle]['scrambles'] = self.solve_data[self.current_puzzle]['scrambles'][-50:]
+    def start_timer(self):
+        self.ids.status_label.text = "Running"
+        self.set_led_color(0, 1, 0)
+        # Interval 0 runs once per frame, so the display follows the frame rate
+        self._shown_centis = -1
+        self.timer_event = Clock.schedule_interval(self.update_timer, 0)
 
-        formatted_time = self.format_time(final_time)
-        self.ids.time_label.text = formatted_time
+    def _on_solve(self, final_time, penalty):
+        """
+        Called by the state machine with the solve time in integer milliseconds,
+        measured between the key event timestamps.
+        """
+        if self.timer_event:
+            Clock.unschedule(self.timer_event)
+            self.timer_event = None
 
+        self.ids.time_label.text = format_solve(final_time, penalty)
         self.ids.status_label.text = "Solve Finished"
         self.set_led_color(0, 1, 0)
         self.ids.delete_btn.disabled = False
 
-        self.update_stats_label()
-        self.update_recent_times()
-        self.generate_new_scramble()
-
-        if self.manager.current == 'stats':
-            self.update_graph()
-
-        self._save_data()
+        App.get_running_app().engine.record_solve(final_time, penalty)
 
     def delete_last_solve(self):
-        data = self.solve_data[self.current_puzzle]
-        if data['times']:
-            data['times'].pop()
-            data['scrambles'].pop()
-
-            if data['times']:
-                latest_time = data['times'][-1]
-                self.ids.time_label.text = self.format_time(latest_time)
-            else:
-                self.ids.time_label.text = "Ready"
-
-            self.update_stats_label()
-            self.update_recent_times()
-
-            if self.manager.current == 'stats':
-                self.update_graph()
-
+        engine = App.get_running_app().engine
+        if engine.delete_last():
+            last = engine.last_solve()
+            self.ids.time_label.text = format_solve(*last) if last else "Ready"
             self.ids.delete_btn.disabled = True
-            self._save_data()
 
     def reset_all_stats(self):
-        for puz in PUZZLE_CONFIG.keys():
-            self.solve_data[puz] = {'times': [], 'scrambles': []}
-        for puz in TRAINER_CONFIG.keys():
-            self.solve_data[puz] = {'times': [], 'scrambles': []}
+        self.timer_state.cancel()
+        App.get_running_app().engine.reset()
 
-        self.ids.time_label.text = "Ready"
-        self.ids.status_label.text = "Hold Spacebar"
         self.ids.delete_btn.disabled = True
         self.set_led_color(0.5, 0.5, 0.5)
-        self.generate_new_scramble()
-        self.update_stats_label()
-        self.update_recent_times()
-        self.update_graph()
-        self._save_data()
         self.manager.current = 'timer'
 
+    @profiled('update_timer', 'ui')
     def update_timer(self, dt):
-        current_time = time.time() - self.start_time
-        self.ids.time_label.text = self.format_time(current_time)
-
-    def format_time(self, seconds):
-        mins = int(seconds // 60)
-        secs = int(seconds % 60)
-        centis = int((seconds * 100) % 100)
-        return f"{mins}:{secs:02}.{centis:02}"
-
+        centis = self.timer_state.clock.elapsed_ms() // 10
+        if centis != self._shown_centis:
+            self._shown_centis = centis
+            self.ids.time_label.text = format_ms(centis * 10)
+
+    # --- Timer Settings ---
+
+    def _update_timer_settings_labels(self):
+        settings_ids = self.manager.get_screen('settings').ids
+        settings_ids.hold_threshold_btn.text = f"Hold to Start: {self.timer_state.hold_ms / 1000:g} s"
+        settings_ids.inspection_btn.text = f"WCA Inspection: {'On' if self.timer_state.inspection else 'Off'}"
+        if self.timer_state.state == IDLE:
+            self.ids.status_label.text = self._idle_status_text()
+
+    def _save_timer_settings(self):
+        App.get_running_app().store.put('timer_settings', value={
+            'hold_ms': self.timer_state.hold_ms,
+            'inspection': self.timer_state.inspection,
+        })
+
+    def cycle_hold_threshold(self):
+        steps = HOLD_THRESHOLDS_MS
+        current = self.timer_state.hold_ms
+        self.timer_state.hold_ms = steps[(steps.index(current) + 1) % len(steps)] if current in steps else steps[0]
+        self._update_timer_settings_labels()
+        self._save_timer_settings()
+
+    def toggle_inspection(self):
+        self.timer_state.cancel()
+        self.timer_state.inspection = not self.timer_state.inspection
+        self._update_timer_settings_labels()
+        self._save_timer_settings()
+
+    @profiled('TimerScreen.update_stats_label', 'ui')
     def update_stats_label(self):
-        times = self.solve_data[self.current_puzzle]['times']
-        count = len(times)
+        stats = App.get_running_app().engine.stats
+        text = f"Solves: {stats.count}"
+        if stats.count:
+            text += f"\nAvg: {format_time(stats.mean)}\nBest: {format_time(stats.best)}"
+            for size in (5, 12):
+                ao = stats.average(size)
+                if ao is not None:
+                    text += f"\nAo{size}: {format_time(ao)}"
+        self.ids.quick_stats_label.text = text
+
+    @profiled('update_recent_times', 'ui')
+    def update_recent_times(self):
+        recent = App.get_running_app().engine.recent_solves(13)
+        self.ids.recent_times_label.text = "".join(f"{format_solve(t, penalty)}\n" for t, penalty in recent)
 
-        quick_text = f"Solves: {count}"
-        full_text = f"Solves: {count}"
 
-        if count == 0:
-            self.ids.quick_stats_label.text = quick_text
-            self.manager.get_screen('stats').ids.stats_label.text = full_text
-            return
+class StatsScreen(Screen):
+    """
+    Full statistics and the history graph. Only refreshed while shown: engine
+    changes made while the timer is up wait until the screen is entered.
+    """
 
-        avg = sum(times) / count
-        best = min(times)
-
-        quick_text += f"\nAvg: {self.format_time(avg)}\nBest: {self.format_time(best)}"
-        full_text += f"\nAvg: {self.format_time(avg)}\nBest: {self.format_time(best)}"
-
-        ao5_text = ""
-        if count >= 5:
-            last_five = times[-5:]
-            last_five.sort()
-            ao5 = sum(last_five[1:4]) / 3
-            ao5_text = f"\nAo5: {self.format_time(ao5)}"
-            quick_text += ao5_text
-            full_text += ao5_text
-
-        ao12_text = ""
-        if count >= 12:
-            last_twelve = times[-12:]
-            last_twelve.sort()
-            ao12 = sum(last_twelve[1:11]) / 10
-            ao12_text = f"\nAo12: {self.format_time(ao12)}"
-            quick_text += ao12_text
-            full_text += ao12_text
-
-        self.ids.quick_stats_label.text = quick_text
-        self.manager.get_screen('stats').ids.stats_label.text = full_text
+    def __init__(self, **kwargs):
+        super(StatsScreen, self).__init__(**kwargs)
 
-    def update_recent_times(self):
-        times = self.solve_data[self.current_puzzle]['times']
-        recent = times[-13:]
-        recent.reverse()
+        # Performance: Graph figure and textures are kept alive between renders.
+        # 'native' draws with Kivy instructions, matplotlib is then only used for exports
+        self.solve_graph = SolveGraph()
+        self.graph_renderer = 'native'
 
-        text = ""
-        for t in recent:
-            text += f"{self.format_time(t)}\n"
-        self.ids.recent_times_label.text = text
+        # Performance: Vectorized analytics (NumPy, optional) cached per puzzle by history version
+        # Only looked for on the first refresh, so building the screen never imports NumPy
+        self.analytics = None
+        self._analytics_checked = False
 
-    def update_graph(self):
-        times = self.solve_data[self.current_puzzle]['times']
-        plt.figure(figsize=(6, 4), dpi=100)
-        plt.style.use('bmh')
+        engine = App.get_running_app().engine
+        engine.subscribe(SOLVES_CHANGED, self._on_engine_changed)
+        engine.subscribe(PUZZLE_CHANGED, self._on_engine_changed)
+        engine.subscribe(SESSION_CHANGED, self._on_engine_changed)
 
-        x_data = range(1, len(times) + 1)
-        y_data = times
+        Clock.schedule_once(self._load_settings, 0)
 
-        plt.plot(x_data, y_data, marker='o', linestyle='-', color='cyan')
-        plt.title(f"{self.current_puzzle} Solve History", color='white')
-        plt.xlabel("Solve #", color='white')
-        plt.ylabel("Time (s)", color='white')
-        plt.tick_params(axis='x', colors='white')
-        plt.tick_params(axis='y', colors='white')
+    def _load_settings(self, dt):
+        store = App.get_running_app().store
+        if store.exists('graph_renderer'):
+            self.graph_renderer = store.get('graph_renderer')['value']
+        self._apply_graph_renderer()
 
-        plt.gcf().set_facecolor('#111111')
-        plt.gca().set_facecolor('#111111')
-        plt.tight_layout()
+    def on_pre_enter(self, *args):
+        self.refresh()
 
-        canvas = FigureCanvasAgg(plt.gcf())
-        canvas.draw()
-        buf = io.BytesIO()
-        canvas.print_png(buf)
-        buf.seek(0)
+    def _on_engine_changed(self, puzzle, *args):
+        if self.manager and self.manager.current == 'stats':
+            self.refresh()
 
-        img_texture = CoreImage(io.BytesIO(buf.read()), ext='png').texture
-        buf.close()
-        plt.close()
+    @profiled('StatsScreen.refresh', 'ui')
+    def refresh(self):
+        self._update_title()
+        self.update_stats_label()
+        self.update_graph()
 
-        self.manager.get_screen('stats').ids.graph_image.texture = img_texture
+    def _update_title(self):
+        self.ids.stats_title.text = f"Statistics ({App.get_running_app().engine.history_name})"
 
+    @profiled('StatsScreen.update_stats_label', 'ui')
+    def update_stats_label(self):
+        stats = App.get_running_app().engine.stats
+        text = f"Solves: {stats.count}"
+        if stats.count:
+            text += f"\nAvg: {format_time(stats.mean)}\nBest: {format_time(stats.best)}"
+            text += f"\nWorst: {format_time(stats.worst)}"
+            if stats.stdev is not None:
+                text += f"\nStd Dev: {stats.stdev / 1000:.2f}"
+            for size in AVERAGE_SIZES:
+                ao = stats.average(size)
+                if ao is not None:
+                    text += f"\nAo{size}: {format_time(ao)}"
+            analytics = self._get_analytics()
+            if analytics is not None:
+                text += f"\nDNFs: {analytics.dnfs}"
+                for percentile in PERCENTILES:
+                    name = "Median" if percentile == 50 else f"P{percentile}"
+                    text += f"\n{name}: {format_time(analytics.percentiles.get(percentile))}"
+                for size in ROLLING_SIZES:
+                    best = analytics.best_rolling[size]
+                    if best is not None:
+                        text += f"\nBest Ao{size}: {format_time(best)}"
+        self.ids.stats_label.text = text
+        self._update_distribution(stats.count)
+
+    def _update_distribution(self, count):
+        """Histogram and the latest days, only with NumPy (see solve_analytics)."""
+        analytics = self._get_analytics() if count else None
+        if analytics is None:
+            self.ids.histogram.set_histogram((), ())
+            self.ids.days_label.text = "" if count else "No solves"
+            return
+        self.ids.histogram.set_histogram(*analytics.histogram)
+        lines = ["Per day"]
+        for date, solves, mean, best in reversed(analytics.days[-DAYS_SHOWN:]):
+            lines.append(f"{date}  {solves}  Avg {format_time(mean)}  Best {format_time(best)}")
+        self.ids.days_label.text = "\n".join(lines)
+
+    def _get_analytics(self):
+        if not self._analytics_checked:
+            self._analytics_checked = True
+            self.analytics = SolveAnalytics() if numpy_available() else None
+        if self.analytics is None:
+            return None
+        engine = App.get_running_app().engine
+        return self.analytics.get(engine.history_name, engine.series)
+
+    @profiled('update_graph', 'ui')
+    def update_graph(self):
+        engine = App.get_running_app().engine
+        if self.graph_renderer == 'native':
+            analytics = self._get_analytics()
+            rolling = None
+            if analytics is not None:
+                rolling = {size: analytics.rolling_array(size) for size in ROLLING_SIZES}
+            self.ids.graph_canvas.set_history(engine.history_name, engine.series, rolling)
+        else:
+            self.ids.graph_image.texture = self.solve_graph.render(engine.history_name, engine.series)
+
+    def _apply_graph_renderer(self):
+        native = self.graph_renderer == 'native'
+        self.ids.graph_canvas.opacity = 1 if native else 0
+        self.ids.graph_image.opacity = 0 if native else 1
+        self.manager.get_screen('settings').ids.graph_renderer_btn.text = \
+            "Graph: Native" if native else "Graph: Matplotlib"
+
+    def toggle_graph_renderer(self):
+        self.graph_renderer = 'matplotlib' if self.graph_renderer == 'native' else 'native'
+        App.get_running_app().store.put('graph_renderer', value=self.graph_renderer)
+        self._apply_graph_renderer()
+        self.update_graph()
 
-class StatsScreen(Screen):
-    def on_enter(self, *args):
-        timer_screen = self.manager.get_screen('timer')
-        timer_screen.update_graph()
+    def export_graph(self):
+        engine = App.get_running_app().engine
+        safe_name = "".join(c if c.isalnum() else "_" for c in engine.history_name)
+        path = self.solve_graph.export(engine.history_name, engine.series, f"{safe_name}_history.png")
+        self.ids.stats_title.text = f"Saved {path}"
+        Clock.schedule_once(lambda dt: self._update_title(), 2.0)
 
 
 class SettingsScreen(Screen):
-    pass
+    def __init__(self, **kwargs):
+        super(SettingsScreen, self).__init__(**kwargs)
+        # Created on first use, profiling is off unless turned on here
+        self.profiler_overlay = None
+
+    def toggle_profiler(self):
+        if self.profiler_overlay is None:
+            self.profiler_overlay = ProfilerOverlay()
+        if profiler.enabled:
+            self.profiler_overlay.stop()
+        else:
+            profiler.clear()
+            self.profiler_overlay.start()
+        self.ids.profiler_btn.text = f"Profiler: {'On' if profiler.enabled else 'Off'}"
+
+    def save_trace(self):
+        path = profiler.dump(time.strftime("trace_%Y%m%d_%H%M%S.json"))
+        self.ids.trace_btn.text = f"Saved {path}"
+        Clock.schedule_once(lambda dt: setattr(self.ids.trace_btn, 'text', "Save Trace"), 2.0)
 
 
 class PuzzleSelectorScreen(Screen):
     pass
 
 
+class SessionSelectorScreen(Screen):
+    """
+    The current puzzle's sessions with their summaries. Listing never loads
+    a session; only the one picked is loaded.
+    """
+
+    def on_pre_enter(self, *args):
+        self.refresh()
+
+    def refresh(self):
+        engine = App.get_running_app().engine
+        self.ids.sessions_title.text = f"Sessions ({engine.current_puzzle})"
+        session_list = self.ids.session_list
+        session_list.clear_widgets()
+        for session, summary in engine.list_sessions():
+            session_list.add_widget(self._session_row(session, summary, session == engine.current_session))
+
+    def _session_row(self, session, summary, current):
+        if summary is None:
+            details = "No solves"
+        else:
+            details = f"{summary.count} solves   Avg {format_time(summary.mean)}   Best {format_time(summary.best)}"
+        row = BoxLayout(orientation='horizontal', size_hint_y=None, height=60, spacing=10)
+        select_btn = Button(
+            text=f"{session_name(session)}\n{details}", font_size=18, halign='center',
+            background_color=(0.2, 0.6, 0.2, 1) if current else (0.2, 0.2, 0.2, 1), color=(1, 1, 1, 1)
+        )
+        select_btn.bind(on_release=lambda btn: self.select_session(session))
+        delete_btn = Button(
+            text="Clear" if not session else "Delete", font_size=16, size_hint_x=0.25,
+            background_color=(1, 0.3, 0.3, 1), color=(1, 1, 1, 1)
+        )
+        delete_btn.bind(on_release=lambda btn: self.delete_session(session))
+        row.add_widget(select_btn)
+        row.add_widget(delete_btn)
+        return row
+
+    def select_session(self, session):
+        App.get_running_app().engine.switch_session(session)
+        self.manager.transition.direction = 'left'
+        self.manager.current = 'timer'
+
+    def new_session(self):
+        App.get_running_app().engine.new_session()
+        self.refresh()
+
+    def delete_session(self, session):
+        App.get_running_app().engine.delete_session(session)
+        self.refresh()
+
+
 class TrainerSelectorScreen(Screen):
     pass
+
+
+class CaseSelectorScreen(Screen):
+    """
+    The current trainer mode's cases with their times. Tapping a case picks
+    it for the drill and shows it on the net. Rows are built when the screen
+    is entered; later changes only relabel or recolor them.
+    """
+
+    def __init__(self, **kwargs):
+        super(CaseSelectorScreen, self).__init__(**kwargs)
+        self._picked = set()
+        self._rows = {}  # case id -> Button
+        # Performance: Discovery batches land every few frames, relabel at most twice a second
+        self._refresh_trigger = Clock.create_trigger(self._refresh_rows, 0.5)
+        App.get_running_app().engine.subscribe(CASES_CHANGED, self._on_cases_changed)
+
+    def on_pre_enter(self, *args):
+        trainer = App.get_running_app().engine.case_trainer()
+        self._picked = set(trainer.selected) if trainer is not None else set()
+        self._rows = {}
+        self.ids.case_list.clear_widgets()
+        self.ids.case_net.clear()
+        self._refresh_rows()
+
+    def _on_cases_changed(self, puzzle):
+        if self.manager and self.manager.current == 'case_selector':
+            self._refresh_trigger()
+
+    @profiled('CaseSelectorScreen.refresh', 'ui')
+    def _refresh_rows(self, *args):
+        engine = App.get_running_app().engine
+        trainer = engine.case_trainer()
+        if trainer is None:
+            self.ids.cases_title.text = "Cases"
+            self.ids.cases_status.text = "Pick a ZBLL, ZZLL, CMLL, CLL or ELL trainer mode first"
+            return
+
+        self.ids.cases_title.text = f"Cases ({engine.current_puzzle})"
+        if trainer.failed:
+            status = "The scrambler for this mode is not available"
+        else:
+            status = f"{len(trainer.cases)} cases in {trainer.checked} scrambles"
+        self.ids.cases_status.text = f"{status}   {len(self._picked)} picked"
+
+        case_list = self.ids.case_list
+        for record in trainer.ordered:
+            row = self._rows.get(record.key)
+            if row is None:
+                row = Button(font_size=18, size_hint_y=None, height=50, color=(1, 1, 1, 1))
+                row.bind(on_release=lambda btn, key=record.key: self.toggle_case(key))
+                self._rows[record.key] = row
+                case_list.add_widget(row)
+            summary = record.summary()
+            details = "No solves" if not summary.count else \
+                f"{summary.count} solves   Avg {format_time(summary.mean)}   Best {format_time(summary.best)}"
+            row.text = f"{record.name}   {details}"
+            row.background_color = (0.2, 0.6, 0.2, 1) if record.key in self._picked else (0.2, 0.2, 0.2, 1)
+
+    def toggle_case(self, key):
+        trainer = App.get_running_app().engine.case_trainer()
+        if key in self._picked:
+            self._picked.discard(key)
+        else:
+            self._picked.add(key)
+        record = trainer.case_of(key)
+        if record.example:
+            try:
+                self.ids.case_net.show(trainer.n, scramble_state(trainer.n, record.example))
+            except ValueError:
+                self.ids.case_net.clear()
+        self._refresh_rows()
+
+    def find_cases(self):
+        App.get_running_app().engine.find_cases(CASE_SEARCH_SIZE)
+        self._refresh_rows()
+
+    def clear_picked(self):
+        self._picked = set()
+        self._refresh_rows()
+
+    def drill(self):
+        App.get_running_app().engine.drill_cases(self._picked)
+        self.manager.transition.direction = 'left'
+        self.manager.current = 'timer'
@@ -0,0 +1,265 @@
+"""
+Headless benchmarks for the timer's hot paths, no Kivy window needed.
+
+    python benchmark.py                          # all groups, JSON on stdout
+    python benchmark.py stats persistence        # selected groups
+    python benchmark.py -o bench_output.txt      # JSON to a file
+
+Each result records rounds, min/max/mean/median/stddev in seconds and ops
+per second, in the same shape as pytest-benchmark's JSON, so runs from
+different releases can be diffed. A benchmark whose dependency is missing
+(scrambler package, matplotlib, Kivy) is reported with an "error" instead.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+
+from puzzle_config import PUZZLE_CONFIG, TRAINER_CONFIG
+from scramble_service import generate_batch
+from solve_history import SolveHistory, PENALTY_NONE, PENALTY_PLUS_TWO, PENALTY_DNF
+from session_stats import SessionStats, AVERAGE_SIZES
+from solve_log import SolveLog
+from solve_db import SolveDatabase
+from solve_graph import SolveGraph
+from solve_analytics import HistoryAnalytics
+from cube_state import apply_moves, solved_state, MIN_SIZE, MAX_SIZE
+
+STATS_SIZES = (50, 1000, 100000)
+PERSISTENCE_SIZES = (1000, 100000)
+GRAPH_SIZES = (50, 1000, 100000)
+WCA_SCRAMBLE_LENGTHS = {2: 11, 3: 20, 4: 40, 5: 60, 6: 80, 7: 100}
+
+
+def measure(func, min_time=0.2, max_rounds=1000, min_rounds=3):
+    """Calls func repeatedly for about min_time seconds and returns the timing summary."""
+    samples = []
+    deadline = time.perf_counter() + min_time
+    while len(samples) < max_rounds and (len(samples) < min_rounds or time.perf_counter() < deadline):
+        start = time.perf_counter_ns()
+        func()
+        samples.append((time.perf_counter_ns() - start) / 1e9)
+    mean = statistics.fmean(samples)
+    return {
+        'rounds': len(samples),
+        'min': min(samples),
+        'max': max(samples),
+        'mean': mean,
+        'median': statistics.median(samples),
+        'stddev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'ops': 1 / mean if mean else None,
+    }
+
+
+def result(group, name, params, func, **kwargs):
+    entry = {'group': group, 'name': name, 'params': params}
+    try:
+        entry['stats'] = measure(func, **kwargs)
+    except Exception as e:
+        entry['error'] = f"{type(e).__name__}: {e}"
+    return entry
+
+
+def synthetic_history(count, seed=0):
+    """A 3x3x3-like history: ~15 s solves, a few +2s and DNFs."""
+    rng = random.Random(seed)
+    history = SolveHistory()
+    timestamp = 1.7e9
+    for i in range(count):
+        roll = rng.random()
+        penalty = PENALTY_DNF if roll < 0.01 else PENALTY_PLUS_TWO if roll < 0.03 else PENALTY_NONE
+        timestamp += rng.uniform(20, 60)
+        history.append(max(1000, int(rng.gauss(15000, 2500))), timestamp, penalty, i,
+                       f"R U R' U' F2 D {i}")
+    return history
+
+
+# --- Groups ---
+
+def bench_scramble():
+    """Per-scramble generation cost for every puzzle and trainer mode, in-process."""
+    results = []
+    for puzzle, config in {**PUZZLE_CONFIG, **TRAINER_CONFIG}.items():
+        results.append(result(
+            'scramble', 'generate', {'puzzle': puzzle},
+            lambda: generate_batch(config['module'], config['func'], config['args'], 1),
+            min_time=0.5, max_rounds=50
+        ))
+
+    # Cube preview: applying a WCA-length scramble, without the per-scramble memoization
+    rng = random.Random(0)
+    for n in range(MIN_SIZE, MAX_SIZE + 1):
+        moves = []
+        for _ in range(WCA_SCRAMBLE_LENGTHS[n]):
+            depth = rng.randint(1, max(1, n // 2))
+            layers = f"{depth}" if depth > 2 else ""
+            wide = "w" if depth > 1 else ""
+            moves.append(layers + rng.choice("URFDLB") + wide + rng.choice(("", "'", "2")))
+        scramble = " ".join(moves)
+        results.append(result('scramble', 'simulate', {'size': n},
+                              lambda n=n, scramble=scramble: apply_moves(n, solved_state(n), scramble)))
+    return results
+
+
+def summarize(stats):
+    # What update_stats_label reads after every solve
+    return (stats.count, stats.mean, stats.best, stats.worst, stats.stdev,
+            [stats.average(size) for size in AVERAGE_SIZES])
+
+
+def bench_stats():
+    results = []
+    for size in STATS_SIZES:
+        times = synthetic_history(size).effective_times()
+        stats = SessionStats(times)
+
+        def push_pop():
+            stats.push(15000)
+            summarize(stats)
+            stats.pop()
+
+        results.append(result('stats', 'load', {'solves': size}, lambda: SessionStats(times)))
+        results.append(result('stats', 'push_summarize_pop', {'solves': size}, push_pop))
+        results.append(result('stats', 'summarize', {'solves': size}, lambda: summarize(stats)))
+        history = synthetic_history(size)
+        results.append(result('stats', 'analytics', {'solves': size}, lambda: HistoryAnalytics(history),
+                              max_rounds=50))
+
+        # What the Statistics screen pays after a new solve
+        analytics = HistoryAnalytics(history)
+
+        def append_update():
+            history.append(15000, history.timestamps[-1] + 40, PENALTY_NONE, len(history), "R U R' U'")
+            analytics.update(history)
+
+        results.append(result('stats', 'analytics_append', {'solves': size}, append_update, max_rounds=50))
+    return results
+
+
+def bench_persistence():
+    results = []
+    for size in PERSISTENCE_SIZES:
+        history = synthetic_history(size)
+        with tempfile.TemporaryDirectory() as directory:
+            base = os.path.join(directory, 'solves')
+            solve_log = SolveLog(base)
+            solve_log.load()
+            solve_log.import_data({'3x3x3': {'times': [t / 1000 for t in history.times],
+                                             'scrambles': history.scrambles}}, '3x3x3')
+            results.append(result('persistence', 'log_add_solve', {'solves': size},
+                                  lambda: solve_log.add_solve('3x3x3', 15000, "R U R' U'")))
+            solve_log.close()
+
+            def log_load():
+                reopened = SolveLog(base)
+                reopened.load()
+                reopened.close()
+
+            results.append(result('persistence', 'log_load', {'solves': size}, log_load, max_rounds=20))
+
+            database = SolveDatabase(os.path.join(directory, 'solves.db'))
+            database.load()
+            database.import_histories({('3x3x3', ''): history}, '3x3x3')
+            # Selected up front so the timed adds also keep a loaded history and series in step
+            database.history('3x3x3')
+            database.series('3x3x3')
+            results.append(result('persistence', 'db_add_solve', {'solves': size},
+                                  lambda: database.add_solve('3x3x3', 15000, "R U R' U'")))
+            database.close()
+
+            def db_load():
+                # What the timer screen needs at startup, no history is selected
+                reopened = SolveDatabase(os.path.join(directory, 'solves.db'))
+                reopened.load()
+                reopened.stats('3x3x3')
+                reopened.recent('3x3x3', '', 13)
+                reopened.close()
+
+            def db_series():
+                # What opening the graph adds
+                reopened = SolveDatabase(os.path.join(directory, 'solves.db'))
+                reopened.load()
+                reopened.series('3x3x3')
+                reopened.close()
+
+            results.append(result('persistence', 'db_load', {'solves': size}, db_load, max_rounds=20))
+            results.append(result('persistence', 'db_series', {'solves': size}, db_series, max_rounds=20))
+    return results
+
+
+def bench_graph():
+    results = []
+    graph = SolveGraph()
+    for size in GRAPH_SIZES:
+        history = synthetic_history(size)
+        results.append(result('graph', 'matplotlib_draw', {'solves': size},
+                              lambda: graph.draw('3x3x3', history), max_rounds=20))
+
+    try:
+        from native_graph import RollingSeries, column_envelope, OVERLAYS
+    except ImportError as e:
+        return results + [{'group': 'graph', 'name': 'native_prepare', 'params': {},
+                           'error': f"{type(e).__name__}: {e}"}]
+
+    for size in GRAPH_SIZES:
+        times = synthetic_history(size).effective_times()
+
+        def native_prepare():
+            # The CPU side of SolveGraphWidget.set_history + _redraw at 800 px wide
+            for overlay_size, _ in OVERLAYS:
+                series = RollingSeries(overlay_size)
+                series.extend(times)
+                column_envelope(series.values, min(800, size))
+            column_envelope(times, 800)
+
+        results.append(result('graph', 'native_prepare', {'solves': size}, native_prepare, max_rounds=20))
+    return results
+
+
+GROUPS = {
+    'scramble': bench_scramble,
+    'stats': bench_stats,
+    'persistence': bench_persistence,
+    'graph': bench_graph,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless R-Cube-Timer benchmarks")
+    parser.add_argument('groups', nargs='*', help=f"groups to run: {', '.join(GROUPS)} (default: all)")
+    parser.add_argument('-o', '--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    unknown = [group for group in args.groups if group not in GROUPS]
+    if unknown:
+        parser.error(f"unknown group(s): {', '.join(unknown)}")
+
+    benchmarks = []
+    for group in args.groups or GROUPS:
+        print(f"Running {group}...", file=sys.stderr)
+        benchmarks += GROUPS[group]()
+
+    report = {
+        'machine_info': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'datetime': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'benchmarks': benchmarks,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
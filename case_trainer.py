@@ -0,0 +1,488 @@
+"""
+Case drilling for last-layer trainer modes (ZBLL, CMLL, ...).
+
+The scramblers only produce random-state scrambles of a whole set, so cases
+are found by generating and filtering: worker processes generate batches,
+simulate each scramble (cube_state) and classify it by the stickers that
+decide its case, up to the U turns before and after the algorithm (AUF).
+Every case keeps a small bank of ready scrambles; the UI thread only picks
+from the banks.
+"""
+import os
+import json
+import random
+import hashlib
+from collections import deque
+from functools import lru_cache
+from operator import itemgetter
+
+from cube_state import FACES, apply_moves, move_table, solved_state
+from persistence import atomic_write, puzzle_path
+from scramble_service import generate_batch
+from profiler import profiled, profiler
+from session_stats import DNF, SessionSummary
+
+CASE_SUFFIX = '.json'
+
+# U turns as written in a scramble, by quarter turns
+_AUF_MOVES = ('', 'U', 'U2', "U'")
+_AUF_TURNS = {'U': 1, 'U2': 2, "U2'": 2, "U'": 3}
+
+# Latest recorded solves per session a delete can take back (see CaseTrainer.undo)
+_UNDO_DEPTH = 50
+
+
+# --- Classification (runs in the worker processes) ---
+
+@lru_cache(maxsize=None)
+def case_stickers(n, kind):
+    """
+    Sticker indices that decide a case: the whole top layer ('last_layer'),
+    or only its corner or edge stickers ('corners', 'edges').
+    """
+    def wanted(corner, edge):
+        return kind == 'last_layer' or (kind == 'corners' and corner) or (kind == 'edges' and edge)
+
+    outer = (0, n - 1)
+    stickers = []
+    top = FACES.index('U') * n * n
+    for row in range(n):
+        for col in range(n):
+            if wanted(row in outer and col in outer, (row in outer) != (col in outer)):
+                stickers.append(top + row * n + col)
+    for face in 'RFLB':
+        # Row 0 of an upright side face is its top-layer row
+        start = FACES.index(face) * n * n
+        for col in range(n):
+            if wanted(col in outer, col not in outer):
+                stickers.append(start + col)
+    return tuple(stickers)
+
+
+def case_key(n, kind, scramble):
+    """
+    Short id of the scramble's case. The case stickers are read for every
+    U turn before and after the scramble and the smallest reading wins, so
+    every AUF of a case gets the same id.
+    """
+    look = itemgetter(*case_stickers(n, kind))
+    quarter = itemgetter(*move_table(n, 'U', 0, 0, 1))
+    best = None
+    for before in _AUF_MOVES:
+        state = apply_moves(n, solved_state(n), f"{before} {scramble}")
+        for _ in range(4):
+            reading = bytes(look(state))
+            if best is None or reading < best:
+                best = reading
+            state = bytes(quarter(state))
+    return hashlib.blake2b(best, digest_size=8).hexdigest()
+
+
+def state_digest(n, scramble):
+    """Digest of the whole cube state, equal for scrambles that reach the same position."""
+    return hashlib.blake2b(apply_moves(n, solved_state(n), scramble), digest_size=8).hexdigest()
+
+
+def generate_cases(module_name, func_name, args, count, n, kind):
+    """Runs inside a worker process: `count` scrambles as (case, state digest, scramble)."""
+    classified = []
+    for scramble in generate_batch(module_name, func_name, args, count):
+        try:
+            classified.append((case_key(n, kind, scramble), state_digest(n, scramble), scramble))
+        except ValueError:
+            # Notation the simulator doesn't know, can't be told apart
+            continue
+    return classified
+
+
+def with_auf(before, scramble, after):
+    """The scramble with U turns added at either end, merged into the U turns already there."""
+    moves = scramble.split()
+
+    def merge(turns, move):
+        turns = (turns + _AUF_TURNS.get(move, 0)) % 4
+        return [_AUF_MOVES[turns]] if turns else []
+
+    if before:
+        first = moves.pop(0) if moves and moves[0] in _AUF_TURNS else None
+        moves = merge(_AUF_TURNS[before], first) + moves
+    if after:
+        last = moves.pop() if moves and moves[-1] in _AUF_TURNS else None
+        moves = moves + merge(_AUF_TURNS[after], last)
+    return ' '.join(moves)
+
+
+# --- Storage ---
+
+class CaseStore:
+    """
+    One small JSON file per trainer mode: its cases in the order they were
+    found, their solve times and ready scrambles, and the drilled selection.
+    Files are replaced atomically (persistence.atomic_write).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, puzzle):
+        return puzzle_path(self.directory, puzzle, CASE_SUFFIX)
+
+    @profiled('CaseStore.load', 'store')
+    def load(self, puzzle):
+        """The saved dict, or None if there is none or it is damaged."""
+        try:
+            with open(self._path(puzzle), 'rb') as f:
+                data = json.loads(f.read().decode('utf-8'))
+        except (OSError, ValueError):
+            return None
+        return data if isinstance(data, dict) else None
+
+    @profiled('CaseStore.save', 'store')
+    def save(self, puzzle, data):
+        os.makedirs(self.directory, exist_ok=True)
+        atomic_write(self._path(puzzle), json.dumps(data, separators=(',', ':')).encode('utf-8'))
+
+
+# --- Cases ---
+
+class CaseRecord:
+    """
+    One case: its solve times (effective ms, DNF as infinity) and the session
+    each was solved in, with a running count, sum and best so its summary is
+    O(1), an example scramble, and the bank of ready (state digest,
+    scramble) pairs.
+    """
+
+    __slots__ = ('key', 'number', 'example', 'times', 'sessions', 'ready', 'served', '_sum', '_finite', '_best')
+
+    def __init__(self, key, number, example=None):
+        self.key = key
+        self.number = number
+        self.example = example
+        self.times = []
+        self.sessions = []
+        self.ready = deque()
+        self.served = 0  # scrambles handed out since the selection changed
+        self._sum = 0.0
+        self._finite = 0
+        self._best = None
+
+    @property
+    def name(self):
+        return f"Case {self.number}"
+
+    def add_time(self, ms, session=''):
+        self.times.append(ms)
+        self.sessions.append(session)
+        if ms != DNF:
+            self._sum += ms
+            self._finite += 1
+            if self._best is None or ms < self._best:
+                self._best = ms
+
+    def pop_time(self, session=''):
+        """Removes the session's latest time."""
+        index = len(self.sessions) - 1 - self.sessions[::-1].index(session)
+        ms = self.times.pop(index)
+        del self.sessions[index]
+        if ms != DNF:
+            self._sum -= ms
+            self._finite -= 1
+            if ms == self._best:
+                finite = [t for t in self.times if t != DNF]
+                self._best = min(finite) if finite else None
+
+    def drop_times(self, session=None):
+        """Forgets the times of one session, or all of them."""
+        kept = [] if session is None else [
+            (ms, other) for ms, other in zip(self.times, self.sessions) if other != session
+        ]
+        self.times, self.sessions = [], []
+        self._sum, self._finite, self._best = 0.0, 0, None
+        for ms, other in kept:
+            self.add_time(ms, other)
+
+    def summary(self):
+        return SessionSummary(len(self.times), self._sum / self._finite if self._finite else None, self._best)
+
+
+class CaseTrainer:
+    """
+    Serves scrambles of a selected subset of one trainer mode's cases.
+
+    Batches are generated and classified on the ScrambleService's process
+    pool (see generate_cases) and handed back through its `schedule`, on
+    the UI thread; the trainer is only used from that thread. Each batch fills every case's bank, selected or not, up to
+    `bank_size`, so changing the selection is served from the banks at
+    once. Scrambles reaching a position already banked or served are
+    dropped.
+
+    next() balances the drill by always serving the selected case served
+    least so far. If none of the selected cases has a scramble banked it
+    never waits: it serves a fresh AUF variant of a case's example
+    scramble, which is the same case seen from another side. Batches run
+    while any selected case is below `low_watermark`, at most one per
+    free worker of the shared pool, plus whatever discover() asked for, and
+    not at all while paused (during a solve).
+
+    Solve times are kept per case and looked up by case id; record()
+    classifies any scramble, drilled or not.
+    """
+
+    def __init__(self, puzzle, n, kind, config, scramble_service, store=None, bank_size=6, low_watermark=2,
+                 batch_size=20):
+        self.puzzle = puzzle
+        self.n = n
+        self.kind = kind
+        self.config = config
+        self.scramble_service = scramble_service
+        self.store = store
+        self.bank_size = bank_size
+        self.low_watermark = low_watermark
+        self.batch_size = batch_size
+
+        self.cases = {}      # case id -> CaseRecord
+        self.ordered = []    # CaseRecords by number
+        self.selected = set()
+        self.checked = 0     # scrambles classified so far
+        self.duplicates = 0  # of which dropped as repeats
+        self.failed = False  # the scrambler could not run, see _on_batch
+        self.paused = False
+
+        self._seen = set()   # state digests banked or served
+        self._last = None    # (case id, scramble) last served by next()
+        self._recorded = {}  # session -> deque of its latest (case id, scramble) records
+        self._discover = 0   # scrambles still to generate for discover()
+        self._futures = {}   # batch future -> whether it was submitted for discover()
+        self._dirty = False
+        self._closed = False
+        self._listeners = []
+
+        if store is not None:
+            self._load(store.load(puzzle))
+        # Scramble batches finishing free workers this trainer may be waiting for
+        scramble_service.add_listener(lambda puzzle: self._pump())
+
+    def _load(self, data):
+        if not data:
+            return
+        self.checked = data.get('checked', 0)
+        for entry in data.get('cases', ()):
+            record = self._add_case(entry['key'], entry.get('example'))
+            times = entry.get('times', ())
+            for ms, session in zip(times, entry.get('sessions') or [''] * len(times)):
+                record.add_time(DNF if ms is None else ms, session)
+            for digest, scramble in entry.get('ready', ()):
+                record.ready.append((digest, scramble))
+                self._seen.add(digest)
+        self.selected = {key for key in data.get('selected', ()) if key in self.cases}
+
+    def take_dirty(self):
+        """A fresh dict to save if anything changed since the last call, else None."""
+        if not self._dirty:
+            return None
+        self._dirty = False
+        return {
+            'puzzle': self.puzzle,
+            'checked': self.checked,
+            'selected': sorted(self.selected),
+            'cases': [{
+                'key': record.key,
+                'example': record.example,
+                'times': [None if ms == DNF else ms for ms in record.times],
+                'sessions': list(record.sessions),
+                'ready': [list(pair) for pair in record.ready],
+            } for record in self.ordered],
+        }
+
+    def add_listener(self, callback):
+        """callback(puzzle) is called on the UI thread when cases are found or banks refilled."""
+        self._listeners.append(callback)
+
+    def _add_case(self, key, example):
+        record = CaseRecord(key, len(self.ordered) + 1, example)
+        self.cases[key] = record
+        self.ordered.append(record)
+        return record
+
+    # --- Drilling ---
+
+    @property
+    def drilling(self):
+        return bool(self.selected)
+
+    def select(self, keys):
+        """Drills these cases from now on (none: back to plain random scrambles)."""
+        self.selected = {key for key in keys if key in self.cases}
+        for record in self.ordered:
+            record.served = 0
+        self._dirty = True
+        self._pump()
+
+    def discover(self, count):
+        """Generates `count` more scrambles to find cases and fill the banks."""
+        self.failed = False
+        self._discover += count
+        self._pump()
+
+    def pause(self):
+        """Stops generating (e.g. during a solve) and withdraws batches that have not started yet."""
+        self.paused = True
+        for future in list(self._futures):
+            future.cancel()
+
+    def resume(self):
+        self.paused = False
+        self._pump()
+
+    @profiled('CaseTrainer.next', 'trainer')
+    def next(self):
+        """(case id, scramble) from the least served selected case, None if nothing is selected."""
+        if not self.selected:
+            return None
+        records = [self.cases[key] for key in self.selected]
+        ready = [record for record in records if record.ready]
+        if ready:
+            fewest = min(record.served for record in ready)
+            record = random.choice([record for record in ready if record.served == fewest])
+            scramble = record.ready.popleft()[1]
+        else:
+            fewest = min(record.served for record in records)
+            record = random.choice([record for record in records if record.served == fewest])
+            scramble = self._variant(record)
+        record.served += 1
+        profiler.count('scrambles.served')
+        self._last = (record.key, scramble)
+        self._dirty = True
+        self._pump()
+        return record.key, scramble
+
+    def _variant(self, record):
+        """An AUF variant of the case's example that has not been served yet, if any is left."""
+        pairs = [(before, after) for before in _AUF_MOVES for after in _AUF_MOVES]
+        random.shuffle(pairs)
+        for before, after in pairs:
+            scramble = with_auf(before, record.example, after)
+            digest = state_digest(self.n, scramble)
+            if digest not in self._seen:
+                self._seen.add(digest)
+                return scramble
+        # Every variant has been played, repeat one rather than wait
+        before, after = pairs[0]
+        return with_auf(before, record.example, after)
+
+    # --- Solve times ---
+
+    @profiled('CaseTrainer.record', 'trainer')
+    def record(self, scramble, ms, session=''):
+        """Adds an effective time to the scramble's case. Returns the CaseRecord, None if it has none."""
+        if not scramble:
+            return None
+        if self._last is not None and self._last[1] == scramble:
+            key = self._last[0]
+        else:
+            # Played from the plain queue (or not drilling), classify it here
+            try:
+                key = case_key(self.n, self.kind, scramble)
+            except ValueError:
+                return None
+        record = self.cases.get(key) or self._add_case(key, scramble)
+        record.add_time(ms, session)
+        recorded = self._recorded.get(session)
+        if recorded is None:
+            recorded = self._recorded[session] = deque(maxlen=_UNDO_DEPTH)
+        recorded.append((key, scramble))
+        self._dirty = True
+        return record
+
+    def undo(self, scramble, session=''):
+        """Takes back the session's latest record() if it was for this scramble (the solve being deleted)."""
+        recorded = self._recorded.get(session)
+        if recorded and recorded[-1][1] == scramble:
+            self.cases[recorded.pop()[0]].pop_time(session)
+            self._dirty = True
+
+    def drop_times(self, session=None):
+        """Forgets the case times of a deleted session, or of every session after a reset."""
+        for record in self.ordered:
+            if record.times:
+                record.drop_times(session)
+                self._dirty = True
+        if session is None:
+            self._recorded.clear()
+        else:
+            self._recorded.pop(session, None)
+
+    def case_of(self, key):
+        return self.cases.get(key)
+
+    # --- Generation ---
+
+    def _wants_batch(self):
+        if self.failed or self.paused:
+            return False
+        if self._discover > 0:
+            return True
+        return any(len(self.cases[key].ready) < self.low_watermark for key in self.selected)
+
+    def _pump(self):
+        # Back-pressure is the service's: its scramble batches and these share the workers
+        service = self.scramble_service
+        while not self._closed and service.free_workers() > 0 and self._wants_batch():
+            self._submit()
+
+    def _submit(self):
+        config = self.config
+        service = self.scramble_service
+        future = service.submit(
+            f"classify {self.puzzle}", self.batch_size,
+            generate_cases, config['module'], config['func'], config['args'], self.batch_size, self.n, self.kind
+        )
+        # Whether it counts towards discover(), to give back if it is withdrawn
+        discovering = self._discover > 0
+        if discovering:
+            self._discover -= self.batch_size
+        self._futures[future] = discovering
+        future.add_done_callback(lambda f: service.schedule(lambda: self._on_batch(f)))
+
+    @profiled('CaseTrainer.on_batch', 'trainer')
+    def _on_batch(self, future):
+        discovering = self._futures.pop(future)
+        if self._closed:
+            return
+        if future.cancelled():
+            if discovering:
+                self._discover += self.batch_size
+            return
+        try:
+            batch = future.result()
+        except Exception:
+            # e.g. the scrambler is not installed: stop until asked again
+            self.failed = True
+            self._discover = 0
+            batch = []
+
+        for key, digest, scramble in batch:
+            self.checked += 1
+            if digest in self._seen:
+                self.duplicates += 1
+                continue
+            record = self.cases.get(key)
+            if record is None:
+                record = self._add_case(key, scramble)
+            elif record.example is None:
+                record.example = scramble
+            if len(record.ready) < self.bank_size:
+                record.ready.append((digest, scramble))
+                self._seen.add(digest)
+        if batch:
+            profiler.count('scrambles.generated', len(batch))
+            self._dirty = True
+            for callback in self._listeners:
+                callback(self.puzzle)
+        self._pump()
+
+    def shutdown(self):
+        """Stops asking for batches; the ScrambleService shuts the pool down."""
+        self._closed = True
+        self._discover = 0
@@ -0,0 +1,82 @@
+from kivy.uix.widget import Widget
+from kivy.graphics import Color, Rectangle
+
+# Sticker colors in cube_state.FACES order: U R F D L B
+STICKER_COLORS = (
+    (1, 1, 1, 1),
+    (0.85, 0.1, 0.1, 1),
+    (0.1, 0.7, 0.2, 1),
+    (1, 0.85, 0, 1),
+    (1, 0.5, 0, 1),
+    (0.1, 0.3, 0.9, 1),
+)
+
+# (column, row) of each face in the 4 x 3 cross net, FACES order
+NET_CELLS = ((1, 0), (2, 1), (1, 1), (1, 2), (0, 1), (3, 1))
+
+
+class CubeNetWidget(Widget):
+    """
+    Unfolded NxNxN cube drawn from a cube_state sticker array.
+
+    One Color + Rectangle pair per sticker, built only when the cube size or
+    the widget size changes; showing another state just recolors them.
+    """
+
+    def __init__(self, **kwargs):
+        super(CubeNetWidget, self).__init__(**kwargs)
+        self.n = None
+        self.state = None
+        self._colors = []
+        self._layout = None
+        self.bind(pos=self._rebuild, size=self._rebuild)
+
+    def show(self, n, state):
+        if n != self.n:
+            self.n = n
+            self.state = state
+            self._rebuild()
+            return
+        self.state = state
+        self._recolor()
+
+    def clear(self):
+        self.n = None
+        self.state = None
+        self._layout = None
+        self._colors = []
+        self.canvas.clear()
+
+    def _rebuild(self, *args):
+        n = self.n
+        if n is None:
+            return
+        layout = (n, tuple(self.pos), tuple(self.size))
+        if layout == self._layout:
+            self._recolor()
+            return
+        self._layout = layout
+
+        self.canvas.clear()
+        self._colors = []
+        # Square stickers, the whole net centered in the widget
+        sticker = min(self.width / (4 * n), self.height / (3 * n))
+        gap = max(1.0, sticker * 0.08)
+        left = self.x + (self.width - 4 * n * sticker) / 2
+        top = self.y + (self.height + 3 * n * sticker) / 2
+        with self.canvas:
+            for column, row in NET_CELLS:
+                face_left = left + column * n * sticker
+                face_top = top - row * n * sticker
+                for r in range(n):
+                    for c in range(n):
+                        self._colors.append(Color(0, 0, 0, 1))
+                        Rectangle(pos=(face_left + c * sticker, face_top - (r + 1) * sticker),
+                                  size=(sticker - gap, sticker - gap))
+        self._recolor()
+
+    def _recolor(self):
+        if self.state is None or len(self.state) != len(self._colors):
+            return
+        for instruction, color in zip(self._colors, self.state):
+            instruction.rgba = STICKER_COLORS[color]
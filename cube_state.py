@@ -0,0 +1,136 @@
+import re
+from functools import lru_cache
+from operator import itemgetter
+
+# Sticker colors by face, and the face order of a state
+FACES = 'URFDLB'
+SOLVED_COLORS = bytes(range(6))
+MIN_SIZE, MAX_SIZE = 2, 7
+
+# Scrambles shown at once plus the next few queued ones
+_STATE_CACHE_SIZE = 256
+
+# [layers]face[w][amount], e.g. R, U', F2, Rw, 3Rw2, plus lowercase wide moves and x/y/z
+_MOVE = re.compile(r"^(\d*)([URFDLBurfdlbxyz])(w?)(2'|2|')?$")
+_PUZZLE = re.compile(r"^(\d)x\1x\1\b")
+
+# Face -> (axis, sign): x points to R, y to U, z to F
+_FACE_AXES = {'R': (0, 1), 'L': (0, -1), 'U': (1, 1), 'D': (1, -1), 'F': (2, 1), 'B': (2, -1)}
+_ROTATION_FACES = {'x': 'R', 'y': 'U', 'z': 'F'}
+
+
+def cube_size(puzzle):
+    """N for NxNxN puzzles (and their trainer modes) the simulator supports, else None."""
+    match = _PUZZLE.match(puzzle)
+    if match is None:
+        return None
+    n = int(match.group(1))
+    return n if MIN_SIZE <= n <= MAX_SIZE else None
+
+
+def _sticker_position(n, face, row, col):
+    """
+    Sticker center in doubled integer coordinates: face planes at +-n, sticker
+    centers at odd offsets. Rows and columns are as the face appears in the
+    net (U seen from above with B at the top, D from below with F at the top,
+    the side faces upright).
+    """
+    a = 2 * col - (n - 1)
+    b = (n - 1) - 2 * row
+    return {
+        'U': (a, n, -b),
+        'D': (a, -n, b),
+        'F': (a, b, n),
+        'B': (-a, b, -n),
+        'R': (n, b, -a),
+        'L': (-n, b, a),
+    }[face]
+
+
+@lru_cache(maxsize=None)
+def _positions(n):
+    positions = [_sticker_position(n, face, row, col)
+                 for face in FACES for row in range(n) for col in range(n)]
+    return positions, {position: index for index, position in enumerate(positions)}
+
+
+def _rotate(position, axis, sign):
+    """Quarter turn clockwise as seen from the (axis, sign) face."""
+    x, y, z = position
+    if axis == 0:
+        return (x, z, -y) if sign > 0 else (x, -z, y)
+    if axis == 1:
+        return (-z, y, x) if sign > 0 else (z, y, -x)
+    return (y, -x, z) if sign > 0 else (-y, x, z)
+
+
+@lru_cache(maxsize=None)
+def move_table(n, face, first_layer, last_layer, amount):
+    """
+    Gather table for turning layers first_layer..last_layer (0 = the face
+    itself) of `face` clockwise `amount` quarter turns: the new state is
+    state[table[i]] for every sticker i. Built once per move and size.
+    """
+    if amount > 1:
+        quarter = move_table(n, face, first_layer, last_layer, 1)
+        previous = move_table(n, face, first_layer, last_layer, amount - 1)
+        return tuple(previous[i] for i in quarter)
+
+    axis, sign = _FACE_AXES[face]
+    positions, index_of = _positions(n)
+    table = list(range(len(positions)))
+    for source, position in enumerate(positions):
+        # Layer counted from the turning face; its own stickers are in layer 0
+        layer = (n - sign * position[axis]) // 2
+        if first_layer <= layer <= last_layer:
+            table[index_of[_rotate(position, axis, sign)]] = source
+    return tuple(table)
+
+
+def parse_move(n, token):
+    """(face, first_layer, last_layer, amount) for one move in WCA notation."""
+    match = _MOVE.match(token)
+    if match is None:
+        raise ValueError(f"unknown move {token!r}")
+    layers, face, wide, suffix = match.groups()
+    amount = {None: 1, "'": 3, '2': 2, "2'": 2}[suffix]
+
+    if face in _ROTATION_FACES:
+        return _ROTATION_FACES[face], 0, n - 1, amount
+    if face.islower():
+        # r = Rw
+        face, wide = face.upper(), 'w'
+    depth = int(layers) if layers else (2 if wide else 1)
+    if depth > n:
+        raise ValueError(f"{token!r} turns more layers than a {n}x{n}x{n} has")
+    if wide:
+        return face, 0, depth - 1, amount
+    # 3R (SiGN): only the third layer
+    return face, depth - 1, depth - 1, amount
+
+
+def apply_moves(n, state, scramble):
+    for token in scramble.split():
+        table = move_table(n, *parse_move(n, token))
+        state = bytes(itemgetter(*table)(state))
+    return state
+
+
+def solved_state(n):
+    return bytes(color for color in SOLVED_COLORS for _ in range(n * n))
+
+
+@lru_cache(maxsize=_STATE_CACHE_SIZE)
+def scramble_state(n, scramble):
+    """
+    Sticker colors (one byte per sticker, faces in FACES order, rows then
+    columns as in the net) after applying the scramble to a solved cube.
+    Memoized per scramble, so redrawing or prefetching the same one is free.
+    """
+    return apply_moves(n, solved_state(n), scramble)
+
+
+def face_grid(n, state, face):
+    """Rows of sticker colors for one face."""
+    start = FACES.index(face) * n * n
+    return [state[start + row * n:start + (row + 1) * n] for row in range(n)]
@@ -0,0 +1,281 @@
+import math
+from array import array
+
+from kivy.uix.widget import Widget
+from kivy.graphics import Color, Line, Mesh, Point, Rectangle
+from kivy.core.text import Label as CoreLabel
+
+from session_stats import RollingAverage
+from profiler import profiler
+
+# Rolling averages drawn over the raw times: (size, rgba)
+OVERLAYS = (
+    (5, (1, 0.6, 0.2, 1)),
+    (12, (0.9, 0.3, 0.9, 1)),
+)
+
+# Plot margins in pixels: left (y labels), right, bottom (x labels), top (title)
+MARGINS = (55, 15, 30, 35)
+HISTOGRAM_MARGINS = (10, 10, 24, 26)
+
+
+class RollingSeries:
+    """Rolling trimmed average for every solve of a history (NaN until the window fills)."""
+
+    def __init__(self, size):
+        self.size = size
+        self.values = array('d')
+        self._avg = RollingAverage(size)
+
+    def extend(self, times):
+        """Adds the values for any solves appended since the last call."""
+        size = self.size
+        for i in range(len(self.values), len(times)):
+            self._avg.add(times[i], times[i - size] if i >= size else None)
+            value = self._avg.value
+            self.values.append(math.nan if value is None else value)
+
+
+def column_envelope(values, columns):
+    """
+    Downsamples to one (index, min, max) triple per pixel column so drawing
+    cost depends on the widget width, not the history length.
+    Non-finite values (missing averages, DNFs) are skipped.
+    """
+    n = len(values)
+    per_column = n / columns
+    envelope = []
+    for column in range(columns):
+        lo = int(column * per_column)
+        hi = max(lo + 1, int((column + 1) * per_column))
+        chunk = [v for v in values[lo:hi] if math.isfinite(v)]
+        if chunk:
+            envelope.append(((lo + hi - 1) / 2, min(chunk), max(chunk)))
+    return envelope
+
+
+def _label_texture(cache, text, font_size):
+    texture = cache.get((text, font_size))
+    if texture is None:
+        label = CoreLabel(text=text, font_size=font_size, color=(1, 1, 1, 1))
+        label.refresh()
+        texture = label.texture
+        cache[(text, font_size)] = texture
+    return texture
+
+
+def nice_ticks(lo, hi, count=5):
+    if hi <= lo:
+        hi = lo + 1
+    raw_step = (hi - lo) / count
+    magnitude = 10 ** math.floor(math.log10(raw_step))
+    step = next(m * magnitude for m in (1, 2, 5, 10) if m * magnitude >= raw_step)
+    first = math.ceil(lo / step) * step
+    return [first + i * step for i in range(int((hi - first) / step) + 1)]
+
+
+class SolveGraphWidget(Widget):
+    """
+    Solve history plot drawn with Kivy Line/Mesh instructions.
+
+    Only redrawn when the history version or widget size changes. Above one
+    solve per pixel column the times are drawn as a min/max band, so a 100k
+    solve history costs the same to draw as a few hundred.
+    """
+
+    def __init__(self, **kwargs):
+        super(SolveGraphWidget, self).__init__(**kwargs)
+        self.puzzle = ""
+        self.times = array('d')
+
+        self._version = None
+        self._base_version = None
+        self._length = 0
+        self._series = {}
+        self._overlays = {}  # size -> rolling values drawn over the times
+        self._label_cache = {}
+
+        self.bind(pos=self._redraw, size=self._redraw)
+
+    def set_history(self, puzzle, history, rolling=None):
+        """
+        `rolling` optionally maps overlay sizes to precomputed series (e.g. from
+        solve_analytics); without it the overlays are kept up to date here.
+        """
+        same_puzzle = puzzle == self.puzzle
+        if same_puzzle and history.version == self._version:
+            return
+
+        self.puzzle = puzzle
+        # Penalties applied; DNFs are inf and skipped when drawing
+        self.times = history.effective_times()
+
+        if rolling is not None:
+            self._series = {}
+            self._overlays = {size: rolling[size] for size, _ in OVERLAYS if size in rolling}
+        else:
+            # Anything but appends to the same history means a rebuild
+            appended_only = (same_puzzle and self._series and history.base_version == self._base_version and
+                             len(history) >= self._length)
+            if not appended_only:
+                self._series = {size: RollingSeries(size) for size, _ in OVERLAYS}
+            for series in self._series.values():
+                series.extend(self.times)
+            self._overlays = {size: series.values for size, series in self._series.items()}
+
+        self._version = history.version
+        self._base_version = history.base_version
+        self._length = len(history)
+
+        self._redraw()
+
+    def _label(self, text, font_size=12):
+        return _label_texture(self._label_cache, text, font_size)
+
+    def _redraw(self, *args):
+        profiler.count('graph.redraws')
+        self.canvas.clear()
+
+        left_margin, right_margin, bottom_margin, top_margin = MARGINS
+        left = self.x + left_margin
+        bottom = self.y + bottom_margin
+        width = max(1, self.width - left_margin - right_margin)
+        height = max(1, self.height - bottom_margin - top_margin)
+        columns = max(1, int(width))
+
+        n = len(self.times)
+        envelope = column_envelope(self.times, columns) if n else []
+
+        with self.canvas:
+            Color(0.067, 0.067, 0.067, 1)
+            Rectangle(pos=self.pos, size=self.size)
+
+            title = self._label(f"{self.puzzle} Solve History", 16)
+            Color(1, 1, 1, 1)
+            Rectangle(texture=title, size=title.size,
+                      pos=(left + (width - title.width) / 2, self.top - top_margin + (top_margin - title.height) / 2))
+
+            if not envelope:
+                Line(points=[left, bottom + height, left, bottom, left + width, bottom])
+                return
+
+            # Times are milliseconds, the axis is in seconds
+            y_lo = min(e[1] for e in envelope) / 1000
+            y_hi = max(e[2] for e in envelope) / 1000
+            pad = (y_hi - y_lo) * 0.05 or 1.0
+            y_lo, y_hi = max(0.0, y_lo - pad), y_hi + pad
+            x_span = max(1, n - 1)
+
+            def to_x(index):
+                return left + index / x_span * width
+
+            def to_y(value_ms):
+                return bottom + (value_ms / 1000 - y_lo) / (y_hi - y_lo) * height
+
+            # Grid and tick labels
+            for tick in nice_ticks(y_lo, y_hi):
+                y = to_y(tick * 1000)
+                Color(0.3, 0.3, 0.3, 1)
+                Line(points=[left, y, left + width, y])
+                label = self._label(f"{tick:g}")
+                Color(1, 1, 1, 1)
+                Rectangle(texture=label, size=label.size,
+                          pos=(left - label.width - 6, y - label.height / 2))
+            for tick in nice_ticks(1, n):
+                x = to_x(tick - 1)
+                label = self._label(f"{int(tick)}")
+                Rectangle(texture=label, size=label.size,
+                          pos=(x - label.width / 2, bottom - label.height - 4))
+
+            Color(1, 1, 1, 1)
+            Line(points=[left, bottom + height, left, bottom, left + width, bottom])
+
+            # Raw times
+            Color(0, 1, 1, 1)
+            if n <= columns:
+                points = []
+                for i, value in enumerate(self.times):
+                    if math.isfinite(value):
+                        points += [to_x(i), to_y(value)]
+                Line(points=points, width=1.1)
+                if n <= 200:
+                    Point(points=points, pointsize=2.5)
+            else:
+                vertices = []
+                for index, lo, hi in envelope:
+                    x = to_x(index)
+                    vertices += [x, to_y(lo), 0, 0, x, to_y(hi), 0, 0]
+                Color(0, 1, 1, 0.45)
+                Mesh(vertices=vertices, indices=list(range(len(vertices) // 4)), mode='triangle_strip')
+
+            # Rolling average overlays
+            for size, rgba in OVERLAYS:
+                values = self._overlays.get(size)
+                if values is None or n < size:
+                    continue
+                points = []
+                for index, lo, hi in column_envelope(values, min(columns, n)):
+                    points += [to_x(index), to_y((lo + hi) / 2)]
+                Color(*rgba)
+                Line(points=points, width=1.3)
+
+
+class HistogramWidget(Widget):
+    """
+    Bar chart of a solve time histogram (counts and bin edges in ms, as
+    solve_analytics computes it). Only redrawn when the bins or the widget
+    size change.
+    """
+
+    def __init__(self, **kwargs):
+        super(HistogramWidget, self).__init__(**kwargs)
+        self.counts = []
+        self.edges = []
+        self._label_cache = {}
+        self.bind(pos=self._redraw, size=self._redraw)
+
+    def set_histogram(self, counts, edges):
+        counts, edges = list(counts), list(edges)
+        if counts == self.counts and edges == self.edges:
+            return
+        self.counts, self.edges = counts, edges
+        self._redraw()
+
+    def _redraw(self, *args):
+        profiler.count('graph.redraws')
+        self.canvas.clear()
+
+        left_margin, right_margin, bottom_margin, top_margin = HISTOGRAM_MARGINS
+        left = self.x + left_margin
+        bottom = self.y + bottom_margin
+        width = max(1, self.width - left_margin - right_margin)
+        height = max(1, self.height - bottom_margin - top_margin)
+
+        with self.canvas:
+            Color(0.067, 0.067, 0.067, 1)
+            Rectangle(pos=self.pos, size=self.size)
+
+            title = _label_texture(self._label_cache, "Distribution", 14)
+            Color(1, 1, 1, 1)
+            Rectangle(texture=title, size=title.size,
+                      pos=(left + (width - title.width) / 2, self.top - top_margin + (top_margin - title.height) / 2))
+            Line(points=[left, bottom, left + width, bottom])
+            if not self.counts:
+                return
+
+            tallest = max(self.counts) or 1
+            bar_width = width / len(self.counts)
+            Color(0, 1, 1, 0.8)
+            for i, count in enumerate(self.counts):
+                if count:
+                    Rectangle(pos=(left + i * bar_width + 1, bottom),
+                              size=(max(1, bar_width - 2), count / tallest * height))
+
+            # Fastest, middle and slowest bin edge, in seconds
+            Color(1, 1, 1, 1)
+            for index in (0, len(self.edges) // 2, len(self.edges) - 1):
+                label = _label_texture(self._label_cache, f"{self.edges[index] / 1000:.1f}", 12)
+                x = left + index * bar_width
+                Rectangle(texture=label, size=label.size,
+                          pos=(min(max(self.x, x - label.width / 2), self.right - label.width),
+                               bottom - label.height - 4))
@@ -0,0 +1,219 @@
+import os
+import json
+import logging
+import threading
+from functools import partial
+from urllib.parse import quote, unquote
+
+from profiler import profiled
+
+BACKUP_SUFFIX = '.bak'
+
+log = logging.getLogger(__name__)
+
+
+def puzzle_path(directory, puzzle, suffix):
+    """Path of one puzzle's file in a per-puzzle directory; names may contain spaces or slashes."""
+    return os.path.join(directory, quote(puzzle, safe='') + suffix)
+
+
+def path_puzzle(name, suffix):
+    """The puzzle a puzzle_path() file name belongs to."""
+    return unquote(os.path.basename(name)[:-len(suffix)])
+
+
+def _backup_path(path, index):
+    return f"{path}{BACKUP_SUFFIX}{index}"
+
+
+def _sync_directory(path):
+    # Makes the rename itself durable; directories can't be opened on Windows
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@profiled('atomic_write', 'store')
+def atomic_write(path, data, backups=0):
+    """
+    Replaces `path` with the bytes `data` so that a crash leaves either the
+    old or the new file, never a torn one: temp file, fsync, rename. With
+    `backups`, the previous versions are kept as path.bak1 (newest) to
+    path.bakN.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+    if backups and os.path.exists(path):
+        for index in range(backups - 1, 0, -1):
+            if os.path.exists(_backup_path(path, index)):
+                os.replace(_backup_path(path, index), _backup_path(path, index + 1))
+        os.replace(path, _backup_path(path, 1))
+
+    os.replace(tmp_path, path)
+    _sync_directory(path)
+
+
+@profiled('read_verified', 'store')
+def read_verified(path, parse, backups=0):
+    """
+    Returns (value, source path) from the first of `path`, path.bak1 ...
+    path.bakN that exists and that `parse(bytes)` accepts, or (None, None).
+    `parse` raises ValueError for a damaged file.
+    """
+    for candidate in [path] + [_backup_path(path, index) for index in range(1, backups + 1)]:
+        try:
+            with open(candidate, 'rb') as f:
+                return parse(f.read()), candidate
+        except (OSError, ValueError):
+            continue
+    return None, None
+
+
+class PersistenceWorker:
+    """
+    Background thread that does file writes for the UI thread. Jobs are
+    keyed by what they write: a job submitted while an older one with the
+    same key is still waiting replaces it, so a burst of saves to the same
+    file costs one write. Jobs run in the order their keys were first queued.
+
+    A job that raises is logged and passed to `on_error(key, exception)` on
+    the worker thread; the file keeps its last good version.
+    """
+
+    def __init__(self, delay=0.05, on_error=None):
+        # Seconds to wait after the first job of a burst before writing
+        self.delay = delay
+        self.on_error = on_error
+        self.last_error = None
+
+        self._jobs = {}  # key -> callable
+        self._busy = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, key, job):
+        with self._cond:
+            if not self._closed:
+                self._jobs[key] = job
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+                self._cond.notify_all()
+                return
+        # Closed: nothing will pick it up, write now
+        job()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._jobs and not self._closed:
+                    self._cond.wait()
+                if not self._jobs:
+                    return
+                if self.delay and not self._closed:
+                    # Let the rest of the burst replace this job
+                    self._cond.wait(self.delay)
+                jobs = list(self._jobs.items())
+                self._jobs.clear()
+                self._busy = True
+
+            for key, job in jobs:
+                try:
+                    job()
+                except Exception as e:
+                    log.exception("Background save %r failed", key)
+                    self.last_error = e
+                    if self.on_error is not None:
+                        self.on_error(key, e)
+
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+    def flush(self):
+        """Blocks until every submitted job has been written."""
+        with self._cond:
+            self._cond.notify_all()
+            while self._jobs or self._busy:
+                self._cond.wait()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class SettingsStore:
+    """
+    Drop-in for the JsonStore holding the app's settings (same file format,
+    same exists/get/put/delete calls). Values live in memory; every change
+    is written in the background by a PersistenceWorker with atomic_write and
+    rotating backups. Loading falls back to the newest backup that still
+    parses if the file itself is damaged, and restores it.
+    """
+
+    def __init__(self, path, worker=None, backups=3):
+        self.path = path
+        self.worker = worker
+        self.backups = backups
+        self.recovered_from = None
+        self._data = self._load()
+
+    @staticmethod
+    def _parse(data):
+        value = json.loads(data.decode('utf-8'))
+        if not isinstance(value, dict):
+            raise ValueError("settings file is not a JSON object")
+        return value
+
+    def _load(self):
+        data, source = read_verified(self.path, self._parse, self.backups)
+        if data is None:
+            return {}
+        if source != self.path:
+            self.recovered_from = source
+            # Put the good copy back without rotating the damaged file into the backups
+            atomic_write(self.path, self._serialize(data))
+        return data
+
+    @staticmethod
+    def _serialize(data):
+        return json.dumps(data).encode('utf-8')
+
+    def exists(self, key):
+        return key in self._data
+
+    def get(self, key):
+        return self._data[key]
+
+    @profiled('SettingsStore.put', 'store')
+    def put(self, key, **values):
+        self._data[key] = values
+        self._save()
+
+    def delete(self, key):
+        del self._data[key]
+        self._save()
+
+    def _save(self):
+        # Serialized here, so the worker never reads a dict the UI is changing
+        job = partial(atomic_write, self.path, self._serialize(self._data), self.backups)
+        if self.worker is None:
+            job()
+        else:
+            self.worker.submit(self.path, job)
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from functools import wraps
+
+# Oldest events are dropped past this, bounds memory on long sessions
+MAX_EVENTS = 200000
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'cat', 'start_ns')
+
+    def __init__(self, profiler, name, cat):
+        self.profiler = profiler
+        self.name = name
+        self.cat = cat
+        self.start_ns = 0
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.cat, self.start_ns)
+        return False
+
+
+class Profiler:
+    """
+    Hot-path timings and counters, off by default. While disabled, span()
+    returns a shared no-op and @profiled functions cost one attribute check,
+    so the instrumentation can stay in the code. While enabled, every span
+    is kept as a Chrome trace event (chrome://tracing, Perfetto) and folded
+    into per-name totals for the on-screen overlay.
+    """
+
+    def __init__(self, max_events=MAX_EVENTS):
+        self.enabled = False
+        self.events = deque(maxlen=max_events)
+        self.totals = {}    # name -> [calls, total ns, max ns]
+        self.counters = {}  # name -> value
+        self._lock = threading.Lock()
+        self._origin_ns = time.perf_counter_ns()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+            self.totals.clear()
+            self.counters.clear()
+
+    @staticmethod
+    def now():
+        return time.perf_counter_ns()
+
+    def span(self, name, cat='app'):
+        """with profiler.span('name'): ... records the block's duration."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, cat)
+
+    def record(self, name, cat, start_ns, end_ns=None, args=None):
+        """Records a finished span that started at `start_ns` (perf_counter_ns)."""
+        if end_ns is None:
+            end_ns = time.perf_counter_ns()
+        duration = end_ns - start_ns
+        event = {
+            'name': name, 'cat': cat, 'ph': 'X',
+            'ts': (start_ns - self._origin_ns) / 1000, 'dur': duration / 1000,
+            'pid': os.getpid(), 'tid': threading.get_ident(),
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+            total = self.totals.get(name)
+            if total is None:
+                self.totals[name] = [1, duration, duration]
+            else:
+                total[0] += 1
+                total[1] += duration
+                if duration > total[2]:
+                    total[2] = duration
+
+    def count(self, name, value=1):
+        """Adds to a counter; shown as a counter track in the trace."""
+        if not self.enabled:
+            return
+        with self._lock:
+            value = self.counters.get(name, 0) + value
+            self.counters[name] = value
+            self.events.append({
+                'name': name, 'ph': 'C', 'ts': (time.perf_counter_ns() - self._origin_ns) / 1000,
+                'pid': os.getpid(), 'tid': threading.get_ident(), 'args': {name: value},
+            })
+
+    def summary(self, limit=8):
+        """[(name, calls, mean ms, max ms)], most total time first."""
+        with self._lock:
+            totals = sorted(self.totals.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return [(name, calls, total / calls / 1e6, worst / 1e6) for name, (calls, total, worst) in totals]
+
+    def counter_values(self):
+        """[(name, value)] of every counter, by name."""
+        with self._lock:
+            return sorted(self.counters.items())
+
+    def dump(self, path):
+        """Writes the recorded events as Chrome trace JSON, returns the path."""
+        with self._lock:
+            events = list(self.events)
+            counters = dict(self.counters)
+        with open(path, 'w', encoding='utf-8') as f:
+            # Counter totals also go in otherData, older counter events may have been dropped
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'counters': counters}}, f)
+        return path
+
+
+def profiled(name=None, cat='app'):
+    """Decorator: records every call of the function as a span while profiling is on."""
+    def decorate(func):
+        span_name = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            start_ns = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.record(span_name, cat, start_ns)
+        return wrapper
+    return decorate
+
+
+# Shared by every module, toggled from the Settings screen
+profiler = Profiler()
@@ -0,0 +1,64 @@
+from kivy.clock import Clock
+from kivy.core.window import Window
+from kivy.uix.label import Label
+
+from profiler import profiler
+
+
+class ProfilerOverlay(Label):
+    """
+    FPS, the slowest instrumented calls and the counters, drawn over every
+    screen while profiling is on. Also records each frame as a span so the trace shows
+    where frame time went.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('font_size', 12)
+        kwargs.setdefault('color', (1, 1, 0, 1))
+        kwargs.setdefault('halign', 'left')
+        kwargs.setdefault('valign', 'top')
+        kwargs.setdefault('size_hint', (None, None))
+        super(ProfilerOverlay, self).__init__(**kwargs)
+        self.bind(texture_size=self._fit)
+        self._frame_event = None
+        self._refresh_event = None
+        self._frame_start_ns = 0
+
+    def _fit(self, *args):
+        self.size = self.texture_size
+        self.pos = (5, Window.height - self.height - 5)
+
+    def start(self):
+        profiler.enable()
+        if self.parent is None:
+            Window.add_widget(self)
+        self._frame_start_ns = profiler.now()
+        # Interval 0 runs once per frame
+        self._frame_event = Clock.schedule_interval(self._on_frame, 0)
+        self._refresh_event = Clock.schedule_interval(self._refresh, 0.5)
+        self._refresh(0)
+
+    def stop(self):
+        profiler.disable()
+        for event in (self._frame_event, self._refresh_event):
+            if event is not None:
+                event.cancel()
+        self._frame_event = self._refresh_event = None
+        if self.parent is not None:
+            Window.remove_widget(self)
+
+    def _on_frame(self, dt):
+        now = profiler.now()
+        profiler.record('frame', 'frame', self._frame_start_ns, now)
+        self._frame_start_ns = now
+
+    def _refresh(self, dt):
+        lines = [f"FPS {Clock.get_fps():.0f}"]
+        for name, calls, mean_ms, max_ms in profiler.summary():
+            if name == 'frame':
+                lines.append(f"frame  avg {mean_ms:.1f} ms  max {max_ms:.1f} ms")
+            else:
+                lines.append(f"{name}  x{calls}  avg {mean_ms:.2f} ms  max {max_ms:.2f} ms")
+        for name, value in profiler.counter_values():
+            lines.append(f"{name}  {value}")
+        self.text = "\n".join(lines)
@@ -0,0 +1,53 @@
+# Configuration for WCA Scramblers.
+# Modules are given by name and only imported by the scramble workers when a
+# puzzle is first generated, so startup never pays for all eleven of them.
+PUZZLE_CONFIG = {
+    "2x2x2": {"module": "pyTwistyScrambler.scrambler222", "func": "get_WCA_scramble", "args": {}},
+    "3x3x3": {"module": "pyTwistyScrambler.scrambler333", "func": "get_WCA_scramble", "args": {}},
+    "4x4x4": {"module": "pyTwistyScrambler.scrambler444", "func": "get_WCA_scramble", "args": {"n": 40}},
+    "5x5x5": {"module": "pyTwistyScrambler.scrambler555", "func": "get_WCA_scramble", "args": {"n": 60}},
+    "6x6x6": {"module": "pyTwistyScrambler.scrambler666", "func": "get_WCA_scramble", "args": {"n": 80}},
+    "7x7x7": {"module": "pyTwistyScrambler.scrambler777", "func": "get_WCA_scramble", "args": {"n": 100}},
+    "Pyraminx": {"module": "pyTwistyScrambler.pyraminxScrambler", "func": "get_WCA_scramble", "args": {}},
+    "Megaminx": {"module": "pyTwistyScrambler.megaminxScrambler", "func": "get_WCA_scramble", "args": {"n": 70}},
+    "Square-1": {"module": "pyTwistyScrambler.squareOneScrambler", "func": "get_WCA_scramble", "args": {}},
+    "Skewb": {"module": "pyTwistyScrambler.skewbScrambler", "func": "get_WCA_scramble", "args": {}},
+    "Clock": {"module": "pyTwistyScrambler.clockScrambler", "func": "get_WCA_scramble", "args": {}},
+}
+
+# Configuration for Trainer Modes
+TRAINER_CONFIG = {
+    "3x3x3 3BLD": {"module": "pyTwistyScrambler.scrambler333", "func": "get_3BLD_scramble", "args": {}},
+    "3x3x3 Edges": {"module": "pyTwistyScrambler.scrambler333", "func": "get_edges_scramble", "args": {}},
+    "3x3x3 Corners": {"module": "pyTwistyScrambler.scrambler333", "func": "get_corners_scramble", "args": {}},
+    "3x3x3 LL": {"module": "pyTwistyScrambler.scrambler333", "func": "get_LL_scramble", "args": {}},
+    "3x3x3 F2L": {"module": "pyTwistyScrambler.scrambler333", "func": "get_F2L_scramble", "args": {}},
+    "3x3x3 Cross (Easy)": {"module": "pyTwistyScrambler.scrambler333", "func": "get_easy_cross_scramble", "args": {"n": 4}},
+    "3x3x3 Cross (Difficult)": {"module": "pyTwistyScrambler.scrambler333", "func": "get_easy_cross_scramble", "args": {"n": 8}},
+    "3x3x3 LSLL": {"module": "pyTwistyScrambler.scrambler333", "func": "get_LSLL_scramble", "args": {}},
+    "3x3x3 ZBLL": {"module": "pyTwistyScrambler.scrambler333", "func": "get_ZBLL_scramble", "args": {}},
+    "3x3x3 ZZLL": {"module": "pyTwistyScrambler.scrambler333", "func": "get_ZZLL_scramble", "args": {}},
+    "3x3x3 ZBLS": {"module": "pyTwistyScrambler.scrambler333", "func": "get_ZBLS_scramble", "args": {}},
+    "3x3x3 LSE": {"module": "pyTwistyScrambler.scrambler333", "func": "get_LSE_scramble", "args": {}},
+    "3x3x3 CMLL": {"module": "pyTwistyScrambler.scrambler333", "func": "get_CMLL_scramble", "args": {}},
+    "3x3x3 CLL": {"module": "pyTwistyScrambler.scrambler333", "func": "get_CLL_scramble", "args": {}},
+    "3x3x3 ELL": {"module": "pyTwistyScrambler.scrambler333", "func": "get_ELL_scramble", "args": {}},
+    "3x3x3 EO Line": {"module": "pyTwistyScrambler.scrambler333", "func": "get_EOLine_scramble", "args": {}},
+    "4x4x4 Edges": {"module": "pyTwistyScrambler.scrambler444", "func": "get_edges_scramble", "args": {"n": 8}},
+    "5x5x5 Edges": {"module": "pyTwistyScrambler.scrambler555", "func": "get_edges_scramble", "args": {"n": 8}},
+    "6x6x6 Edges": {"module": "pyTwistyScrambler.scrambler666", "func": "get_edges_scramble", "args": {"n": 8}},
+    "7x7x7 Edges": {"module": "pyTwistyScrambler.scrambler777", "func": "get_edges_scramble", "args": {"n": 8}},
+    "Square-1 Face Turn Metric": {"module": "pyTwistyScrambler.squareOneScrambler", "func": "get_face_turn_metric_scramble",
+                                  "args": {"n": 40}},
+    "Square-1 Twist Metric": {"module": "pyTwistyScrambler.squareOneScrambler", "func": "get_twist_metric_scramble", "args": {"n": 20}},
+}
+
+# Trainer modes the case trainer can drill case by case, and which top-layer
+# stickers tell their cases apart (see case_trainer.case_stickers)
+CASE_TRAINER_MODES = {
+    "3x3x3 ZBLL": 'last_layer',
+    "3x3x3 ZZLL": 'last_layer',
+    "3x3x3 CMLL": 'corners',
+    "3x3x3 CLL": 'corners',
+    "3x3x3 ELL": 'edges',
+}
@@ -0,0 +1,280 @@
+"""
+Offline scramble pools: pre-generated scrambles the app serves before ever
+generating one itself, so slow puzzles (7x7x7, Megaminx) never generate on
+the device.
+
+    python scramble_pool.py 7x7x7 Megaminx -n 5000     # add 5000 of each
+    python scramble_pool.py --wca -n 2000 -j 8         # every WCA puzzle, 8 processes
+    python scramble_pool.py --list                     # what is left in each pool
+
+Run it while the app is closed. Each puzzle gets one file in the pool
+directory: a magic line, a JSON header line and one scramble per line. The
+app maps it with mmap and reads it front to back from a cursor kept in a
+small .pos file next to it, so opening a pool of any size costs nothing.
+Scrambles still unused when a pool is topped up are kept, ahead of the new
+ones.
+"""
+import os
+import sys
+import json
+import mmap
+import time
+import shutil
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from persistence import atomic_write, puzzle_path, path_puzzle
+from scramble_service import generate_batch
+from puzzle_config import PUZZLE_CONFIG, TRAINER_CONFIG
+
+POOL_MAGIC = b'RCPOOL1\n'
+POOL_SUFFIX = '.pool'
+CURSOR_SUFFIX = '.pos'
+DEFAULT_POOL_DIR = 'cube_timer_pools'
+
+# Scrambles per task handed to a worker process
+_CHUNK = 25
+
+
+def pool_path(directory, puzzle):
+    return puzzle_path(directory, puzzle, POOL_SUFFIX)
+
+
+class ScramblePool:
+    """One puzzle's pool file, read sequentially through mmap."""
+
+    def __init__(self, path):
+        self.path = path
+        self.cursor_path = path + CURSOR_SUFFIX
+        self.puzzle = None
+        self.count = 0
+        self.taken = 0
+        self._file = None
+        self._map = None
+        self._offset = 0
+        self._dirty = False
+
+    def open(self):
+        self._file = open(self.path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(POOL_MAGIC)] != POOL_MAGIC:
+            self.close()
+            raise ValueError(f"{self.path} is not a scramble pool")
+        header_end = self._map.find(b'\n', len(POOL_MAGIC))
+        header = json.loads(self._map[len(POOL_MAGIC):header_end])
+        self.puzzle = header['puzzle']
+        self.count = header['count']
+
+        self._offset = header_end + 1
+        try:
+            with open(self.cursor_path, encoding='ascii') as f:
+                offset, taken = (int(value) for value in f.read().split())
+            if self._offset <= offset <= len(self._map):
+                self._offset, self.taken = offset, taken
+        except (OSError, ValueError):
+            pass
+        return self
+
+    @property
+    def remaining(self):
+        return self.count - self.taken
+
+    def take(self, count):
+        """Up to `count` scrambles from the cursor on, [] once the pool is used up."""
+        scrambles = []
+        data = self._map
+        offset = self._offset
+        end = len(data)
+        while len(scrambles) < count and offset < end:
+            line_end = data.find(b'\n', offset)
+            if line_end < 0:
+                line_end = end
+            scrambles.append(data[offset:line_end].decode('utf-8'))
+            offset = line_end + 1
+        if scrambles:
+            self._offset = offset
+            self.taken += len(scrambles)
+            self._dirty = True
+        return scrambles
+
+    def take_cursor(self):
+        """The cursor to save if it moved since the last call, else None."""
+        if not self._dirty:
+            return None
+        self._dirty = False
+        return self._offset, self.taken
+
+    def save_cursor(self, cursor):
+        atomic_write(self.cursor_path, f"{cursor[0]} {cursor[1]}".encode('ascii'))
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ScramblePools:
+    """
+    Every pool in a directory, for ScrambleService. Pools are opened on the
+    first take() for their puzzle; a missing or damaged pool just means the
+    puzzle is generated as before.
+    """
+
+    def __init__(self, directory=DEFAULT_POOL_DIR):
+        self.directory = directory
+        self._pools = {}  # puzzle -> ScramblePool, None if there is none
+
+    def _pool(self, puzzle):
+        if puzzle not in self._pools:
+            path = pool_path(self.directory, puzzle)
+            pool = None
+            if os.path.exists(path):
+                try:
+                    pool = ScramblePool(path).open()
+                except (OSError, ValueError):
+                    pool = None
+            self._pools[puzzle] = pool
+        return self._pools[puzzle]
+
+    def take(self, puzzle, count):
+        pool = self._pool(puzzle)
+        return pool.take(count) if pool is not None else []
+
+    def take_dirty(self):
+        """[(pool, cursor)] for pools read since the last call, see ScramblePool.save_cursor."""
+        dirty = []
+        for pool in self._pools.values():
+            cursor = pool.take_cursor() if pool is not None else None
+            if cursor is not None:
+                dirty.append((pool, cursor))
+        return dirty
+
+    def close(self):
+        for pool in self._pools.values():
+            if pool is not None:
+                pool.close()
+        self._pools = {}
+
+
+# --- Generation ---
+
+def _unused(path):
+    """Scrambles not yet served from an existing pool."""
+    if not os.path.exists(path):
+        return []
+    try:
+        pool = ScramblePool(path).open()
+    except ValueError:
+        return []
+    try:
+        return pool.take(pool.remaining)
+    finally:
+        pool.close()
+
+
+def write_pool(path, puzzle, scrambles_file, count):
+    """Writes the pool atomically from a file of scramble lines and resets its cursor."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(POOL_MAGIC)
+        f.write(json.dumps({'puzzle': puzzle, 'count': count, 'created': time.time()}).encode('utf-8') + b'\n')
+        scrambles_file.seek(0)
+        shutil.copyfileobj(scrambles_file, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    if os.path.exists(path + CURSOR_SUFFIX):
+        os.remove(path + CURSOR_SUFFIX)
+
+
+def generate_pools(puzzles, count, directory=DEFAULT_POOL_DIR, workers=None, log=print):
+    """Adds `count` scrambles to each puzzle's pool using every core."""
+    configs = {**PUZZLE_CONFIG, **TRAINER_CONFIG}
+    os.makedirs(directory, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        for puzzle in puzzles:
+            path = pool_path(directory, puzzle)
+            kept = _unused(path)
+            start = time.perf_counter()
+
+            body_path = path + '.body'
+            try:
+                with open(body_path, 'w+b') as body:
+                    body.writelines(scramble.encode('utf-8') + b'\n' for scramble in kept)
+                    config = configs[puzzle]
+                    futures = [executor.submit(generate_batch, config['module'], config['func'], config['args'],
+                                               min(_CHUNK, count - done))
+                               for done in range(0, count, _CHUNK)]
+                    generated = 0
+                    # Order doesn't matter, write chunks as they finish to keep memory flat
+                    for future in as_completed(futures):
+                        chunk = future.result()
+                        body.writelines(scramble.replace('\n', ' ').encode('utf-8') + b'\n' for scramble in chunk)
+                        generated += len(chunk)
+                        log(f"\r{puzzle}: {generated}/{count}", end='', file=sys.stderr)
+                    write_pool(path, puzzle, body, len(kept) + generated)
+            finally:
+                os.remove(body_path)
+
+            log(f"\r{puzzle}: {generated} generated in {time.perf_counter() - start:.1f} s, "
+                f"{len(kept) + generated} in pool", file=sys.stderr)
+
+
+def list_pools(directory=DEFAULT_POOL_DIR):
+    """[(puzzle, remaining, size in bytes)] for every pool in the directory."""
+    pools = []
+    if not os.path.isdir(directory):
+        return pools
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(POOL_SUFFIX):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            pool = ScramblePool(path).open()
+        except (OSError, ValueError):
+            continue
+        pools.append((pool.puzzle or path_puzzle(name, POOL_SUFFIX), pool.remaining, os.path.getsize(path)))
+        pool.close()
+    return pools
+
+
+def main(argv=None):
+    configs = {**PUZZLE_CONFIG, **TRAINER_CONFIG}
+    parser = argparse.ArgumentParser(description="Pre-generate scramble pools for R-Cube-Timer")
+    parser.add_argument('puzzles', nargs='*', help="puzzle or trainer mode names, e.g. 7x7x7 Megaminx")
+    parser.add_argument('--wca', action='store_true', help="every WCA puzzle")
+    parser.add_argument('--trainer', action='store_true', help="every trainer mode")
+    parser.add_argument('-n', '--count', type=int, default=1000, help="scrambles to add per puzzle (default 1000)")
+    parser.add_argument('-j', '--jobs', type=int, help="worker processes (default: all cores)")
+    parser.add_argument('-d', '--directory', default=DEFAULT_POOL_DIR, help=f"pool directory (default {DEFAULT_POOL_DIR})")
+    parser.add_argument('--list', action='store_true', help="show what is left in each pool and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for puzzle, remaining, size in list_pools(args.directory):
+            print(f"{puzzle:<32}{remaining:>10} left {size / 1024:>10.0f} KiB")
+        return
+
+    puzzles = list(args.puzzles)
+    if args.wca:
+        puzzles += PUZZLE_CONFIG.keys()
+    if args.trainer:
+        puzzles += TRAINER_CONFIG.keys()
+    puzzles = list(dict.fromkeys(puzzles))
+    unknown = [puzzle for puzzle in puzzles if puzzle not in configs]
+    if unknown:
+        parser.error(f"unknown puzzle(s): {', '.join(unknown)}")
+    if not puzzles:
+        parser.error("name at least one puzzle, or use --wca / --trainer")
+
+    generate_pools(puzzles, args.count, args.directory, args.jobs)
+
+
+if __name__ == '__main__':
+    main()
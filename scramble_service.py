@@ -0,0 +1,304 @@
+import os
+import importlib
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from profiler import profiler
+
+
+def generate_batch(module_name, func_name, args, count):
+    """Runs inside a worker process: imports the scrambler and produces `count` scrambles."""
+    module = importlib.import_module(module_name)
+    func = getattr(module, func_name)
+    return [func(**args) for _ in range(count)]
+
+
+class ScrambleService:
+    """
+    Keeps a scramble queue per puzzle topped up using a process pool.
+
+    When a queue drops below `low_watermark` it is refilled in batches until
+    it reaches `high_watermark`. Only as many batches as there are workers are
+    in flight at once, and the priority puzzle (the one on screen) is always
+    served first. Finished batches are handed back through `schedule`, which
+    should run the callback on the UI thread (e.g. via Clock.schedule_once).
+
+    An empty queue is bootstrapped with a single scramble generated on an
+    in-process thread, so the first scramble never waits for the pool to
+    spawn. Puzzles passed to `prefetch` are only filled while nothing else
+    is wanted and the service is not paused (e.g. during a solve).
+
+    Queues are per-puzzle deques guarded by one lock, and every batch is
+    tagged with the puzzle it was requested for, so switching puzzles while
+    a batch is running can never put scrambles in the wrong queue. pop()
+    never blocks: it returns None when nothing is ready.
+
+    With `pools` (a ScramblePools), refills are served from the offline
+    pre-generated pools first; a puzzle is only generated once its pool is
+    used up.
+    """
+
+    def __init__(self, configs, schedule, low_watermark=10, high_watermark=50, batch_size=10, max_workers=None,
+                 pools=None):
+        self.configs = configs
+        self.schedule = schedule
+        self.pools = pools
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.batch_size = batch_size
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+
+        self.queues = {}
+        self.priority = None
+
+        self.paused = False
+
+        self._wanted = []     # puzzles waiting for a refill, oldest request first
+        self._idle = []       # puzzles to fill only when there is nothing else to do
+        self._in_flight = {}  # puzzle -> number of scrambles being generated
+        self._futures = {}    # future -> (puzzle, count, idle)
+        self._batches = 0     # batches currently submitted to the pool
+        self._dirty = set()   # puzzles whose queue changed since the last take_dirty()
+        self._closed = False
+        self._listeners = []
+        self._executor = None
+        self._quick_executor = None
+        self._lock = threading.RLock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            try:
+                # Forking while the quick thread holds the import lock deadlocks the child, so spawn
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            except (NotImplementedError, OSError, ImportError):
+                # Platforms without working multiprocessing (e.g. Android)
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def _get_quick_executor(self):
+        if self._quick_executor is None:
+            self._quick_executor = ThreadPoolExecutor(max_workers=1)
+        return self._quick_executor
+
+    def add_listener(self, callback):
+        """callback(puzzle) is called on the UI thread whenever a puzzle's queue grows."""
+        self._listeners.append(callback)
+
+    def load_queues(self, queues, mark_dirty=False):
+        with self._lock:
+            for puzzle, scrambles in queues.items():
+                self.queues[puzzle] = deque(scrambles)
+                if mark_dirty:
+                    self._dirty.add(puzzle)
+
+    def take_dirty(self):
+        """Returns {puzzle: [scrambles]} copies of the queues changed since the last call."""
+        with self._lock:
+            dirty = {puzzle: list(self.queues.get(puzzle, ())) for puzzle in self._dirty}
+            self._dirty = set()
+        return dirty
+
+    def set_priority(self, puzzle):
+        self.priority = puzzle
+        self.request(puzzle)
+
+    def pending(self, puzzle):
+        with self._lock:
+            return len(self.queues.get(puzzle, ())) + self._in_flight.get(puzzle, 0)
+
+    def prefetch(self, puzzles):
+        """Queues puzzles for background filling while the app is idle."""
+        with self._lock:
+            for puzzle in puzzles:
+                if puzzle in self.configs and puzzle not in self._idle:
+                    self._idle.append(puzzle)
+        self._pump()
+
+    def pause(self):
+        """Stops idle prefetching and withdraws prefetch batches that have not started yet."""
+        with self._lock:
+            self.paused = True
+            for future, (puzzle, count, idle) in list(self._futures.items()):
+                if idle:
+                    future.cancel()
+
+    def resume(self):
+        self.paused = False
+        self._pump()
+
+    def cancel(self, puzzle):
+        """Drops outstanding requests for a puzzle. Batches already running still deliver."""
+        with self._lock:
+            for source in (self._wanted, self._idle):
+                if puzzle in source:
+                    source.remove(puzzle)
+            for future, (batch_puzzle, count, idle) in list(self._futures.items()):
+                if batch_puzzle == puzzle:
+                    future.cancel()
+
+    def request(self, puzzle):
+        """Asks for a refill if the puzzle is below its low watermark."""
+        if puzzle not in self.configs:
+            return
+        with self._lock:
+            if len(self.queues.get(puzzle, ())) >= self.low_watermark:
+                return
+            if puzzle not in self._wanted:
+                self._wanted.append(puzzle)
+        self._pump()
+
+    def peek(self, puzzle):
+        """The scramble pop() would return next, without taking it."""
+        with self._lock:
+            queue = self.queues.get(puzzle)
+            return queue[0] if queue else None
+
+    def pop(self, puzzle):
+        """Returns the next scramble for the puzzle, or None if none is ready yet."""
+        if self.pools is not None and not self.queues.get(puzzle):
+            # An offline pool can fill the queue right away
+            self.request(puzzle)
+        with self._lock:
+            queue = self.queues.get(puzzle)
+            scramble = queue.popleft() if queue else None
+            if scramble is not None:
+                self._dirty.add(puzzle)
+                profiler.count('scrambles.served')
+        self.request(puzzle)
+        return scramble
+
+    def _next_wanted(self):
+        if self.priority in self._wanted:
+            return self.priority, self._wanted
+        if self._wanted:
+            return self._wanted[0], self._wanted
+        # Idle work gets a single worker so it never competes with the UI
+        if self._idle and not self.paused and self._batches == 0:
+            return self._idle[0], self._idle
+        return None, None
+
+    def _pump(self):
+        from_pool = []
+        with self._lock:
+            # Back-pressure: never more batches than workers, the rest waits in _wanted/_idle
+            while not self._closed and self._batches < self.max_workers:
+                puzzle, source = self._next_wanted()
+                if puzzle is None:
+                    break
+                if self.pending(puzzle) >= self.high_watermark:
+                    source.remove(puzzle)
+                    continue
+                if self.pools is not None:
+                    # Performance: A few mmap'd lines, far cheaper than generating
+                    scrambles = self.pools.take(puzzle, self.high_watermark - self.pending(puzzle))
+                    if scrambles:
+                        self.queues.setdefault(puzzle, deque()).extend(scrambles)
+                        self._dirty.add(puzzle)
+                        from_pool.append(puzzle)
+                        profiler.count('scrambles.pooled', len(scrambles))
+                        continue
+                idle = source is self._idle
+                if self.pending(puzzle) == 0 and not idle:
+                    # Someone is waiting: one scramble in-process, without the pool's startup
+                    self._submit(puzzle, 1, self._get_quick_executor(), idle)
+                else:
+                    self._submit(puzzle, self.batch_size, self._get_executor(), idle)
+
+        # Listeners run on the UI thread and may pop() again, never from inside _pump
+        for puzzle in from_pool:
+            self.schedule(lambda puzzle=puzzle: self._notify(puzzle))
+
+    def free_workers(self):
+        """Workers with no batch of any generator on them; submit() only while this is positive."""
+        with self._lock:
+            return 0 if self._closed else self.max_workers - self._batches
+
+    def submit(self, label, count, func, *args):
+        """
+        Runs func(*args) on the worker pool and returns its future, for other
+        generators (CaseTrainer) so the app only ever runs one pool. The job
+        counts towards the same back-pressure as the scramble batches. `label`
+        and `count` describe the batch in profiler traces.
+        """
+        with self._lock:
+            self._batches += 1
+            future = self._run(self._get_executor(), label, count, func, *args)
+        future.add_done_callback(lambda f: self.schedule(self._on_job_done))
+        return future
+
+    def _on_job_done(self):
+        with self._lock:
+            self._batches -= 1
+        self._pump()
+
+    @staticmethod
+    def _run(executor, label, count, func, *args):
+        future = executor.submit(func, *args)
+        if profiler.enabled:
+            # Profiling: wall time from submit to result, queueing included
+            submitted_ns = profiler.now()
+            future.add_done_callback(
+                lambda f: profiler.record(label, 'scramble', submitted_ns, args={'count': count})
+            )
+        return future
+
+    def _submit(self, puzzle, count, executor, idle):
+        config = self.configs[puzzle]
+        future = self._run(
+            executor, f"generate {puzzle}", count,
+            generate_batch, config['module'], config['func'], config['args'], count
+        )
+        self._in_flight[puzzle] = self._in_flight.get(puzzle, 0) + count
+        self._batches += 1
+        self._futures[future] = (puzzle, count, idle)
+        # The puzzle travels with the batch, nothing reads the current puzzle later
+        future.add_done_callback(lambda f: self.schedule(lambda: self._on_batch(f)))
+
+    def _on_batch(self, future):
+        with self._lock:
+            puzzle, count, idle = self._futures.pop(future)
+            self._in_flight[puzzle] -= count
+            self._batches -= 1
+            if self._closed:
+                return
+
+            if future.cancelled():
+                scrambles = []
+            else:
+                try:
+                    scrambles = future.result()
+                except Exception:
+                    # Drop the request, the next pop() or request() retries it
+                    scrambles = []
+                    for source in (self._wanted, self._idle):
+                        if puzzle in source:
+                            source.remove(puzzle)
+
+            if scrambles:
+                self.queues.setdefault(puzzle, deque()).extend(scrambles)
+                self._dirty.add(puzzle)
+                profiler.count('scrambles.generated', len(scrambles))
+
+        if scrambles:
+            self._notify(puzzle)
+
+        self._pump()
+
+    def _notify(self, puzzle):
+        for callback in self._listeners:
+            callback(puzzle)
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            self._wanted = []
+            self._idle = []
+        for executor in (self._executor, self._quick_executor):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self._quick_executor = None
@@ -0,0 +1,49 @@
+import os
+
+from persistence import atomic_write, puzzle_path, path_puzzle
+from profiler import profiled
+
+QUEUE_SUFFIX = '.txt'
+
+
+class ScrambleQueueStore:
+    """
+    Persists scramble queues as one small text file per puzzle, one
+    scramble per line. Saving rewrites only the puzzles that changed, so
+    popping a 3x3x3 scramble never touches the Megaminx or 7x7x7 queues.
+    Each file is replaced atomically (persistence.atomic_write).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, puzzle):
+        return puzzle_path(self.directory, puzzle, QUEUE_SUFFIX)
+
+    @profiled('ScrambleQueueStore.load', 'store')
+    def load(self):
+        """Returns {puzzle: [scrambles]} for every saved queue."""
+        queues = {}
+        if not os.path.isdir(self.directory):
+            return queues
+        for name in os.listdir(self.directory):
+            if not name.endswith(QUEUE_SUFFIX):
+                continue
+            with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                scrambles = [line for line in f.read().split('\n') if line]
+            queues[path_puzzle(name, QUEUE_SUFFIX)] = scrambles
+        return queues
+
+    @profiled('ScrambleQueueStore.save', 'store')
+    def save(self, puzzle, scrambles):
+        path = self._path(puzzle)
+        if not scrambles:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        atomic_write(path, '\n'.join(scrambles).encode('utf-8'))
+
+    def save_many(self, queues):
+        for puzzle, scrambles in queues.items():
+            self.save(puzzle, scrambles)
@@ -0,0 +1,67 @@
+from collections import OrderedDict
+
+# Sessions kept loaded (history in the store plus SessionStats in the engine)
+DEFAULT_CAPACITY = 8
+
+
+class SessionCache:
+    """
+    Tracks which (puzzle, session) histories are loaded, most recently used
+    last. Once more than `capacity` are loaded the oldest is evicted:
+    `on_evict(puzzle, session)` drops whatever was derived from it and the
+    store unloads it, so memory stays bounded however many sessions exist.
+
+    Also keeps a SessionSummary per session, read from the store once per
+    puzzle and then updated in place as solves come in, so a list of dozens
+    of sessions never loads any of them.
+    """
+
+    def __init__(self, store, capacity=DEFAULT_CAPACITY, on_evict=None):
+        self.store = store
+        self.capacity = capacity
+        self.on_evict = on_evict
+        self._loaded = OrderedDict()
+        self._summaries = {}  # puzzle -> {session: SessionSummary}
+
+    def touch(self, puzzle, session):
+        key = (puzzle, session)
+        if key in self._loaded:
+            self._loaded.move_to_end(key)
+            return
+        self._loaded[key] = True
+        while len(self._loaded) > self.capacity:
+            (old_puzzle, old_session), _ = self._loaded.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(old_puzzle, old_session)
+            self.store.unload(old_puzzle, old_session)
+
+    def loaded(self):
+        return list(self._loaded)
+
+    def summaries(self, puzzle):
+        """{session: SessionSummary} for the puzzle's sessions with solves."""
+        summaries = self._summaries.get(puzzle)
+        if summaries is None:
+            summaries = self.store.session_summaries(puzzle)
+            self._summaries[puzzle] = summaries
+        return summaries
+
+    def set_summary(self, puzzle, session, summary):
+        # Only kept up to date once the puzzle's summaries have been read
+        summaries = self._summaries.get(puzzle)
+        if summaries is None:
+            return
+        if summary.count:
+            summaries[session] = summary
+        else:
+            summaries.pop(session, None)
+
+    def forget(self, puzzle, session):
+        """Drops a deleted session."""
+        self._loaded.pop((puzzle, session), None)
+        summaries = self._summaries.get(puzzle)
+        if summaries is not None:
+            summaries.pop(session, None)
+
+    def clear(self):
+        self._summaries.clear()
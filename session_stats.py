@@ -0,0 +1,284 @@
+import math
+from collections import namedtuple
+from itertools import accumulate
+from array import array
+from bisect import bisect_left, insort
+
+# Rolling averages shown for every puzzle
+AVERAGE_SIZES = (5, 12, 50, 100, 1000)
+
+# DNF solves are pushed as infinity
+DNF = math.inf
+
+# What a session list shows without loading the session; mean and best ignore DNFs (None if none)
+SessionSummary = namedtuple('SessionSummary', 'count mean best')
+
+
+class RollingAverage:
+    """
+    Trimmed average over the last `size` solves (WCA style Ao5/Ao12 and
+    csTimer style 5% trimming for the larger windows).
+    The window is kept sorted so adding or removing a solve is a bisect.
+    DNFs sort to the top; more of them than get trimmed makes the average DNF.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.trim = math.ceil(size * 0.05)
+        self._window = []
+        self._sum = 0.0  # finite values only
+        self._dnfs = 0
+
+    def _insert(self, value):
+        insort(self._window, value)
+        if value == DNF:
+            self._dnfs += 1
+        else:
+            self._sum += value
+
+    def _remove(self, value):
+        del self._window[bisect_left(self._window, value)]
+        if value == DNF:
+            self._dnfs -= 1
+        else:
+            self._sum -= value
+
+    def add(self, new_time, evicted=None):
+        self._insert(new_time)
+        if evicted is not None:
+            self._remove(evicted)
+
+    def undo(self, removed, readmitted=None):
+        self._remove(removed)
+        if readmitted is not None:
+            self._insert(readmitted)
+
+    def clear(self):
+        self._window = []
+        self._sum = 0.0
+        self._dnfs = 0
+
+    def load(self, times):
+        self._window = sorted(times[-self.size:])
+        self._dnfs = self._window.count(DNF)
+        self._sum = math.fsum(self._window[:len(self._window) - self._dnfs])
+
+    @property
+    def value(self):
+        if len(self._window) < self.size:
+            return None
+        trim = self.trim
+        if self._dnfs > trim:
+            return DNF
+        # The top `trim` slots hold every DNF plus (trim - dnfs) finite times
+        trimmed = math.fsum(self._window[:trim]) + math.fsum(self._window[-trim:len(self._window) - self._dnfs])
+        return (self._sum - trimmed) / (self.size - 2 * trim)
+
+
+class SessionStats:
+    """
+    Incremental statistics for a single puzzle history.
+    Every push/pop is O(log n); nothing re-scans the full list of times.
+    Mean, worst and standard deviation ignore DNFs, like csTimer.
+    """
+
+    def __init__(self, times=()):
+        self._times = array('d')
+        self._best = array('d')   # _best[i] == min(times[:i + 1])
+        self._worst = array('d')  # _worst[i] == max of the finite times[:i + 1], -inf if none
+        self._finite = 0
+        self._mean = 0.0
+        self._m2 = 0.0    # Welford's sum of squared deviations
+        self.averages = {size: RollingAverage(size) for size in AVERAGE_SIZES}
+
+        if len(times):
+            self._load(times)
+
+    def _load(self, times):
+        """Bulk initialisation, avoids per-solve bookkeeping when a long history is opened."""
+        self._times = array('d', times)
+        self._best = array('d', accumulate(self._times, min))
+        self._worst = array('d', accumulate((-math.inf if t == DNF else t for t in self._times), max))
+
+        finite = [t for t in self._times if t != DNF] if DNF in self._times else self._times
+        self._finite = len(finite)
+        if finite:
+            self._mean = math.fsum(finite) / len(finite)
+            mean = self._mean
+            self._m2 = math.fsum((t - mean) * (t - mean) for t in finite)
+
+        for avg in self.averages.values():
+            avg.load(self._times)
+
+    def push(self, new_time):
+        times = self._times
+        times.append(new_time)
+        n = len(times)
+
+        self._best.append(new_time if n == 1 else min(self._best[-1], new_time))
+        worst_candidate = -math.inf if new_time == DNF else new_time
+        self._worst.append(worst_candidate if n == 1 else max(self._worst[-1], worst_candidate))
+
+        if new_time != DNF:
+            self._finite += 1
+            delta = new_time - self._mean
+            self._mean += delta / self._finite
+            self._m2 += delta * (new_time - self._mean)
+
+        for size, avg in self.averages.items():
+            avg.add(new_time, times[-size - 1] if n > size else None)
+
+    def pop(self):
+        """Removes the most recent solve (used by delete_last_solve)."""
+        times = self._times
+        if not times:
+            return None
+
+        n = len(times)
+        removed = times[-1]
+        for size, avg in self.averages.items():
+            avg.undo(removed, times[-size - 1] if n > size else None)
+
+        times.pop()
+        self._best.pop()
+        self._worst.pop()
+
+        if removed != DNF:
+            k = self._finite
+            if k == 1:
+                self._mean = 0.0
+                self._m2 = 0.0
+            else:
+                prev_mean = (k * self._mean - removed) / (k - 1)
+                self._m2 = max(0.0, self._m2 - (removed - prev_mean) * (removed - self._mean))
+                self._mean = prev_mean
+            self._finite -= 1
+        return removed
+
+    def clear(self):
+        self._times = array('d')
+        self._best = array('d')
+        self._worst = array('d')
+        self._finite = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        for avg in self.averages.values():
+            avg.clear()
+
+    @property
+    def count(self):
+        return len(self._times)
+
+    @property
+    def mean(self):
+        return self._mean if self._finite else None
+
+    @property
+    def best(self):
+        return self._best[-1] if self._best else None
+
+    @property
+    def worst(self):
+        return self._worst[-1] if self._worst and self._worst[-1] != -math.inf else None
+
+    @property
+    def stdev(self):
+        if self._finite < 2:
+            return None
+        return math.sqrt(self._m2 / (self._finite - 1))
+
+    def average(self, size):
+        return self.averages[size].value
+
+    def summary(self):
+        best = self.best
+        return SessionSummary(self.count, self.mean, best if best != DNF else None)
+
+
+class TailStats:
+    """
+    SessionStats for a history that stays in the store (SolveDatabase).
+    Count, mean, best, worst and standard deviation start from the store's
+    aggregates; only the latest max(AVERAGE_SIZES) times are kept, which is
+    all the rolling averages need. push() is incremental like SessionStats;
+    pop() re-reads from `reload`, since the best and worst before the removed
+    solve are not known here, so the store must delete the solve first.
+
+    `aggregates` is (count, finite count, sum, sum of squares, min, max) over
+    the finite effective times, `tail` the latest times oldest first.
+    """
+
+    def __init__(self, aggregates, tail, reload=None):
+        self._reload = reload
+        self._keep = max(AVERAGE_SIZES)
+        self._set(aggregates, tail)
+
+    def _set(self, aggregates, tail):
+        count, finite, total, squares, best, worst = aggregates
+        self._count = count
+        self._finite = finite
+        self._mean = total / finite if finite else 0.0
+        self._m2 = max(0.0, squares - total * self._mean) if finite else 0.0
+        # Like SessionStats, the best of a session of DNFs only is DNF
+        self._best = best if best is not None else (DNF if count else None)
+        self._worst = worst
+        self._tail = list(tail[-self._keep:])
+        self.averages = {size: RollingAverage(size) for size in AVERAGE_SIZES}
+        for avg in self.averages.values():
+            avg.load(self._tail)
+
+    def push(self, new_time):
+        tail = self._tail
+        tail.append(new_time)
+        self._count += 1
+        self._best = new_time if self._best is None else min(self._best, new_time)
+
+        if new_time != DNF:
+            self._finite += 1
+            delta = new_time - self._mean
+            self._mean += delta / self._finite
+            self._m2 += delta * (new_time - self._mean)
+            self._worst = new_time if self._worst is None else max(self._worst, new_time)
+
+        n = len(tail)
+        for size, avg in self.averages.items():
+            avg.add(new_time, tail[-size - 1] if n > size else None)
+        if n > self._keep:
+            del tail[0]
+
+    def pop(self):
+        """Re-reads the stats once the store has deleted the latest solve."""
+        if not self._count:
+            return None
+        removed = self._tail[-1]
+        self._set(*self._reload())
+        return removed
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def mean(self):
+        return self._mean if self._finite else None
+
+    @property
+    def best(self):
+        return self._best
+
+    @property
+    def worst(self):
+        return self._worst
+
+    @property
+    def stdev(self):
+        if self._finite < 2:
+            return None
+        return math.sqrt(self._m2 / (self._finite - 1))
+
+    def average(self, size):
+        return self.averages[size].value
+
+    def summary(self):
+        best = self.best
+        return SessionSummary(self.count, self.mean, best if best != DNF else None)
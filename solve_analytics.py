@@ -0,0 +1,208 @@
+import math
+import time
+from array import array
+from collections import OrderedDict
+
+from session_stats import RollingAverage
+from solve_history import SolveSeries, PENALTY_PLUS_TWO, PENALTY_DNF, PLUS_TWO_MS
+from session_cache import DEFAULT_CAPACITY
+
+# Rolling series computed for every history; also drawn by the graph
+ROLLING_SIZES = (5, 12, 100)
+PERCENTILES = (10, 25, 50, 75, 90)
+HISTOGRAM_BINS = 20
+
+# Windows sorted per pass when computing rolling averages, bounds the scratch memory
+_ROLLING_CHUNK = 8192
+
+_numpy = None
+
+
+def _np():
+    """numpy, imported on first use so it never costs startup time."""
+    global _numpy
+    if _numpy is None:
+        import numpy
+        _numpy = numpy
+    return _numpy
+
+
+def numpy_available():
+    try:
+        _np()
+    except ImportError:
+        return False
+    return True
+
+
+def rolling_trimmed_means(times, size):
+    """
+    Trimmed average of every `size` consecutive solves, aligned to the last
+    solve of each window (NaN until the first window fills). Same trimming
+    as RollingAverage; DNFs (inf) sort to the top, so a window with more
+    DNFs than get trimmed averages to inf.
+    """
+    np = _np()
+    n = len(times)
+    result = np.full(n, np.nan)
+    if n < size:
+        return result
+    trim = RollingAverage(size).trim
+    windows = np.lib.stride_tricks.sliding_window_view(times, size)
+    for start in range(0, len(windows), _ROLLING_CHUNK):
+        chunk = np.sort(windows[start:start + _ROLLING_CHUNK], axis=1)
+        kept = chunk[:, trim:size - trim]
+        with np.errstate(invalid='ignore'):
+            result[size - 1 + start:size - 1 + start + len(chunk)] = kept.mean(axis=1)
+    return result
+
+
+def effective_times(history):
+    """history.effective_times() as a float64 array, with penalties applied in one vectorized pass."""
+    np = _np()
+    if isinstance(history, SolveSeries):
+        return np.frombuffer(history.times, dtype=np.float64).copy()
+    times = np.frombuffer(history.times, dtype=np.int64).astype(np.float64)
+    penalties = np.frombuffer(history.penalties, dtype=np.int8)
+    times[penalties == PENALTY_PLUS_TWO] += PLUS_TWO_MS
+    times[penalties == PENALTY_DNF] = np.inf
+    return times
+
+
+class HistoryAnalytics:
+    """
+    Everything derived from one version of a history, in vectorized passes.
+    update() brings it up to a later version of the same history: if solves
+    were only appended (base_version unchanged), the rolling series and the
+    per-day totals are only computed for the new solves; the O(n) summary
+    numbers, percentiles and histogram are redone.
+    """
+
+    def __init__(self, history, utc_offset=None):
+        np = _np()
+        self.utc_offset = time.localtime().tm_gmtoff if utc_offset is None else utc_offset
+        self.version = None
+        self.base_version = history.base_version
+        self.count = 0
+        self.rolling = {size: np.zeros(0) for size in ROLLING_SIZES}
+        self._day_totals = {}  # day number -> [solves, finite solves, finite sum, best]
+        self.update(history)
+
+    def can_update(self, history):
+        return history.base_version == self.base_version and len(history) >= self.count
+
+    def update(self, history):
+        """Takes in the solves appended since the last update; see can_update()."""
+        if history.version == self.version:
+            return
+        np = _np()
+        start = self.count
+        self.version = history.version
+        times = effective_times(history)
+        finite = times[np.isfinite(times)]
+
+        self.count = len(times)
+        self.dnfs = self.count - len(finite)
+        self.mean = float(finite.mean()) if len(finite) else None
+        self.stdev = float(finite.std(ddof=1)) if len(finite) > 1 else None
+        self.best = float(finite.min()) if len(finite) else None
+        self.worst = float(finite.max()) if len(finite) else None
+        self.percentiles = dict(zip(PERCENTILES, np.percentile(finite, PERCENTILES).tolist())) \
+            if len(finite) else {}
+
+        self.best_rolling = {}
+        for size in ROLLING_SIZES:
+            # The first new window starts size - 1 solves before the first new solve
+            lead = max(0, start - size + 1)
+            tail = rolling_trimmed_means(times[lead:], size)[start - lead:]
+            series = np.concatenate((self.rolling[size], tail))
+            self.rolling[size] = series
+            valid = series[np.isfinite(series)]
+            self.best_rolling[size] = float(valid.min()) if len(valid) else None
+
+        # Histogram of finite times in ms: counts and the HISTOGRAM_BINS + 1 bin edges
+        if len(finite):
+            self.histogram = np.histogram(finite, bins=HISTOGRAM_BINS)
+        else:
+            self.histogram = (np.zeros(0, dtype=np.int64), np.zeros(0))
+
+        timestamps = np.frombuffer(history.timestamps, dtype=np.float64)
+        self._add_days(np, timestamps[start:], times[start:])
+        self.days = self._days(np)
+        self._rolling_arrays = {}
+
+    def _add_days(self, np, timestamps, times):
+        # Solves imported from old versions have no timestamp
+        dated = timestamps > 0
+        if not dated.any():
+            return
+        day_numbers = np.floor((timestamps[dated] + self.utc_offset) / 86400).astype(np.int64)
+        day_times = times[dated]
+
+        order = np.argsort(day_numbers, kind='stable')
+        day_numbers = day_numbers[order]
+        day_times = day_times[order]
+        unique_days, starts, counts = np.unique(day_numbers, return_index=True, return_counts=True)
+
+        finite = np.isfinite(day_times)
+        finite_sums = np.add.reduceat(np.where(finite, day_times, 0.0), starts)
+        finite_counts = np.add.reduceat(finite.astype(np.int64), starts)
+        bests = np.minimum.reduceat(day_times, starts)
+
+        for day, count, total, finite_count, best in zip(
+                unique_days.tolist(), counts.tolist(), finite_sums.tolist(), finite_counts.tolist(), bests.tolist()):
+            totals = self._day_totals.get(day)
+            if totals is None:
+                self._day_totals[day] = [count, finite_count, total, best]
+            else:
+                totals[0] += count
+                totals[1] += finite_count
+                totals[2] += total
+                totals[3] = min(totals[3], best)
+
+    def _days(self, np):
+        """[(date 'YYYY-MM-DD', solves, mean of finite, best)] for every day with solves."""
+        day_numbers = sorted(self._day_totals)
+        dates = np.array(day_numbers, dtype='datetime64[D]').astype(str)
+        days = []
+        for date, day in zip(dates, day_numbers):
+            count, finite_count, total, best = self._day_totals[day]
+            mean = total / finite_count if finite_count else None
+            days.append((str(date), count, mean, best if math.isfinite(best) else None))
+        return days
+
+    def rolling_array(self, size):
+        """The rolling series as array('d'), the form the native graph draws from."""
+        values = self._rolling_arrays.get(size)
+        if values is None:
+            values = array('d', self.rolling[size].tobytes())
+            self._rolling_arrays[size] = values
+        return values
+
+
+class SolveAnalytics:
+    """
+    HistoryAnalytics per history name, brought up to date when that
+    history's version changes: extended if it was only appended to, else
+    rebuilt. Only the `capacity` most recently viewed are kept, as many as
+    the engine keeps sessions loaded.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._cache = OrderedDict()
+
+    def get(self, puzzle, history):
+        cached = self._cache.get(puzzle)
+        if cached is None or not cached.can_update(history):
+            cached = HistoryAnalytics(history)
+            self._cache[puzzle] = cached
+        else:
+            cached.update(history)
+        self._cache.move_to_end(puzzle)
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+        return cached
+
+    def clear(self):
+        self._cache.clear()
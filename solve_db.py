@@ -0,0 +1,498 @@
+import os
+import math
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+from solve_history import SolveHistory, SolveSeries, effective_time, PENALTY_NONE, PENALTY_PLUS_TWO, PENALTY_DNF
+from session_stats import SessionSummary, TailStats, AVERAGE_SIZES
+from profiler import profiled, profiler
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS solves (
+    id INTEGER PRIMARY KEY,
+    puzzle TEXT NOT NULL,
+    session TEXT NOT NULL DEFAULT '',
+    time_ms INTEGER NOT NULL,
+    penalty INTEGER NOT NULL DEFAULT 0,
+    timestamp REAL NOT NULL,
+    scramble TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_solves_puzzle_session ON solves (puzzle, session, id);
+CREATE INDEX IF NOT EXISTS idx_solves_timestamp ON solves (timestamp);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS session_totals (
+    puzzle TEXT NOT NULL,
+    session TEXT NOT NULL,
+    solves INTEGER NOT NULL,
+    finite INTEGER NOT NULL,
+    total REAL NOT NULL,
+    squares REAL NOT NULL,
+    best INTEGER,
+    worst INTEGER,
+    PRIMARY KEY (puzzle, session)
+);
+"""
+
+# SQLite's default limit on bound parameters is 999
+_QUERY_CHUNK = 900
+
+# Latest solves kept in memory per session: at least this many are selected,
+# at most twice the largest average are kept
+_RECENT_SELECT = 100
+_RECENT_KEEP = 2 * max(AVERAGE_SIZES)
+
+# A row's effective time in ms, NULL for a DNF; binds PENALTY_DNF, PENALTY_PLUS_TWO
+_EFFECTIVE_MS = "CASE WHEN penalty != ? THEN time_ms + (penalty = ?) * 2000 END"
+
+# session_totals rows recomputed from the solves table; binds PENALTY_DNF, PENALTY_PLUS_TWO
+_SUM_TOTALS = (
+    "SELECT puzzle, session, COUNT(*), COUNT(t), TOTAL(t), TOTAL(t * t), MIN(t), MAX(t) "
+    f"FROM (SELECT puzzle, session, {_EFFECTIVE_MS} AS t FROM solves) GROUP BY puzzle, session"
+)
+
+# One solve added to its session's totals; binds (puzzle, session, finite, total, squares, best, worst)
+_ADD_TOTALS = """
+INSERT INTO session_totals VALUES (?, ?, 1, ?, ?, ?, ?, ?)
+ON CONFLICT (puzzle, session) DO UPDATE SET
+    solves = solves + 1,
+    finite = finite + excluded.finite,
+    total = total + excluded.total,
+    squares = squares + excluded.squares,
+    best = COALESCE(MIN(best, excluded.best), best, excluded.best),
+    worst = COALESCE(MAX(worst, excluded.worst), worst, excluded.worst)
+"""
+
+_NO_TOTALS = (0, 0, 0.0, 0.0, None, None)
+
+
+class _DbScrambles:
+    """Scramble source for SolveHistory: looks scrambles up by row id."""
+
+    def __init__(self, database):
+        self.database = database
+
+    @profiled('SolveDatabase.read_scrambles', 'store')
+    def read_many(self, ids):
+        ids = list(ids)
+        profiler.count('store.scrambles_read', len(ids))
+        found = {}
+        for start in range(0, len(ids), _QUERY_CHUNK):
+            chunk = ids[start:start + _QUERY_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            found.update(self.database._query(
+                f"SELECT id, scramble FROM solves WHERE id IN ({placeholders})", chunk
+            ))
+        return [found.get(i, "") for i in ids]
+
+
+class SolveDatabase:
+    """
+    SQLite storage engine, a drop-in alternative to SolveLog.
+
+    One row per solve, WAL journal, indexed by (puzzle, session) and by
+    timestamp. Nothing is read at startup. Running totals per session
+    (count, sum, sum of squares, best, worst) live in session_totals and are
+    updated in the same transaction as every write, so stats() and the
+    session summaries read one row plus the latest solves whatever the
+    history size. The graph and analytics read a SolveSeries (effective
+    times and timestamps only); a session's full history is selected only
+    when history() asks for it (exports, the trainer), can be dropped again
+    with unload(), and scramble text is fetched only when a history's
+    scrambles are accessed. In-memory SolveHistory objects use the row id
+    where SolveLog keeps a scramble file offset.
+
+    Writes are applied in memory at once and committed by `worker` (a
+    PersistenceWorker) in the background; row ids are assigned here, so a
+    new solve needs nothing back from the database. The latest solves of
+    each session are kept in memory, so recent() after a solve is not a
+    query. Any other read commits the queued writes first.
+    """
+
+    def __init__(self, path, worker=None):
+        self.path = path
+        self.worker = worker
+        self.data = {}  # (puzzle, session) -> SolveHistory, only the ones selected so far
+        self._series = {}  # (puzzle, session) -> SolveSeries, only the ones selected so far
+        self._recent = {}  # (puzzle, session) -> [[(id, ms, penalty), ...] oldest first, whole session?]
+        self.current_puzzle = None
+        self.current_sessions = {}
+        self.conn = None
+        self._scrambles = None
+        self._next_id = 1
+
+        self._conn_lock = threading.RLock()  # one thread on the connection at a time
+        self._queue_lock = threading.Lock()  # guards _queued, never held during I/O
+        self._queued = []                    # writes waiting for the worker, run in one transaction
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    @profiled('SolveDatabase.load', 'store')
+    def load(self):
+        # Shared with the worker thread, _conn_lock keeps it to one thread at a time
+        self.conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL only fsyncs at checkpoints, a crash can lose the last commit but never corrupts
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._scrambles = _DbScrambles(self)
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'totals'").fetchone() is None:
+            # Database from before session_totals: one full pass, then never again
+            with self._transaction():
+                self._rebuild_totals()
+                self.conn.execute("INSERT INTO meta (key, value) VALUES ('totals', '1')")
+        self._next_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM solves").fetchone()[0]
+
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'current_puzzle'").fetchone()
+        self.current_puzzle = row[0] if row else None
+        self.current_sessions = {
+            key[len('session:'):]: value
+            for key, value in self.conn.execute("SELECT key, value FROM meta WHERE key LIKE 'session:%'")
+        }
+        return self.data
+
+    def _query(self, sql, params=()):
+        """All rows of a read; queued writes are committed first, so every read sees them."""
+        with self._conn_lock:
+            self._write_queued()
+            return self.conn.execute(sql, params).fetchall()
+
+    @profiled('SolveDatabase.history', 'store')
+    def history(self, puzzle, session=''):
+        """Returns the SolveHistory for a puzzle's session, selecting it from the database on first use."""
+        history = self.data.get((puzzle, session))
+        if history is None:
+            history = SolveHistory(self._scrambles)
+            rows = self._query(
+                "SELECT id, time_ms, penalty, timestamp FROM solves "
+                "WHERE puzzle = ? AND session = ? ORDER BY id",
+                (puzzle, session)
+            )
+            for row_id, time_ms, penalty, timestamp in rows:
+                history.append(time_ms, timestamp, penalty, row_id)
+            self.data[(puzzle, session)] = history
+            profiler.count('store.rows_read', len(history))
+        return history
+
+    @profiled('SolveDatabase.series', 'store')
+    def series(self, puzzle, session=''):
+        """The session's SolveSeries for graphs and analytics, selected on first use."""
+        series = self._series.get((puzzle, session))
+        if series is None:
+            history = self.data.get((puzzle, session))
+            if history is not None:
+                series = SolveSeries(history.effective_times(), history.timestamps)
+            else:
+                rows = self._query(
+                    "SELECT time_ms, penalty, timestamp FROM solves WHERE puzzle = ? AND session = ? ORDER BY id",
+                    (puzzle, session)
+                )
+                series = SolveSeries([effective_time(ms, penalty) for ms, penalty, _ in rows],
+                                     [timestamp for _, _, timestamp in rows])
+                profiler.count('store.rows_read', len(rows))
+            self._series[(puzzle, session)] = series
+        return series
+
+    def unload(self, puzzle, session):
+        """Frees a history and its series, they are selected again when next asked for."""
+        self.data.pop((puzzle, session), None)
+        self._series.pop((puzzle, session), None)
+        self._recent.pop((puzzle, session), None)
+
+    def solve_count(self, puzzle, session=''):
+        return self._totals(puzzle, session)[0]
+
+    @profiled('SolveDatabase.stats', 'store')
+    def stats(self, puzzle, session=''):
+        """TailStats of the session from its session_totals row and its latest solves."""
+        return TailStats(*self._stats_rows(puzzle, session), reload=partial(self._stats_rows, puzzle, session))
+
+    def _totals(self, puzzle, session):
+        rows = self._query(
+            "SELECT solves, finite, total, squares, best, worst FROM session_totals WHERE puzzle = ? AND session = ?",
+            (puzzle, session)
+        )
+        return rows[0] if rows else _NO_TOTALS
+
+    def _stats_rows(self, puzzle, session):
+        aggregates = self._totals(puzzle, session)
+        tail = [effective_time(ms, penalty) for ms, penalty in self.recent(puzzle, session, max(AVERAGE_SIZES))]
+        tail.reverse()
+        return aggregates, tail
+
+    def _latest(self, puzzle, session, count):
+        """The in-memory [(id, ms, penalty), ...] of the session's latest solves, selecting them if it is short."""
+        cached = self._recent.get((puzzle, session))
+        if cached is None or (len(cached[0]) < count and not cached[1]):
+            # Read backwards along the index
+            limit = max(count, _RECENT_SELECT)
+            rows = self._query(
+                "SELECT id, time_ms, penalty FROM solves WHERE puzzle = ? AND session = ? ORDER BY id DESC LIMIT ?",
+                (puzzle, session, limit)
+            )
+            profiler.count('store.rows_read', len(rows))
+            rows.reverse()
+            cached = [rows, len(rows) < limit]
+            self._recent[(puzzle, session)] = cached
+        return cached[0]
+
+    @profiled('SolveDatabase.recent', 'store')
+    def recent(self, puzzle, session, count):
+        """The latest `count` solves as (ms, penalty), newest first."""
+        latest = self._latest(puzzle, session, count)
+        return [(ms, penalty) for _, ms, penalty in reversed(latest[-count:])] if count else []
+
+    def last_scramble(self, puzzle, session=''):
+        latest = self._latest(puzzle, session, 1)
+        if not latest:
+            return None
+        rows = self._query("SELECT scramble FROM solves WHERE id = ?", (latest[-1][0],))
+        return rows[0][0] if rows else None
+
+    def puzzles(self):
+        """Puzzles with at least one solve in any session."""
+        return [row[0] for row in self._query("SELECT DISTINCT puzzle FROM session_totals")]
+
+    def sessions(self, puzzle):
+        """The puzzle's sessions with solves, plus the selected one."""
+        sessions = [row[0] for row in self._query(
+            "SELECT session FROM session_totals WHERE puzzle = ? ORDER BY session", (puzzle,))]
+        current = self.current_session(puzzle)
+        if current not in sessions:
+            sessions.append(current)
+        return sessions
+
+    def session_summaries(self, puzzle):
+        """{session: SessionSummary} for the puzzle's sessions with solves, from their session_totals rows."""
+        rows = self._query(
+            "SELECT session, solves, finite, total, best FROM session_totals WHERE puzzle = ?", (puzzle,)
+        )
+        return {session: SessionSummary(count, total / finite if finite else None, best)
+                for session, count, finite, total, best in rows}
+
+    def current_session(self, puzzle):
+        return self.current_sessions.get(puzzle, '')
+
+    # --- Writing ---
+
+    def _queue(self, write):
+        """Has write() run on the worker thread, in one transaction with whatever is queued with it."""
+        with self._queue_lock:
+            self._queued.append(write)
+        if self.worker is None:
+            self.flush()
+        else:
+            self.worker.submit(('solves', self.path), self.flush)
+
+    def flush(self):
+        """Commits the queued writes now."""
+        with self._conn_lock:
+            self._write_queued()
+
+    @profiled('SolveDatabase.write', 'store')
+    def _write_queued(self):
+        with self._queue_lock:
+            writes, self._queued = self._queued, []
+        if writes and self.conn is not None:
+            with self._transaction():
+                for write in writes:
+                    write()
+
+    @contextmanager
+    def _transaction(self):
+        self.conn.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    @profiled('SolveDatabase.add_solve', 'store')
+    def add_solve(self, puzzle, solve_time, scramble, timestamp=None, penalty=PENALTY_NONE, session=''):
+        """solve_time is in integer milliseconds, timestamp in epoch seconds."""
+        if timestamp is None:
+            timestamp = time.time()
+        row_id = self._next_id
+        self._next_id += 1
+        self._queue(partial(self._insert_solve, (row_id, puzzle, session, solve_time, penalty, timestamp, scramble)))
+        # Only what is already selected is kept in step, adding never loads anything
+        history = self.data.get((puzzle, session))
+        if history is not None:
+            history.append(solve_time, timestamp, penalty, row_id, scramble)
+        series = self._series.get((puzzle, session))
+        if series is not None:
+            series.append(effective_time(solve_time, penalty), timestamp)
+        cached = self._recent.get((puzzle, session))
+        if cached is not None:
+            cached[0].append((row_id, solve_time, penalty))
+            if len(cached[0]) > _RECENT_KEEP:
+                del cached[0][:len(cached[0]) - _RECENT_KEEP]
+                cached[1] = False
+        profiler.count('store.appends')
+
+    def _insert_solve(self, row):
+        _, puzzle, session, solve_time, penalty, _, _ = row
+        self.conn.execute(
+            "INSERT INTO solves (id, puzzle, session, time_ms, penalty, timestamp, scramble) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            row
+        )
+        effective = effective_time(solve_time, penalty)
+        t = None if effective == math.inf else effective
+        self.conn.execute(_ADD_TOTALS, (puzzle, session, t is not None, t or 0, (t or 0) ** 2, t, t))
+
+    @profiled('SolveDatabase.delete_last', 'store')
+    def delete_last(self, puzzle, session=''):
+        latest = self._latest(puzzle, session, 1)
+        if not latest:
+            return
+        row_id, solve_time, penalty = latest.pop()
+        self._queue(partial(self._delete_solve, row_id, puzzle, session, effective_time(solve_time, penalty)))
+        history = self.data.get((puzzle, session))
+        if history is not None and len(history):
+            history.pop()
+        series = self._series.get((puzzle, session))
+        if series is not None and len(series):
+            series.pop()
+
+    def _delete_solve(self, row_id, puzzle, session, effective):
+        self.conn.execute("DELETE FROM solves WHERE id = ?", (row_id,))
+        key = (puzzle, session)
+        if effective == math.inf:
+            self.conn.execute("UPDATE session_totals SET solves = solves - 1 WHERE puzzle = ? AND session = ?", key)
+        else:
+            self.conn.execute(
+                "UPDATE session_totals SET solves = solves - 1, finite = finite - 1, total = total - ?, "
+                "squares = squares - ? WHERE puzzle = ? AND session = ?",
+                (effective, effective * effective) + key
+            )
+            best, worst = self.conn.execute(
+                "SELECT best, worst FROM session_totals WHERE puzzle = ? AND session = ?", key
+            ).fetchone()
+            if effective in (best, worst):
+                # Only removing the best or worst solve costs a pass over the session
+                self.conn.execute(
+                    "UPDATE session_totals SET (best, worst) = "
+                    f"(SELECT MIN(t), MAX(t) FROM (SELECT {_EFFECTIVE_MS} AS t FROM solves "
+                    "WHERE puzzle = ? AND session = ?)) WHERE puzzle = ? AND session = ?",
+                    (PENALTY_DNF, PENALTY_PLUS_TWO) + key + key
+                )
+        self.conn.execute("DELETE FROM session_totals WHERE puzzle = ? AND session = ? AND solves <= 0", key)
+
+    def _rebuild_totals(self):
+        self.conn.execute("DELETE FROM session_totals")
+        self.conn.execute(f"INSERT INTO session_totals {_SUM_TOTALS}", (PENALTY_DNF, PENALTY_PLUS_TWO))
+
+    @profiled('SolveDatabase.reset', 'store')
+    def reset(self):
+        self._queue(self._delete_all)
+        for history in self.data.values():
+            history.clear()
+        self._series.clear()
+        self._recent.clear()
+
+    def _delete_all(self):
+        self.conn.execute("DELETE FROM solves")
+        self.conn.execute("DELETE FROM session_totals")
+
+    def drop_session(self, puzzle, session):
+        """Deletes every solve of the session."""
+        self._queue(partial(self._delete_session, puzzle, session))
+        history = self.data.pop((puzzle, session), None)
+        if history is not None:
+            history.clear()
+        self._series.pop((puzzle, session), None)
+        self._recent[(puzzle, session)] = [[], True]
+
+    def _delete_session(self, puzzle, session):
+        self.conn.execute("DELETE FROM solves WHERE puzzle = ? AND session = ?", (puzzle, session))
+        self.conn.execute("DELETE FROM session_totals WHERE puzzle = ? AND session = ?", (puzzle, session))
+
+    def _set_meta(self, key, value):
+        if value is None:
+            self.conn.execute("DELETE FROM meta WHERE key = ?", (key,))
+        else:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @profiled('SolveDatabase.set_current_puzzle', 'store')
+    def set_current_puzzle(self, puzzle):
+        if puzzle != self.current_puzzle:
+            self.current_puzzle = puzzle
+            self._queue(partial(self._set_meta, 'current_puzzle', puzzle))
+
+    def set_current_session(self, puzzle, session):
+        if session == self.current_session(puzzle):
+            return
+        if session:
+            self.current_sessions[puzzle] = session
+        else:
+            self.current_sessions.pop(puzzle, None)
+        self._queue(partial(self._set_meta, 'session:' + puzzle, session or None))
+
+    def _insert_rows(self, rows):
+        with self._conn_lock:
+            self._write_queued()
+            with self._transaction():
+                self.conn.executemany(
+                    "INSERT INTO solves (puzzle, session, time_ms, penalty, timestamp, scramble) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                # A bulk import may touch any session, one grouped pass is cheaper than a row at a time
+                self._rebuild_totals()
+            self._next_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM solves").fetchone()[0]
+        # Loaded histories no longer match the table, reselect on next use
+        self.data.clear()
+        self._series.clear()
+        self._recent.clear()
+
+    def import_data(self, data, current_puzzle=None):
+        """Seeds the database from an old {'times': [...], 'scrambles': [...]} dict (JsonStore data)."""
+        self._insert_rows(
+            (puzzle, '', round(solve_time * 1000), PENALTY_NONE, 0.0, scramble)
+            for puzzle, entry in data.items()
+            for solve_time, scramble in zip(entry['times'], entry['scrambles'])
+        )
+        if current_puzzle is not None:
+            self.set_current_puzzle(current_puzzle)
+
+    def import_solves(self, solves):
+        """Bulk-inserts (puzzle, ms, timestamp, penalty, scramble, session) tuples from any iterable."""
+        count = 0
+
+        def rows():
+            nonlocal count
+            for puzzle, solve_time, timestamp, penalty, scramble, session in solves:
+                count += 1
+                yield puzzle, session, solve_time, penalty, timestamp, scramble
+
+        self._insert_rows(rows())
+        profiler.count('store.appends', count)
+        return count
+
+    def import_histories(self, histories, current_puzzle=None, current_sessions=None):
+        """Copies {(puzzle, session): SolveHistory} (e.g. a SolveLog's data) into the database."""
+        self._insert_rows(
+            (puzzle, session, solve_time, penalty, timestamp, scramble)
+            for (puzzle, session), history in histories.items()
+            for solve_time, timestamp, penalty, scramble in zip(
+                history.times, history.timestamps, history.penalties, history.scrambles)
+        )
+        if current_puzzle is not None:
+            self.set_current_puzzle(current_puzzle)
+        for puzzle, session in (current_sessions or {}).items():
+            self.set_current_session(puzzle, session)
+
+    def close(self):
+        with self._conn_lock:
+            if self.conn is not None:
+                self._write_queued()
+                self.conn.close()
+                self.conn = None
@@ -0,0 +1,104 @@
+import math
+from collections import OrderedDict
+
+from session_cache import DEFAULT_CAPACITY
+from profiler import profiler
+
+
+class SolveGraph:
+    """
+    Renders solve histories with matplotlib, into Kivy textures or image files.
+
+    One figure, axes and line artist are built once and reused; each render
+    only swaps the line data and hands the Agg RGBA buffer straight to a
+    texture (no PNG encode/decode). Textures are cached per puzzle and reused
+    until that puzzle's history version changes, for the `capacity` most
+    recently shown. matplotlib itself is only imported on the first render.
+    """
+
+    def __init__(self, figsize=(6, 4), dpi=100, capacity=DEFAULT_CAPACITY):
+        self.figsize = figsize
+        self.dpi = dpi
+        self.capacity = capacity
+        self._figure = None
+        self._canvas = None
+        self._axes = None
+        self._line = None
+        self._cache = OrderedDict()  # puzzle -> (history version, texture), least recently shown first
+
+    def _build(self):
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.style
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        with matplotlib.style.context('bmh'):
+            figure = Figure(figsize=self.figsize, dpi=self.dpi)
+            self._canvas = FigureCanvasAgg(figure)
+            axes = figure.add_subplot(111)
+            self._line, = axes.plot([], [], marker='o', linestyle='-', color='cyan')
+
+        axes.set_xlabel("Solve #", color='white')
+        axes.set_ylabel("Time (s)", color='white')
+        axes.tick_params(axis='x', colors='white')
+        axes.tick_params(axis='y', colors='white')
+        axes.set_title(" ", color='white')
+
+        figure.set_facecolor('#111111')
+        axes.set_facecolor('#111111')
+        figure.tight_layout()
+
+        self._figure = figure
+        self._axes = axes
+
+    def _plot(self, puzzle, history):
+        if self._figure is None:
+            self._build()
+
+        times = history.effective_times()
+        # DNFs become gaps in the line
+        self._line.set_data(range(1, len(times) + 1), [t / 1000 if t != math.inf else math.nan for t in times])
+        self._axes.set_title(f"{puzzle} Solve History", color='white')
+        self._axes.relim()
+        self._axes.autoscale_view()
+
+    def draw(self, puzzle, history):
+        """Rasterizes the plot, returns (RGBA buffer, (width, height)). Needs no window."""
+        self._plot(puzzle, history)
+        self._canvas.draw()
+        return self._canvas.buffer_rgba(), self._canvas.get_width_height()
+
+    def render(self, puzzle, history):
+        cached = self._cache.get(puzzle)
+        if cached and cached[0] == history.version:
+            self._cache.move_to_end(puzzle)
+            return cached[1]
+
+        # Only rendering to a texture needs Kivy, draw() and export() also run headless
+        from kivy.graphics.texture import Texture
+
+        buffer, (width, height) = self.draw(puzzle, history)
+        profiler.count('graph.redraws')
+
+        texture = cached[1] if cached else None
+        if texture is None or texture.size != (width, height):
+            texture = Texture.create(size=(width, height), colorfmt='rgba')
+            # Agg rows run top to bottom, Kivy textures bottom to top
+            texture.flip_vertical()
+        texture.blit_buffer(buffer, colorfmt='rgba', bufferfmt='ubyte')
+
+        self._cache[puzzle] = (history.version, texture)
+        self._cache.move_to_end(puzzle)
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+        return texture
+
+    def export(self, puzzle, history, path):
+        """Writes the plot to an image file, format taken from the extension."""
+        self._plot(puzzle, history)
+        self._figure.savefig(path, facecolor=self._figure.get_facecolor())
+        return path
+
+    def clear(self):
+        self._cache.clear()
@@ -0,0 +1,284 @@
+import os
+import sys
+import math
+import threading
+import itertools
+from array import array
+
+from profiler import profiled, profiler
+
+# Penalty codes stored per solve
+PENALTY_NONE = 0
+PENALTY_PLUS_TWO = 1
+PENALTY_DNF = 2
+
+PLUS_TWO_MS = 2000
+
+# History versions are drawn from one counter, so a history created later
+# (e.g. after a session is dropped or unloaded) never repeats an old one's version
+_versions = itertools.count(1)
+
+
+def effective_time(ms, penalty):
+    """Time that counts for stats: +2 adds two seconds, DNF is infinite."""
+    if penalty == PENALTY_DNF:
+        return math.inf
+    if penalty == PENALTY_PLUS_TWO:
+        return ms + PLUS_TWO_MS
+    return ms
+
+
+class ScrambleFile:
+    """
+    Append-only text file holding every recorded scramble, one per line.
+    Solves only keep the byte offset of their scramble, so histories stay
+    small in memory and scramble text is read back only when asked for.
+
+    append() only buffers the line (its offset is known up front); flush()
+    writes the buffer, normally from SolveLog's writer thread. Reads and
+    syncs flush first. Resetting is split the same way: discard() restarts
+    the offsets at once, truncate() empties the file later.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._end = 0
+        self._pending = []
+        self._truncating = 0  # discard()s the file has not been truncated for yet
+        self._lock = threading.Lock()
+
+    def open(self):
+        if self._file is None:
+            self._file = open(self.path, 'ab')
+            self._file.seek(0, os.SEEK_END)
+            self._end = self._file.tell()
+
+    def append(self, scramble):
+        return self.append_many([scramble])[0]
+
+    def append_many(self, scrambles):
+        """Buffers the scrambles and returns their offsets."""
+        lines = [scramble.replace('\n', ' ').encode('utf-8') + b'\n' for scramble in scrambles]
+        offsets = []
+        with self._lock:
+            offset = self._end
+            for line in lines:
+                offsets.append(offset)
+                offset += len(line)
+            self._end = offset
+            self._pending.extend(lines)
+        return offsets
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        # Until the file is truncated the buffer can't go after its old contents
+        if self._pending and self._file and not self._truncating:
+            self._file.write(b''.join(self._pending))
+            self._file.flush()
+            self._pending = []
+
+    @profiled('ScrambleFile.read_many', 'store')
+    def read_many(self, offsets):
+        if not len(offsets):
+            return []
+        profiler.count('store.scrambles_read', len(offsets))
+        with self._lock:
+            if self._truncating:
+                # Everything since the discard is still buffered, starting at offset 0
+                start, blob = 0, b''.join(self._pending)
+            else:
+                self._flush_locked()
+                blob = None
+        if blob is None:
+            # Only the span the offsets cover is read, so slices of a history stay cheap
+            start = min(offsets)
+            with open(self.path, 'rb') as f:
+                f.seek(start)
+                blob = f.read(max(offsets) - start)
+                blob += f.readline()
+        scrambles = []
+        for offset in offsets:
+            offset -= start
+            end = blob.find(b'\n', offset)
+            scrambles.append(blob[offset:end].decode('utf-8'))
+        return scrambles
+
+    def discard(self):
+        """
+        Forgets every scramble: new ones get offsets from 0 at once, but stay
+        buffered until truncate() has emptied the file.
+        """
+        with self._lock:
+            self._pending = []
+            self._end = 0
+            self._truncating += 1
+
+    def truncate(self):
+        """Empties the file after a discard(), once nothing on disk refers to the old scrambles."""
+        with self._lock:
+            self._file.seek(0)
+            self._file.truncate()
+            self._truncating -= 1
+
+    def sync(self):
+        with self._lock:
+            if not self._file:
+                return
+            self._flush_locked()
+            # A duplicate descriptor is fsynced after the lock is released, so
+            # appends never wait on the disk
+            fd = os.dup(self._file.fileno())
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._flush_locked()
+                self._file.close()
+                self._file = None
+
+
+class SolveHistory:
+    """
+    Columnar solve history for one puzzle.
+    Times (integer milliseconds), timestamps, penalties and scramble offsets live in typed arrays
+    (8-9 bytes per column entry instead of a boxed float per value); the
+    scramble strings are loaded from the ScrambleFile on first access.
+    `version` changes on every mutation and is unique across all histories,
+    so views can cache derived data by it. `base_version` only changes when
+    existing solves change (pop, clear, load); while it stays the same the
+    history has only been appended to.
+    """
+
+    __slots__ = ('times', 'timestamps', 'penalties', 'scramble_offsets', 'version', 'base_version',
+                 '_scrambles', '_scramble_file')
+
+    def __init__(self, scramble_file=None):
+        self.times = array('q')
+        self.timestamps = array('d')
+        self.penalties = array('b')
+        self.scramble_offsets = array('q')
+        self.version = self.base_version = next(_versions)
+        # Without a scramble file the text is kept in memory from the start
+        self._scrambles = [] if scramble_file is None else None
+        self._scramble_file = scramble_file
+
+    def __len__(self):
+        return len(self.times)
+
+    def append(self, solve_time, timestamp, penalty, scramble_offset, scramble=None):
+        self.times.append(solve_time)
+        self.timestamps.append(timestamp)
+        self.penalties.append(penalty)
+        self.scramble_offsets.append(scramble_offset)
+        self.version = next(_versions)
+        if self._scrambles is not None:
+            if self._scramble_file is None:
+                self._scrambles.append(scramble or '')
+            elif scramble is None:
+                # Replayed record, text not at hand: reload on next access
+                self._scrambles = None
+            else:
+                self._scrambles.append(scramble)
+
+    def pop(self):
+        self.timestamps.pop()
+        self.penalties.pop()
+        self.scramble_offsets.pop()
+        self.version = self.base_version = next(_versions)
+        if self._scrambles:
+            self._scrambles.pop()
+        return self.times.pop()
+
+    def clear(self):
+        self.times = array('q')
+        self.timestamps = array('d')
+        self.penalties = array('b')
+        self.scramble_offsets = array('q')
+        self.version = self.base_version = next(_versions)
+        self._scrambles = [] if self._scramble_file is None else None
+
+    def effective_times(self):
+        """Times with penalties applied, as array('d') (DNF is inf)."""
+        if self.penalties.count(PENALTY_NONE) == len(self.penalties):
+            return array('d', self.times)
+        return array('d', map(effective_time, self.times, self.penalties))
+
+    @property
+    def scrambles(self):
+        if self._scrambles is None:
+            if self._scramble_file is None:
+                self._scrambles = [''] * len(self.times)
+            else:
+                self._scrambles = self._scramble_file.read_many(self.scramble_offsets)
+        return self._scrambles
+
+    def scramble_range(self, start, stop):
+        """Scrambles of solves [start:stop] without loading the rest."""
+        if self._scrambles is not None or self._scramble_file is None:
+            return self.scrambles[start:stop]
+        return self._scramble_file.read_many(self.scramble_offsets[start:stop])
+
+    # --- Binary snapshot helpers ---
+
+    def columns(self):
+        """Copies of the columns, safe to hand to a background writer."""
+        return (array('q', self.times), array('d', self.timestamps),
+                array('b', self.penalties), array('q', self.scramble_offsets))
+
+    @staticmethod
+    def write_columns(f, columns):
+        for column in columns:
+            column.tofile(f)
+
+    def read_columns(self, f, count, byteorder=sys.byteorder, times_typecode='q'):
+        # Snapshots written before times were integer ms hold float seconds
+        times = array(times_typecode)
+        for column in (times, self.timestamps, self.penalties, self.scramble_offsets):
+            column.fromfile(f, count)
+            if byteorder != sys.byteorder:
+                column.byteswap()
+        if times_typecode == 'q':
+            self.times.extend(times)
+        else:
+            self.times.extend(round(t * 1000) for t in times)
+        self.version = self.base_version = next(_versions)
+
+
+class SolveSeries:
+    """
+    What graphs and analytics read of a session: effective times (DNF is
+    inf) and timestamps, with SolveHistory's version/base_version contract.
+    SolveDatabase selects it without ids, penalties or scrambles and keeps it
+    in step with added and deleted solves.
+    """
+
+    __slots__ = ('times', 'timestamps', 'version', 'base_version')
+
+    def __init__(self, times=(), timestamps=()):
+        self.times = array('d', times)
+        self.timestamps = array('d', timestamps)
+        self.version = self.base_version = next(_versions)
+
+    def __len__(self):
+        return len(self.times)
+
+    def append(self, effective, timestamp):
+        self.times.append(effective)
+        self.timestamps.append(timestamp)
+        self.version = next(_versions)
+
+    def pop(self):
+        self.timestamps.pop()
+        self.version = self.base_version = next(_versions)
+        return self.times.pop()
+
+    def effective_times(self):
+        return array('d', self.times)
@@ -0,0 +1,639 @@
+import os
+import sys
+import glob
+import json
+import math
+import time
+import threading
+
+from solve_history import SolveHistory, ScrambleFile, effective_time, PENALTY_NONE
+from session_stats import SessionStats, SessionSummary
+from profiler import profiled, profiler
+
+SNAPSHOT_MAGIC = b'RCSNAP3\n'
+# Version 2 had no per-history offsets or totals, version 1 also stored times as float seconds
+SNAPSHOT_MAGIC_V2 = b'RCSNAP2\n'
+SNAPSHOT_MAGIC_V1 = b'RCSNAP1\n'
+
+# Snapshot bytes per solve: times, timestamps, penalties, scramble offsets
+_ROW_BYTES = 8 + 8 + 1 + 8
+
+# Queued after a reset record: the writer truncates the scramble file once that record is on disk
+_TRUNCATE_SCRAMBLES = object()
+
+
+class SolveLog:
+    """
+    Append-only storage for solve history.
+
+    Every change (new solve, delete, reset, puzzle switch) is written as one
+    JSON line to the active log segment, so saving costs the same few bytes
+    no matter how long the history is. Records are applied in memory at once
+    and written by a background writer thread, so no disk I/O happens on the
+    caller's (UI) thread. Once a segment grows past `compact_every` records,
+    the writer thread starts a new segment and copies the columns, and a
+    background thread folds them into a snapshot file and drops the old
+    segments. Segments are fsynced on a timer instead of on every write.
+
+    Histories are kept per (puzzle, session); '' is each puzzle's default
+    session. The snapshot header holds each history's byte offset and
+    running totals (count, finite count, sum, best), so loading reads the
+    header and decodes only the histories the segments touch; any other is
+    decoded on its first history() call. unload() frees a history that still
+    matches the snapshot; one changed since is freed once the next
+    compaction has written it. Totals are kept for every session, so
+    summaries and counts never decode one.
+
+    Layout on disk (for base 'cube_timer_solves'):
+        cube_timer_solves.snap       binary columnar snapshot, covers segments <= its generation
+        cube_timer_solves.<n>.log    log segments, replayed in order on load
+        cube_timer_solves.scr        scramble text, referenced by byte offset
+    """
+
+    def __init__(self, base_path, fsync_interval=2.0, compact_every=500):
+        self.base_path = base_path
+        self.snapshot_path = base_path + '.snap'
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        self.scramble_file = ScrambleFile(base_path + '.scr')
+
+        self.data = {}              # (puzzle, session) -> SolveHistory, only the decoded ones
+        self._stored = {}           # (puzzle, session) -> (offset, count) of its columns in the snapshot
+        self._clean = {}            # (puzzle, session) -> version of the history that matches the snapshot
+        self._totals = {}           # (puzzle, session) -> [count, finite count, sum, best] of every session
+        self._evicted = set()       # unloaded while changed, freed after the next compaction
+        self._snapshot_start = 0    # where the columns start in the snapshot file
+        self.current_puzzle = None
+        self.current_sessions = {}  # puzzle -> selected session, only if not ''
+
+        self._lock = threading.Lock()          # guards the segment file
+        self._data_lock = threading.RLock()    # guards the histories while the writer copies them
+        self._pending_lock = threading.Lock()  # guards _pending, never held during I/O
+        self._pending = []                     # log lines waiting for the writer thread
+        self._file = None
+        self._generation = 0
+        self._records = 0
+        self._dirty = False
+        self._compacting = False
+        self._compact_wanted = False
+
+        self._stop_event = threading.Event()
+        self._write_event = threading.Event()
+        self._sync_thread = None
+        self._writer_thread = None
+
+    # --- Loading ---
+
+    def _segment_path(self, generation):
+        return f"{self.base_path}.{generation}.log"
+
+    def _segments(self):
+        segments = []
+        for path in glob.glob(glob.escape(self.base_path) + '.*.log'):
+            try:
+                segments.append(int(path[len(self.base_path) + 1:-4]))
+            except ValueError:
+                continue
+        return sorted(segments)
+
+    def exists(self):
+        return os.path.exists(self.snapshot_path) or bool(self._segments())
+
+    @profiled('SolveLog.load', 'store')
+    def load(self):
+        """Reads the snapshot, replays newer segments and opens a fresh segment."""
+        self.scramble_file.open()
+
+        snapshot_gen = 0
+        if os.path.exists(self.snapshot_path):
+            snapshot_gen = self._read_snapshot()
+
+        last_gen = snapshot_gen
+        for gen in self._segments():
+            path = self._segment_path(gen)
+            if gen <= snapshot_gen:
+                # Already folded into the snapshot by an earlier compaction
+                os.remove(path)
+                continue
+            self._replay(path)
+            last_gen = gen
+
+        self._open_segment(last_gen + 1)
+        self._start_sync_thread()
+        self._start_writer_thread()
+        return self.data
+
+    def _read_snapshot(self):
+        with open(self.snapshot_path, 'rb') as f:
+            magic = f.readline()
+            if magic not in (SNAPSHOT_MAGIC, SNAPSHOT_MAGIC_V2, SNAPSHOT_MAGIC_V1):
+                raise ValueError(f"{self.snapshot_path} is not a solve snapshot")
+            header = json.loads(f.readline())
+            self.current_puzzle = header.get('current_puzzle')
+            self.current_sessions = dict(header.get('sessions', {}))
+            self._snapshot_start = f.tell()
+            if magic == SNAPSHOT_MAGIC:
+                # [puzzle, session, count, offset, finite count, sum, best]
+                for puzzle, session, count, offset, finite, total, best in header['histories']:
+                    self._stored[(puzzle, session)] = (offset, count)
+                    self._totals[(puzzle, session)] = [count, finite, total, best]
+                if header['byteorder'] != sys.byteorder:
+                    # Moved from another machine: decoded now, the next snapshot is native again
+                    for key in list(self._stored):
+                        self._decode(key, header['byteorder'])
+                return header['generation']
+            # Older snapshots are decoded whole; the next compaction rewrites them as version 3
+            times_typecode = 'q' if magic == SNAPSHOT_MAGIC_V2 else 'd'
+            # [puzzle, count] for default sessions, [puzzle, count, session] otherwise
+            for entry in header['puzzles']:
+                key = (entry[0], entry[2] if len(entry) > 2 else '')
+                history = self.history(*key)
+                history.read_columns(f, entry[1], header['byteorder'], times_typecode)
+                self._totals[key] = self._summed(history)
+        return header['generation']
+
+    def history(self, puzzle, session=''):
+        """
+        Returns the SolveHistory for a puzzle's session, decoding it from the
+        snapshot on first use, or creating an empty one if it has no solves.
+        """
+        key = (puzzle, session)
+        history = self.data.get(key)
+        if history is None:
+            with self._data_lock:
+                history = self.data.get(key)
+                if history is None:
+                    if key in self._stored:
+                        history = self._decode(key)
+                    else:
+                        history = self.data[key] = SolveHistory(self.scramble_file)
+        if self._evicted:
+            self._evicted.discard(key)
+        return history
+
+    @profiled('SolveLog.decode', 'store')
+    def _decode(self, key, byteorder=sys.byteorder):
+        # Needs _data_lock
+        offset, count = self._stored[key]
+        history = SolveHistory(self.scramble_file)
+        with open(self.snapshot_path, 'rb') as f:
+            f.seek(self._snapshot_start + offset)
+            history.read_columns(f, count, byteorder)
+        self.data[key] = history
+        self._clean[key] = history.version
+        profiler.count('store.rows_read', count)
+        return history
+
+    def histories(self):
+        """{(puzzle, session): SolveHistory} of every session with solves, decoding them all."""
+        return {key: self.history(*key) for key, totals in list(self._totals.items()) if totals[0]}
+
+    def series(self, puzzle, session=''):
+        """What graphs and analytics read; the history itself, it is in memory anyway."""
+        return self.history(puzzle, session)
+
+    def solve_count(self, puzzle, session=''):
+        totals = self._totals.get((puzzle, session))
+        return totals[0] if totals else 0
+
+    def stats(self, puzzle, session=''):
+        """SessionStats of the session, built from its history in memory."""
+        return SessionStats(self.history(puzzle, session).effective_times())
+
+    def recent(self, puzzle, session, count):
+        """The latest `count` solves as (ms, penalty), newest first."""
+        history = self.history(puzzle, session)
+        recent = list(zip(history.times[-count:], history.penalties[-count:]))
+        recent.reverse()
+        return recent
+
+    def last_scramble(self, puzzle, session=''):
+        history = self.history(puzzle, session)
+        count = len(history)
+        return history.scramble_range(count - 1, count)[0] if count else None
+
+    def puzzles(self):
+        """Puzzles with at least one solve in any session."""
+        return list(dict.fromkeys(puzzle for (puzzle, _), totals in self._totals.items() if totals[0]))
+
+    def sessions(self, puzzle):
+        """The puzzle's sessions with solves, plus the selected one."""
+        sessions = [session for (key, session), totals in self._totals.items() if key == puzzle and totals[0]]
+        current = self.current_session(puzzle)
+        if current not in sessions:
+            sessions.append(current)
+        return sessions
+
+    def session_summaries(self, puzzle):
+        """{session: SessionSummary} for the puzzle's sessions with solves, from their totals."""
+        return {session: SessionSummary(count, total / finite if finite else None, best)
+                for (key, session), (count, finite, total, best) in self._totals.items() if key == puzzle and count}
+
+    def current_session(self, puzzle):
+        return self.current_sessions.get(puzzle, '')
+
+    def unload(self, puzzle, session):
+        """
+        Frees a history, history() decodes it from the snapshot again. One
+        changed since the snapshot is only freed after the next compaction.
+        """
+        key = (puzzle, session)
+        with self._data_lock:
+            history = self.data.get(key)
+            if history is None:
+                return
+            if key in self._stored and self._clean.get(key) == history.version:
+                del self.data[key]
+            elif not len(history) and key not in self._stored:
+                del self.data[key]
+            else:
+                self._evicted.add(key)
+
+    # --- Totals ---
+
+    @staticmethod
+    def _summed(history):
+        times = history.effective_times()
+        finite = [t for t in times if t != math.inf]
+        return [len(times), len(finite), math.fsum(finite), min(finite) if finite else None]
+
+    def _count(self, key, effective):
+        totals = self._totals.get(key)
+        if totals is None:
+            totals = self._totals[key] = [0, 0, 0.0, None]
+        totals[0] += 1
+        if effective != math.inf:
+            totals[1] += 1
+            totals[2] += effective
+            if totals[3] is None or effective < totals[3]:
+                totals[3] = effective
+
+    def _uncount(self, key, effective, history):
+        totals = self._totals.get(key)
+        if totals is None:
+            return
+        if not len(history):
+            del self._totals[key]
+            return
+        totals[0] -= 1
+        if effective != math.inf:
+            totals[1] -= 1
+            totals[2] -= effective
+            if effective == totals[3]:
+                # Only removing the best solve costs a pass over the session
+                totals[:] = self._summed(history)
+
+    def _replay(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn final line from a crash mid-write
+                    break
+                self._apply(record)
+
+    def _apply(self, record, scramble=None):
+        op = record[0]
+        # The session is appended to 'add' and 'pop' only when it isn't the default
+        if op == 'add':
+            _, puzzle, solve_time, timestamp, penalty, offset = record[:6]
+            if isinstance(solve_time, float):
+                # Logged before times were integer milliseconds
+                solve_time = round(solve_time * 1000)
+            session = record[6] if len(record) > 6 else ''
+            self.history(puzzle, session).append(solve_time, timestamp, penalty, offset, scramble)
+            self._count((puzzle, session), effective_time(solve_time, penalty))
+        elif op == 'pop':
+            key = (record[1], record[2] if len(record) > 2 else '')
+            history = self.history(*key) if key in self._totals else None
+            if history:
+                effective = effective_time(history.times[-1], history.penalties[-1])
+                history.pop()
+                self._uncount(key, effective, history)
+        elif op == 'reset':
+            for history in self.data.values():
+                history.clear()
+            self._stored.clear()
+            self._totals.clear()
+        elif op == 'puzzle':
+            self.current_puzzle = record[1]
+        elif op == 'session':
+            if record[2]:
+                self.current_sessions[record[1]] = record[2]
+            else:
+                self.current_sessions.pop(record[1], None)
+        elif op == 'drop':
+            key = (record[1], record[2])
+            history = self.data.pop(key, None)
+            if history is not None:
+                history.clear()
+            self._stored.pop(key, None)
+            self._totals.pop(key, None)
+
+    # --- Writing ---
+
+    def _open_segment(self, generation):
+        with self._lock:
+            self._switch_segment(generation)
+
+    def _switch_segment(self, generation):
+        # Needs _lock; lines still queued are the caller's to write first
+        if self._file:
+            self._file.close()
+        self._generation = generation
+        self._file = open(self._segment_path(generation), 'a', encoding='utf-8')
+
+    def _write(self, record, scramble=None, truncate_scrambles=False):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._data_lock:
+            self._apply(record, scramble)
+            with self._pending_lock:
+                self._pending.append(line)
+                if truncate_scrambles:
+                    self._pending.append(_TRUNCATE_SCRAMBLES)
+            self._records += 1
+        if self._records >= self.compact_every:
+            self.compact()
+        self._write_event.set()
+
+    def flush(self):
+        """Writes queued records now instead of waiting for the writer thread."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        with self._pending_lock:
+            lines, self._pending = self._pending, []
+        self._write_lines(lines)
+
+    @profiled('SolveLog.write', 'store')
+    def _write_lines(self, lines):
+        start = 0
+        for index, line in enumerate(lines):
+            if line is _TRUNCATE_SCRAMBLES:
+                self._append_lines(lines[start:index])
+                # The reset record must be on disk before the scrambles go, or a crash in
+                # between leaves solves pointing into an empty scramble file
+                if self._file:
+                    os.fsync(self._file.fileno())
+                self.scramble_file.truncate()
+                start = index + 1
+        self._append_lines(lines[start:])
+
+    def _append_lines(self, lines):
+        # Scrambles first, so a record never points past the end of the scramble file
+        self.scramble_file.flush()
+        if lines and self._file:
+            self._file.write(''.join(lines))
+            # Flush to the OS so a crash of the app loses nothing; the fsync
+            # for power loss happens on the sync thread
+            self._file.flush()
+            self._dirty = True
+
+    def _start_writer_thread(self):
+        if self._writer_thread is not None:
+            return
+
+        def run():
+            while True:
+                self._write_event.wait()
+                self._write_event.clear()
+                if self._stop_event.is_set():
+                    return
+                self.flush()
+                if self._compact_wanted:
+                    self._compact_wanted = False
+                    self._compact(background=True)
+
+        self._writer_thread = threading.Thread(target=run, daemon=True)
+        self._writer_thread.start()
+
+    @profiled('SolveLog.add_solve', 'store')
+    def add_solve(self, puzzle, solve_time, scramble, timestamp=None, penalty=PENALTY_NONE, session=''):
+        """solve_time is in integer milliseconds, timestamp in epoch seconds."""
+        if timestamp is None:
+            timestamp = time.time()
+        offset = self.scramble_file.append(scramble)
+        record = ['add', puzzle, solve_time, timestamp, penalty, offset]
+        if session:
+            record.append(session)
+        self._write(record, scramble)
+        profiler.count('store.appends')
+
+    @profiled('SolveLog.delete_last', 'store')
+    def delete_last(self, puzzle, session=''):
+        self._write(['pop', puzzle, session] if session else ['pop', puzzle])
+
+    def reset(self):
+        with self._data_lock:
+            # Offsets restart now; the writer empties the file once the reset record is synced
+            self.scramble_file.discard()
+            self._write(['reset'], truncate_scrambles=True)
+        self.compact()
+
+    def set_current_puzzle(self, puzzle):
+        if puzzle != self.current_puzzle:
+            self._write(['puzzle', puzzle])
+
+    def set_current_session(self, puzzle, session):
+        if session != self.current_session(puzzle):
+            self._write(['session', puzzle, session])
+
+    def drop_session(self, puzzle, session):
+        """Deletes every solve of the session."""
+        self._write(['drop', puzzle, session])
+
+    def import_data(self, data, current_puzzle=None):
+        """Seeds the log from an old {'times': [...], 'scrambles': [...]} dict (JsonStore data)."""
+        with self._data_lock:
+            for puzzle, entry in data.items():
+                history = self.history(puzzle)
+                for solve_time, scramble in zip(entry['times'], entry['scrambles']):
+                    offset = self.scramble_file.append(scramble)
+                    history.append(round(solve_time * 1000), 0.0, PENALTY_NONE, offset, scramble)
+                self._totals[(puzzle, '')] = self._summed(history)
+        if current_puzzle is not None:
+            self.current_puzzle = current_puzzle
+        self.compact(background=False)
+
+    def import_solves(self, solves, chunk_size=10000):
+        """
+        Bulk-appends (puzzle, ms, timestamp, penalty, scramble, session) tuples from any
+        iterable, a chunk at a time, then folds them into one snapshot
+        instead of logging every solve. Returns the number imported.
+        """
+        count = 0
+        chunk = []
+        touched = set()
+        for solve in solves:
+            chunk.append(solve)
+            if len(chunk) >= chunk_size:
+                count += self._import_chunk(chunk, touched)
+                chunk = []
+        count += self._import_chunk(chunk, touched)
+        with self._data_lock:
+            for key in touched:
+                self._totals[key] = self._summed(self.data[key])
+        self.compact(background=False)
+        profiler.count('store.appends', count)
+        return count
+
+    def _import_chunk(self, chunk, touched):
+        offsets = self.scramble_file.append_many([solve[4] for solve in chunk])
+        with self._data_lock:
+            for (puzzle, solve_time, timestamp, penalty, scramble, session), offset in zip(chunk, offsets):
+                self.history(puzzle, session).append(solve_time, timestamp, penalty, offset, scramble)
+                touched.add((puzzle, session))
+        return len(chunk)
+
+    # --- Compaction & Sync ---
+
+    def compact(self, background=True):
+        """
+        Writes a snapshot of the current data and starts a new segment. In the
+        background this is left to the writer thread; otherwise it is done here.
+        """
+        if background and self._writer_thread is not None:
+            self._compact_wanted = True
+            self._write_event.set()
+        else:
+            self._compact(background)
+
+    def _compact(self, background):
+        if self._compacting:
+            return
+        self._compacting = True
+
+        with self._lock:
+            with self._data_lock:
+                # Records queued so far belong to the segment the snapshot covers, any
+                # written after the copy go to the next one; the UI only waits for the memcpys
+                with self._pending_lock:
+                    lines, self._pending = self._pending, []
+                covered_gen = self._generation
+                self._records = 0
+                # Decoded histories are copied, the rest are copied from the current snapshot file
+                histories = [(key, len(history), history.columns(), history.version, list(self._totals[key]))
+                             for key, history in self.data.items() if len(history)]
+                histories += [(key, count, offset, None, list(self._totals[key]))
+                              for key, (offset, count) in self._stored.items() if key not in self.data]
+                snapshot = (covered_gen, self.current_puzzle, dict(self.current_sessions), histories)
+            self._write_lines(lines)
+            self._switch_segment(covered_gen + 1)
+
+        if background:
+            threading.Thread(target=self._write_snapshot, args=(snapshot, covered_gen), daemon=True).start()
+        else:
+            self._write_snapshot(snapshot, covered_gen)
+
+    @profiled('SolveLog.snapshot', 'store')
+    def _write_snapshot(self, snapshot, covered_gen):
+        try:
+            generation, current_puzzle, current_sessions, histories = snapshot
+            offsets = []
+            offset = 0
+            for _, count, _, _, _ in histories:
+                offsets.append(offset)
+                offset += count * _ROW_BYTES
+            header = {
+                'generation': generation,
+                'current_puzzle': current_puzzle,
+                'sessions': current_sessions,
+                'byteorder': sys.byteorder,
+                'histories': [[puzzle, session, count, offset, finite, total, best]
+                              for ((puzzle, session), count, _, _, (_, finite, total, best)), offset
+                              in zip(histories, offsets)],
+            }
+
+            # Make sure every scramble the snapshot points at is on disk first
+            self.scramble_file.sync()
+
+            tmp_path = self.snapshot_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(SNAPSHOT_MAGIC)
+                f.write(json.dumps(header, separators=(',', ':')).encode('utf-8') + b'\n')
+                start = f.tell()
+                old = None
+                try:
+                    for _, count, source, version, _ in histories:
+                        if version is not None:
+                            SolveHistory.write_columns(f, source)
+                            continue
+                        # Never decoded: its bytes move over from the snapshot being replaced
+                        if old is None:
+                            old = open(self.snapshot_path, 'rb')
+                        old.seek(self._snapshot_start + source)
+                        f.write(old.read(count * _ROW_BYTES))
+                finally:
+                    if old is not None:
+                        old.close()
+                f.flush()
+                os.fsync(f.fileno())
+
+            with self._data_lock:
+                os.replace(tmp_path, self.snapshot_path)
+                self._snapshot_start = start
+                self._restore(histories, offsets)
+
+            for gen in self._segments():
+                if gen <= covered_gen:
+                    os.remove(self._segment_path(gen))
+        finally:
+            self._compacting = False
+
+    def _restore(self, histories, offsets):
+        # Needs _data_lock; points _stored at the new snapshot for every history it still matches
+        stored = {}
+        for (key, count, _, version, _), offset in zip(histories, offsets):
+            history = self.data.get(key)
+            if history is None:
+                # Not decoded since the copy, unless dropped or reset meanwhile
+                if key in self._stored:
+                    stored[key] = (offset, count)
+            elif history.version == (version if version is not None else self._clean.get(key)):
+                stored[key] = (offset, count)
+                self._clean[key] = history.version
+                if key in self._evicted:
+                    self._evicted.discard(key)
+                    del self.data[key]
+        self._stored = stored
+
+    @profiled('SolveLog.sync', 'store')
+    def sync(self):
+        with self._lock:
+            self._flush_locked()
+            if not (self._dirty and self._file):
+                return
+            # Performance: fsync a duplicate descriptor outside the lock, so a segment
+            # switch or flush on the UI thread never waits on the disk
+            fd = os.dup(self._file.fileno())
+            self._dirty = False
+        try:
+            self.scramble_file.sync()
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _start_sync_thread(self):
+        if self._sync_thread is not None:
+            return
+
+        def run():
+            while not self._stop_event.wait(self.fsync_interval):
+                self.sync()
+
+        self._sync_thread = threading.Thread(target=run, daemon=True)
+        self._sync_thread.start()
+
+    def close(self):
+        self._stop_event.set()
+        self._write_event.set()
+        if self._writer_thread is not None:
+            self._writer_thread.join()
+        self.sync()
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+        self.scramble_file.close()
@@ -0,0 +1,450 @@
+"""
+Streaming import/export of solve histories.
+
+    python solve_transfer.py import csTimer-20240101.txt
+    python solve_transfer.py import solves.csv --puzzle "3x3x3"
+    python solve_transfer.py export backup.rcsolves
+    python solve_transfer.py export times.csv --puzzle 3x3x3 --puzzle 4x4x4
+
+Formats, picked from the extension unless --format is given:
+    cstimer   csTimer export (.txt/.json): sessions mapped to puzzles by scramble type
+    csv       puzzle,time_ms,penalty,timestamp,scramble,session with a header row (.csv)
+    binary    chunked columnar blocks, the snapshot layout plus scramble text (.rcsolves)
+
+Every session of every puzzle is exported, and imported back into the
+session of the same name ('' is a puzzle's default session).
+
+Solves flow through as (puzzle, ms, timestamp, penalty, scramble, session) tuples and
+are written to the store a chunk at a time, so no format is ever parsed into
+one big in-memory document. Run this while the app is closed.
+"""
+import io
+import os
+import sys
+import csv
+import json
+import argparse
+from array import array
+
+from puzzle_config import PUZZLE_CONFIG, TRAINER_CONFIG
+from solve_history import PENALTY_NONE, PENALTY_PLUS_TWO, PENALTY_DNF
+from solve_log import SolveLog
+from solve_db import SolveDatabase
+
+BINARY_MAGIC = b'RCSOLVES1\n'
+BINARY_CHUNK = 65536
+PROGRESS_EVERY = 50000
+
+# csTimer scramble types -> PUZZLE_CONFIG/TRAINER_CONFIG keys
+CSTIMER_PUZZLES = {
+    '222so': "2x2x2", '333': "3x3x3", '444wca': "4x4x4", '555wca': "5x5x5",
+    '666wca': "6x6x6", '777wca': "7x7x7", 'pyrso': "Pyraminx", 'mgmp': "Megaminx",
+    'sqrs': "Square-1", 'skbso': "Skewb", 'clkwca': "Clock",
+    '333ni': "3x3x3 3BLD", 'edges': "3x3x3 Edges", 'corners': "3x3x3 Corners",
+    'll': "3x3x3 LL", 'f2l': "3x3x3 F2L", 'easyc': "3x3x3 Cross (Easy)",
+    'lsll2': "3x3x3 LSLL", 'zbll': "3x3x3 ZBLL", 'zzll': "3x3x3 ZZLL", 'zbls': "3x3x3 ZBLS",
+    'lse': "3x3x3 LSE", 'cmll': "3x3x3 CMLL", 'cll': "3x3x3 CLL", 'ell': "3x3x3 ELL",
+    'eoline': "3x3x3 EO Line", '4edge': "4x4x4 Edges", '5edge': "5x5x5 Edges",
+    '6edge': "6x6x6 Edges", '7edge': "7x7x7 Edges",
+    'sq1h': "Square-1 Face Turn Metric", 'sq1t': "Square-1 Twist Metric",
+}
+CSTIMER_TYPES = {puzzle: scr_type for scr_type, puzzle in CSTIMER_PUZZLES.items()}
+CSTIMER_DNF = -1
+CSTIMER_PLUS_TWO = 2000
+
+CSV_PENALTIES = {PENALTY_NONE: "", PENALTY_PLUS_TWO: "+2", PENALTY_DNF: "DNF"}
+CSV_PENALTY_CODES = {text: code for code, text in CSV_PENALTIES.items()}
+CSV_FIELDS = ('puzzle', 'time_ms', 'penalty', 'timestamp', 'scramble', 'session')
+
+# csTimer session names for named sessions: "<puzzle> - <session>", as the app shows them
+SESSION_SEPARATOR = " - "
+
+EXTENSIONS = {'.txt': 'cstimer', '.json': 'cstimer', '.csv': 'csv', '.rcsolves': 'binary'}
+
+
+def known_puzzle(puzzle):
+    return puzzle in PUZZLE_CONFIG or puzzle in TRAINER_CONFIG
+
+
+def _histories(store, puzzles):
+    """(puzzle, session, SolveHistory) for every session of the puzzles that has solves."""
+    for puzzle in puzzles:
+        for session in store.sessions(puzzle):
+            if store.solve_count(puzzle, session):
+                yield puzzle, session, store.history(puzzle, session)
+
+
+class Progress:
+    """Prints solve counts and how far through the file the reader is, to stderr."""
+
+    def __init__(self, label, total_bytes=None, stream=sys.stderr):
+        self.label = label
+        self.total_bytes = total_bytes
+        self.stream = stream
+        self.count = 0
+
+    def __call__(self, count, position=None):
+        self.count = count
+        if self.stream is None:
+            return
+        text = f"\r{self.label}: {count:,} solves"
+        if position is not None and self.total_bytes:
+            text += f" ({position / self.total_bytes:.0%})"
+        self.stream.write(text)
+        self.stream.flush()
+
+    def done(self):
+        if self.stream is not None:
+            self.stream.write(f"\r{self.label}: {self.count:,} solves, done\n")
+
+
+def _tracked(solves, progress, position=None):
+    count = 0
+    for solve in solves:
+        yield solve
+        count += 1
+        if count % PROGRESS_EVERY == 0:
+            progress(count, position() if position else None)
+    progress(count, position() if position else None)
+
+
+# --- csTimer ---
+
+class _JsonStream:
+    """Incremental reader for one large JSON document: values are decoded one at a time."""
+
+    def __init__(self, f, chunk_size=1 << 20):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self):
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"expected {char!r} in csTimer file, found {self.peek()!r}")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            if end == len(self.buffer) and not self.eof and not isinstance(value, (dict, list, str)):
+                # A number or literal may continue in the next chunk
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+
+def _cstimer_properties(path):
+    """csTimer writes 'properties' last: find it from the end without reading the sessions."""
+    size = os.path.getsize(path)
+    tail_size = 1 << 16
+    with open(path, 'rb') as f:
+        while True:
+            f.seek(max(0, size - tail_size))
+            tail = f.read()
+            index = tail.rfind(b'"properties"')
+            if index >= 0 or tail_size >= size:
+                break
+            tail_size *= 4
+    if index < 0:
+        return {}
+    text = tail[index:].decode('utf-8')
+    text = text[text.index(':') + 1:].lstrip()
+    properties, _ = json.JSONDecoder().raw_decode(text)
+    return properties
+
+
+def _app_session(name):
+    """(puzzle, session) for a csTimer session name written by this app, else None."""
+    if not isinstance(name, str):
+        return None
+    if known_puzzle(name):
+        return name, ''
+    puzzle, separator, session = name.partition(SESSION_SEPARATOR)
+    if separator and session and known_puzzle(puzzle):
+        return puzzle, session
+    return None
+
+
+def cstimer_session_puzzles(properties):
+    """
+    Maps csTimer session keys ('session1', ...) to (puzzle, session); the
+    puzzle is None for unknown scramble types.
+    """
+    session_data = properties.get('sessionData', {})
+    if isinstance(session_data, str):
+        session_data = json.loads(session_data)
+    puzzles = {}
+    for number, info in session_data.items():
+        scr_type = info.get('opt', {}).get('scrType', '333')
+        # Sessions exported by this app are named after the puzzle and session
+        puzzles[f"session{number}"] = _app_session(info.get('name')) or (CSTIMER_PUZZLES.get(scr_type), '')
+    return puzzles
+
+
+def _cstimer_penalty(code):
+    if code == CSTIMER_DNF:
+        return PENALTY_DNF
+    if code > 0:
+        return PENALTY_PLUS_TWO
+    return PENALTY_NONE
+
+
+def read_cstimer(raw, puzzle=None, skipped=None):
+    """
+    Yields solves from a csTimer export. Sessions whose scramble type has no
+    matching puzzle are skipped (counted in `skipped`) unless `puzzle` forces one.
+    """
+    session_puzzles = cstimer_session_puzzles(_cstimer_properties(raw.name))
+    text = io.TextIOWrapper(raw, encoding='utf-8')
+    try:
+        stream = _JsonStream(text)
+        stream.expect('{')
+        while stream.peek() != '}':
+            key = stream.value()
+            stream.expect(':')
+            if not key.startswith('session') or stream.peek() != '[':
+                stream.value()
+            else:
+                target, session = session_puzzles.get(key, ("3x3x3", ''))
+                target = puzzle or target
+                stream.expect('[')
+                while stream.peek() != ']':
+                    solve = stream.value()
+                    if target is None:
+                        if skipped is not None:
+                            skipped[key] = skipped.get(key, 0) + 1
+                    else:
+                        (penalty, solve_time), scramble = solve[0], solve[1]
+                        timestamp = solve[3] if len(solve) > 3 else 0
+                        yield target, solve_time, float(timestamp), _cstimer_penalty(penalty), scramble, session
+                    if stream.peek() == ',':
+                        stream.expect(',')
+                stream.expect(']')
+            if stream.peek() == ',':
+                stream.expect(',')
+    finally:
+        # Leave raw open for the caller, it reports progress from its position
+        text.detach()
+
+
+def write_cstimer(path, store, puzzles, progress):
+    count = 0
+    session_data = {}
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{')
+        for number, (puzzle, session, history) in enumerate(_histories(store, puzzles), 1):
+            name = f"{puzzle}{SESSION_SEPARATOR}{session}" if session else puzzle
+            session_data[str(number)] = {'name': name, 'opt': {'scrType': CSTIMER_TYPES.get(puzzle, '333')}}
+            f.write(f'"session{number}":[')
+            for start in range(0, len(history), BINARY_CHUNK):
+                stop = min(start + BINARY_CHUNK, len(history))
+                scrambles = history.scramble_range(start, stop)
+                rows = []
+                for i in range(start, stop):
+                    penalty = history.penalties[i]
+                    code = CSTIMER_DNF if penalty == PENALTY_DNF else CSTIMER_PLUS_TWO if penalty == PENALTY_PLUS_TWO else 0
+                    rows.append(f'[[{code},{history.times[i]}],{json.dumps(scrambles[i - start])},"",'
+                                f'{int(history.timestamps[i])}]')
+                f.write((',' if start else '') + ','.join(rows))
+                count += stop - start
+                progress(count)
+            f.write('],')
+        properties = {'sessionData': json.dumps(session_data, separators=(',', ':'))}
+        f.write('"properties":' + json.dumps(properties, separators=(',', ':')) + '}')
+    return count
+
+
+# --- CSV ---
+
+def read_csv(raw, puzzle=None, skipped=None):
+    text = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+    try:
+        for row in csv.DictReader(text):
+            target = puzzle or row['puzzle']
+            if not known_puzzle(target):
+                if skipped is not None:
+                    skipped[target] = skipped.get(target, 0) + 1
+                continue
+            yield (target, int(row['time_ms']), float(row.get('timestamp') or 0),
+                   CSV_PENALTY_CODES.get(row.get('penalty', ''), PENALTY_NONE), row.get('scramble', ''),
+                   row.get('session') or '')
+    finally:
+        text.detach()
+
+
+def write_csv(path, store, puzzles, progress):
+    count = 0
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDS)
+        for puzzle, session, history in _histories(store, puzzles):
+            for start in range(0, len(history), BINARY_CHUNK):
+                stop = min(start + BINARY_CHUNK, len(history))
+                writer.writerows(zip(
+                    [puzzle] * (stop - start), history.times[start:stop],
+                    [CSV_PENALTIES[p] for p in history.penalties[start:stop]],
+                    history.timestamps[start:stop], history.scramble_range(start, stop),
+                    [session] * (stop - start)
+                ))
+                count += stop - start
+                progress(count)
+    return count
+
+
+# --- Binary columnar ---
+# After the magic line, each block is a JSON header line
+#   {"puzzle": ..., "session": ..., "count": n, "byteorder": ..., "scramble_bytes": b}
+# followed by the times (q), timestamps (d) and penalties (b) columns, the
+# scramble byte lengths (I) and the UTF-8 scramble text, back to back.
+
+def read_binary(raw, puzzle=None, skipped=None):
+    if raw.readline() != BINARY_MAGIC:
+        raise ValueError(f"{raw.name} is not a solve export")
+    while True:
+        line = raw.readline()
+        if not line:
+            return
+        header = json.loads(line)
+        count = header['count']
+        columns = (array('q'), array('d'), array('b'), array('I'))
+        for column in columns:
+            column.fromfile(raw, count)
+            if header['byteorder'] != sys.byteorder:
+                column.byteswap()
+        blob = raw.read(header['scramble_bytes'])
+
+        target = puzzle or header['puzzle']
+        if not known_puzzle(target):
+            if skipped is not None:
+                skipped[target] = skipped.get(target, 0) + count
+            continue
+        session = header.get('session', '')
+        times, timestamps, penalties, lengths = columns
+        offset = 0
+        for i in range(count):
+            end = offset + lengths[i]
+            yield target, times[i], timestamps[i], penalties[i], blob[offset:end].decode('utf-8'), session
+            offset = end
+
+
+def write_binary(path, store, puzzles, progress):
+    count = 0
+    with open(path, 'wb') as f:
+        f.write(BINARY_MAGIC)
+        for puzzle, session, history in _histories(store, puzzles):
+            for start in range(0, len(history), BINARY_CHUNK):
+                stop = min(start + BINARY_CHUNK, len(history))
+                encoded = [s.encode('utf-8') for s in history.scramble_range(start, stop)]
+                blob = b''.join(encoded)
+                header = {'puzzle': puzzle, 'session': session, 'count': stop - start, 'byteorder': sys.byteorder,
+                          'scramble_bytes': len(blob)}
+                f.write(json.dumps(header, separators=(',', ':')).encode('utf-8') + b'\n')
+                for column in (history.times, history.timestamps, history.penalties):
+                    column[start:stop].tofile(f)
+                array('I', map(len, encoded)).tofile(f)
+                f.write(blob)
+                count += stop - start
+                progress(count)
+    return count
+
+
+READERS = {'cstimer': read_cstimer, 'csv': read_csv, 'binary': read_binary}
+WRITERS = {'cstimer': write_cstimer, 'csv': write_csv, 'binary': write_binary}
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    fmt = EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise ValueError(f"can't tell the format of {path}, pass --format")
+    return fmt
+
+
+def import_file(store, path, fmt=None, puzzle=None, progress=None):
+    """Streams a file into a loaded solve store. Returns (imported, {source: skipped count})."""
+    fmt = detect_format(path, fmt)
+    progress = progress or Progress("Importing", os.path.getsize(path), stream=None)
+    skipped = {}
+    with open(path, 'rb') as raw:
+        # Readers may buffer ahead of what they have yielded, the position is approximate
+        solves = READERS[fmt](raw, puzzle, skipped)
+        count = store.import_solves(_tracked(solves, progress, raw.tell))
+    return count, skipped
+
+
+def export_file(store, path, fmt=None, puzzles=None, progress=None):
+    """Streams the given puzzles (default: every puzzle with solves) from a loaded store."""
+    fmt = detect_format(path, fmt)
+    progress = progress or Progress("Exporting", stream=None)
+    return WRITERS[fmt](path, store, puzzles or store.puzzles(), progress)
+
+
+STORES = {
+    'log': lambda: SolveLog('cube_timer_solves'),
+    'sqlite': lambda: SolveDatabase('cube_timer_solves.db'),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import or export R-Cube-Timer solve histories")
+    parser.add_argument('command', choices=('import', 'export'))
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=sorted(READERS))
+    parser.add_argument('--puzzle', action='append',
+                        help="import: put every solve under this puzzle; export: puzzles to include")
+    parser.add_argument('--store', choices=sorted(STORES), default='log', help="solve storage engine")
+    args = parser.parse_args(argv)
+
+    store = STORES[args.store]()
+    store.load()
+    try:
+        if args.command == 'import':
+            if args.puzzle and (len(args.puzzle) > 1 or not known_puzzle(args.puzzle[0])):
+                parser.error("import takes one known --puzzle")
+            progress = Progress("Importing", os.path.getsize(args.path))
+            count, skipped = import_file(store, args.path, args.format,
+                                         args.puzzle[0] if args.puzzle else None, progress)
+            progress.done()
+            for source, skipped_count in skipped.items():
+                print(f"Skipped {skipped_count:,} solves from {source}: no matching puzzle", file=sys.stderr)
+        else:
+            progress = Progress("Exporting")
+            export_file(store, args.path, args.format, args.puzzle, progress)
+            progress.done()
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+import time
+
+
+class StartupTimer:
+    """
+    Records how long each startup phase takes.
+    mark() closes the current phase; finish() closes the last one and
+    returns the report once, later calls return None.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = []
+        self.finished = False
+        self._last = self.start
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def finish(self, phase):
+        if self.finished:
+            return None
+        self.mark(phase)
+        self.finished = True
+        return self.report()
+
+    def report(self):
+        total = self._last - self.start
+        lines = [f"{phase:<24}{duration * 1000:8.1f} ms" for phase, duration in self.phases]
+        lines.append(f"{'total':<24}{total * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+
+# Started as soon as the app imports this module, before Kivy is loaded
+startup = StartupTimer()
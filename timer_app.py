@@ -0,0 +1,102 @@
+"""
+The Kivy app. Started from main.py; kept out of it because scramble worker
+processes are spawned and re-import main.py, and must never load Kivy.
+"""
+# Imported first so the timing report includes Kivy's own startup
+from startup_timing import startup
+
+from kivy.app import App
+from kivy.clock import Clock
+from kivy.uix.screenmanager import ScreenManager
+from kivy.lang import Builder
+
+startup.mark('kivy import')
+
+from solve_log import SolveLog
+from solve_db import SolveDatabase
+from scramble_service import ScrambleService
+from scramble_store import ScrambleQueueStore
+from scramble_pool import ScramblePools
+from case_trainer import CaseStore
+from persistence import PersistenceWorker, SettingsStore
+from timer_engine import TimerEngine
+
+from app_logic import (
+    TimerScreen, StatsScreen, SettingsScreen,
+    PuzzleSelectorScreen, SplashScreen, TrainerSelectorScreen, SessionSelectorScreen, CaseSelectorScreen
+)
+from puzzle_config import PUZZLE_CONFIG, TRAINER_CONFIG
+
+startup.mark('app modules import')
+
+Builder.load_file('styles.kv')
+startup.mark('kv rules')
+
+# Solve history storage: 'log' (append-only log + snapshot) or 'sqlite'
+SOLVE_STORAGE = 'log'
+
+
+class RubiksTimerApp(App):
+    def build(self):
+        # Performance: Settings, scramble queue and SQLite solve saves are written on
+        # this worker's thread; the settings file is written atomically with rotating backups
+        self.persistence = PersistenceWorker(on_error=self._on_save_error)
+        self.store = SettingsStore('cube_timer_data.json', self.persistence)
+        if SOLVE_STORAGE == 'sqlite':
+            solve_store = self._open_solve_database('cube_timer_solves.db')
+        else:
+            solve_store = SolveLog('cube_timer_solves')
+        scramble_service = ScrambleService(
+            {**PUZZLE_CONFIG, **TRAINER_CONFIG},
+            schedule=lambda callback: Clock.schedule_once(lambda dt: callback(), 0),
+            # Filled offline by scramble_pool.py, served before anything is generated
+            pools=ScramblePools('cube_timer_pools')
+        )
+        # Everything but the screens lives in the engine, the screens subscribe to it
+        self.engine = TimerEngine(solve_store, scramble_service, ScrambleQueueStore('cube_timer_queues'),
+                                  self.persistence, CaseStore('cube_timer_cases'))
+
+        sm = ScreenManager()
+
+        # Add Screens
+        sm.add_widget(TimerScreen(name='timer'))
+        sm.add_widget(StatsScreen(name='stats'))
+        sm.add_widget(SettingsScreen(name='settings'))
+        sm.add_widget(PuzzleSelectorScreen(name='puzzle_selector'))
+        sm.add_widget(TrainerSelectorScreen(name='trainer_selector'))
+        sm.add_widget(SessionSelectorScreen(name='session_selector'))
+        sm.add_widget(CaseSelectorScreen(name='case_selector'))
+
+        # Initialize and Show Splash Screen First
+        splash = SplashScreen(name='splash')
+        splash.main_sm = sm
+        sm.add_widget(splash)
+        sm.current = 'splash'
+
+        startup.mark('build')
+        return sm
+
+    def _open_solve_database(self, path):
+        # Performance: Solves are committed on the persistence worker's thread
+        database = SolveDatabase(path, self.persistence)
+        solve_log = SolveLog('cube_timer_solves')
+        if not database.exists() and solve_log.exists():
+            # First run on SQLite: carry over the existing log history
+            solve_log.load()
+            database.load()
+            database.import_histories(solve_log.histories(), solve_log.current_puzzle, solve_log.current_sessions)
+            database.close()
+            solve_log.close()
+        return database
+
+    def _on_save_error(self, key, error):
+        # On the worker thread, the failure is already logged
+        Clock.schedule_once(lambda dt: self._show_save_error(error), 0)
+
+    def _show_save_error(self, error):
+        if self.root is not None:
+            self.root.get_screen('timer').ids.status_label.text = f"Saving failed: {error}"
+
+    def on_stop(self):
+        self.engine.close()
+        self.persistence.close()
@@ -0,0 +1,401 @@
+from functools import partial
+
+from timing import format_ms
+from solve_history import effective_time, PENALTY_NONE, PENALTY_PLUS_TWO, PENALTY_DNF
+from session_cache import SessionCache
+from cube_state import cube_size
+from case_trainer import CaseTrainer
+from puzzle_config import PUZZLE_CONFIG, TRAINER_CONFIG, CASE_TRAINER_MODES
+
+# Engine events, see TimerEngine.subscribe
+PUZZLE_CHANGED = 'puzzle'      # callback(puzzle)
+SESSION_CHANGED = 'session'    # callback(puzzle, session), another session selected or one deleted
+SOLVES_CHANGED = 'solves'      # callback(puzzle), a solve was added, deleted or everything reset
+SCRAMBLE_CHANGED = 'scramble'  # callback(scramble), None while waiting for the generator
+QUEUES_CHANGED = 'queues'      # callback(), scramble queues need saving
+CASES_CHANGED = 'cases'        # callback(puzzle), cases found, their banks refilled or the drill changed
+
+DEFAULT_PUZZLE = "3x3x3"
+# Every puzzle's first session; stores keep it under the name ''
+DEFAULT_SESSION_NAME = "Main"
+
+
+def format_time(ms):
+    if ms is None:
+        return "--"
+    return format_ms(ms)
+
+
+def session_name(session):
+    return session or DEFAULT_SESSION_NAME
+
+
+def format_solve(ms, penalty):
+    if penalty == PENALTY_DNF:
+        return "DNF"
+    if penalty == PENALTY_PLUS_TWO:
+        return format_ms(effective_time(ms, penalty)) + "+"
+    return format_ms(ms)
+
+
+class TimerEngine:
+    """
+    The timer without its screens: current puzzle and scramble, solve
+    recording, per-puzzle statistics and persistence.
+
+    Composes a solve store (SolveLog or SolveDatabase), a ScrambleService, an
+    optional ScrambleQueueStore and an optional PersistenceWorker for
+    background queue saves, and imports nothing from Kivy, so it can
+    be driven from a benchmark, a CLI or a test as well as from the UI.
+    Screens subscribe to the events above instead of being called directly.
+
+    With a CaseStore, the trainer modes in CASE_TRAINER_MODES get a
+    CaseTrainer: while cases are selected for drilling, scrambles come from
+    it instead of the queue, and every solve's time is kept per case.
+    """
+
+    def __init__(self, solve_store, scramble_service, queue_store=None, persistence=None, case_store=None):
+        self.solve_store = solve_store
+        self.scramble_service = scramble_service
+        self.queue_store = queue_store
+        self.persistence = persistence
+        self.case_store = case_store
+        self.case_trainers = {}  # puzzle -> CaseTrainer, created on first use
+
+        self.current_puzzle = DEFAULT_PUZZLE
+        self.current_session = ''
+        self.current_scramble = ""
+
+        # Performance: Incremental stats per (puzzle, session), built lazily on first use
+        # and dropped with the history when the session falls out of the LRU
+        self.session_stats = {}
+        self.sessions = SessionCache(solve_store, on_evict=self._on_session_evicted)
+
+        self._listeners = {}
+        scramble_service.add_listener(self._on_scrambles_ready)
+
+    # --- Events ---
+
+    def subscribe(self, event, callback):
+        self._listeners.setdefault(event, []).append(callback)
+
+    def _emit(self, event, *args):
+        for callback in self._listeners.get(event, ()):
+            callback(*args)
+
+    # --- Lifecycle ---
+
+    def load(self, legacy_data=None, legacy_puzzle=None):
+        """
+        Opens the stores. `legacy_data` is the old {'times', 'scrambles'} dict
+        from earlier versions, imported only when the solve store is new.
+        Returns True if it was imported.
+        """
+        is_new_store = not self.solve_store.exists()
+        self.solve_store.load()
+
+        imported = False
+        if is_new_store and legacy_data is not None:
+            self.solve_store.import_data(legacy_data, legacy_puzzle)
+            imported = True
+
+        if self.queue_store is not None:
+            self.scramble_service.load_queues(self.queue_store.load())
+
+        puzzle = self.solve_store.current_puzzle or DEFAULT_PUZZLE
+        if puzzle not in PUZZLE_CONFIG and puzzle not in TRAINER_CONFIG:
+            puzzle = DEFAULT_PUZZLE
+        self.current_puzzle = puzzle
+        self.current_session = self.solve_store.current_session(puzzle)
+        # No history is loaded here; stats and recent solves come from the store on first use
+        self._select_history()
+        self.scramble_service.set_priority(puzzle)
+        return imported
+
+    def import_queues(self, queues):
+        """Takes over scramble queues saved elsewhere (e.g. the old JsonStore key)."""
+        self.scramble_service.load_queues(queues, mark_dirty=True)
+        self._emit(QUEUES_CHANGED)
+
+    def save_queues(self, background=False):
+        """
+        Writes the queues (and case trainers) that changed since the last
+        save. With `background` they go to the persistence worker (if any),
+        which keeps only the newest pending save per puzzle.
+        """
+        # Case banks and per-case times, only for trainers that changed
+        if self.case_store is not None:
+            for puzzle, trainer in self.case_trainers.items():
+                data = trainer.take_dirty()
+                if data is None:
+                    continue
+                if background and self.persistence is not None:
+                    self.persistence.submit(('cases', puzzle), partial(self.case_store.save, puzzle, data))
+                else:
+                    self.case_store.save(puzzle, data)
+
+        if self.queue_store is None:
+            return
+        # Performance: Only the queues that were popped or refilled are rewritten
+        dirty = self.scramble_service.take_dirty()
+        if background and self.persistence is not None:
+            for puzzle, scrambles in dirty.items():
+                self.persistence.submit(('queue', puzzle), partial(self.queue_store.save, puzzle, scrambles))
+        else:
+            self.queue_store.save_many(dirty)
+
+        # How far each offline pool has been read, saved with the queues it was read into
+        pools = self.scramble_service.pools
+        if pools is not None:
+            for pool, cursor in pools.take_dirty():
+                if background and self.persistence is not None:
+                    self.persistence.submit(('pool', pool.path), partial(pool.save_cursor, cursor))
+                else:
+                    pool.save_cursor(cursor)
+
+    def close(self):
+        self.scramble_service.shutdown()
+        for trainer in self.case_trainers.values():
+            trainer.shutdown()
+        # Flush queue changes a coalesced save has not picked up yet, after
+        # any older saves still waiting on the worker
+        self.save_queues(background=True)
+        if self.persistence is not None:
+            self.persistence.flush()
+        if self.scramble_service.pools is not None:
+            self.scramble_service.pools.close()
+        self.solve_store.close()
+
+    # --- Puzzle & Scrambles ---
+
+    @property
+    def history(self):
+        """The current session's full SolveHistory; the store may load it on first access."""
+        return self.solve_store.history(self.current_puzzle, self.current_session)
+
+    @property
+    def series(self):
+        """The current session's effective times and timestamps, all the graph and analytics need."""
+        return self.solve_store.series(self.current_puzzle, self.current_session)
+
+    @property
+    def history_name(self):
+        """Unique display name of the current history, e.g. '3x3x3' or '3x3x3 - OH'."""
+        if not self.current_session:
+            return self.current_puzzle
+        return f"{self.current_puzzle} - {self.current_session}"
+
+    @property
+    def stats(self):
+        key = (self.current_puzzle, self.current_session)
+        stats = self.session_stats.get(key)
+        if stats is None:
+            # Performance: The store answers from whatever it keeps (SolveLog's arrays,
+            # SolveDatabase's session_totals row); a database history is not loaded for this
+            stats = self.solve_store.stats(self.current_puzzle, self.current_session)
+            self.session_stats[key] = stats
+        return stats
+
+    def _select_history(self):
+        # Only marked as used, the history itself is loaded by whatever reads it first
+        self.sessions.touch(self.current_puzzle, self.current_session)
+
+    def _on_session_evicted(self, puzzle, session):
+        self.session_stats.pop((puzzle, session), None)
+
+    def switch_puzzle(self, puzzle):
+        if puzzle != self.current_puzzle:
+            # Batches for the puzzle being left that have not started yet would only delay this one's
+            self.scramble_service.cancel(self.current_puzzle)
+        self.current_puzzle = puzzle
+        self.current_session = self.solve_store.current_session(puzzle)
+        self._select_history()
+        # Queue this puzzle's refill ahead of any background prefetching
+        self.scramble_service.set_priority(puzzle)
+        self.solve_store.set_current_puzzle(puzzle)
+        self._emit(PUZZLE_CHANGED, puzzle)
+        self.next_scramble()
+
+    def upcoming_scramble(self):
+        """The scramble that will follow the current one, if one is queued."""
+        if self._drill() is not None:
+            # Picked only when it is needed, to keep the drill balanced
+            return None
+        return self.scramble_service.peek(self.current_puzzle)
+
+    def next_scramble(self):
+        """Moves on to the next queued scramble, or waits for the generator if there is none."""
+        trainer = self._drill()
+        drilled = trainer.next() if trainer is not None else None
+        if drilled is not None:
+            scramble = drilled[1]
+            self._emit(CASES_CHANGED, self.current_puzzle)
+        else:
+            # Popping also tops the queue back up once it drops below the low watermark
+            scramble = self.scramble_service.pop(self.current_puzzle)
+        self.current_scramble = scramble or ""
+        if scramble is not None:
+            self._emit(QUEUES_CHANGED)
+        self._emit(SCRAMBLE_CHANGED, scramble)
+        return scramble
+
+    def _on_scrambles_ready(self, puzzle):
+        self._emit(QUEUES_CHANGED)
+        if puzzle == self.current_puzzle and not self.current_scramble:
+            self.next_scramble()
+
+    def pause_generation(self):
+        """Keeps background generation (prefetching, case discovery) off the CPU, e.g. during a solve."""
+        self.scramble_service.pause()
+        for trainer in self.case_trainers.values():
+            trainer.pause()
+
+    def resume_generation(self):
+        self.scramble_service.resume()
+        for trainer in self.case_trainers.values():
+            trainer.resume()
+
+    def prefetch_idle(self):
+        """
+        Fills WCA puzzles and any trainer mode with history in the background.
+        Trainer modes that were never used are left for switch_puzzle.
+        """
+        used = set(self.solve_store.puzzles())
+        puzzles = list(PUZZLE_CONFIG.keys())
+        puzzles += [puz for puz in TRAINER_CONFIG.keys() if puz in used]
+        self.scramble_service.prefetch(puzzles)
+
+    # --- Solves ---
+
+    def record_solve(self, solve_time, penalty=PENALTY_NONE):
+        """Stores a solve (integer ms) against the current scramble and moves to the next one."""
+        effective = effective_time(solve_time, penalty)
+        stats = self.stats
+        stats.push(effective)
+        trainer = self.case_trainer()
+        if trainer is not None:
+            trainer.record(self.current_scramble, effective, self.current_session)
+        self.solve_store.add_solve(self.current_puzzle, solve_time, self.current_scramble, penalty=penalty,
+                                   session=self.current_session)
+        self.sessions.set_summary(self.current_puzzle, self.current_session, stats.summary())
+        self._emit(SOLVES_CHANGED, self.current_puzzle)
+        self.next_scramble()
+
+    def delete_last(self):
+        """Removes the latest solve of the current session. Returns False if there was none."""
+        stats = self.stats
+        if not stats.count:
+            return False
+        trainer = self.case_trainer()
+        if trainer is not None:
+            trainer.undo(self.solve_store.last_scramble(self.current_puzzle, self.current_session),
+                         self.current_session)
+        self.solve_store.delete_last(self.current_puzzle, self.current_session)
+        # After the store, stats that re-read it must not see the deleted solve
+        stats.pop()
+        self.sessions.set_summary(self.current_puzzle, self.current_session, stats.summary())
+        self._emit(SOLVES_CHANGED, self.current_puzzle)
+        return True
+
+    def reset(self):
+        """Deletes every solve of every puzzle and session."""
+        self.solve_store.reset()
+        self.session_stats.clear()
+        self.sessions.clear()
+        for puzzle in CASE_TRAINER_MODES:
+            trainer = self.case_trainer(puzzle)
+            if trainer is not None:
+                trainer.drop_times()
+        self._emit(SOLVES_CHANGED, self.current_puzzle)
+        self.next_scramble()
+
+    # --- Sessions ---
+
+    def list_sessions(self):
+        """
+        [(session, SessionSummary or None)] for the current puzzle, default
+        session first. Nothing is loaded: summaries are cached and kept current.
+        """
+        summaries = self.sessions.summaries(self.current_puzzle)
+        names = self.solve_store.sessions(self.current_puzzle)
+        names.sort(key=lambda session: (session != '', session))
+        return [(session, summaries.get(session)) for session in names]
+
+    def switch_session(self, session):
+        if session == self.current_session:
+            return
+        self.current_session = session
+        self._select_history()
+        self.solve_store.set_current_session(self.current_puzzle, session)
+        self._emit(SESSION_CHANGED, self.current_puzzle, session)
+
+    def new_session(self):
+        """Starts the first free 'Session N' for the current puzzle and switches to it."""
+        taken = set(self.solve_store.sessions(self.current_puzzle))
+        number = 2
+        while f"Session {number}" in taken:
+            number += 1
+        self.switch_session(f"Session {number}")
+        return self.current_session
+
+    def delete_session(self, session):
+        """Deletes a session's solves; the default session is only emptied. Falls back to the default."""
+        self.solve_store.drop_session(self.current_puzzle, session)
+        self.session_stats.pop((self.current_puzzle, session), None)
+        trainer = self.case_trainer()
+        if trainer is not None:
+            trainer.drop_times(session)
+        self.sessions.forget(self.current_puzzle, session)
+        if session == self.current_session:
+            self.current_session = None  # Forces the switch and its event below
+            self.switch_session('')
+        else:
+            self._emit(SESSION_CHANGED, self.current_puzzle, self.current_session)
+
+    # --- Case drilling ---
+
+    def case_trainer(self, puzzle=None):
+        """The CaseTrainer of a puzzle (default: the current one), None if it has no cases."""
+        puzzle = puzzle or self.current_puzzle
+        trainer = self.case_trainers.get(puzzle)
+        if trainer is None and self.case_store is not None and puzzle in CASE_TRAINER_MODES:
+            trainer = CaseTrainer(
+                puzzle, cube_size(puzzle), CASE_TRAINER_MODES[puzzle], TRAINER_CONFIG[puzzle],
+                self.scramble_service, self.case_store
+            )
+            trainer.add_listener(self._on_cases_ready)
+            self.case_trainers[puzzle] = trainer
+        return trainer
+
+    def _drill(self):
+        trainer = self.case_trainer()
+        return trainer if trainer is not None and trainer.drilling else None
+
+    def drill_cases(self, keys):
+        """Drills these cases of the current puzzle from the next scramble on; none stops drilling."""
+        trainer = self.case_trainer()
+        if trainer is None:
+            return
+        trainer.select(keys)
+        self._emit(CASES_CHANGED, self.current_puzzle)
+        self.next_scramble()
+
+    def find_cases(self, count):
+        """Generates `count` scrambles of the current puzzle in the background to find its cases."""
+        trainer = self.case_trainer()
+        if trainer is not None:
+            trainer.discover(count)
+
+    def _on_cases_ready(self, puzzle):
+        self._emit(CASES_CHANGED, puzzle)
+        if puzzle == self.current_puzzle and not self.current_scramble:
+            self.next_scramble()
+
+    def last_solve(self):
+        """(ms, penalty) of the latest solve, or None."""
+        recent = self.recent_solves(1)
+        return recent[0] if recent else None
+
+    def recent_solves(self, count):
+        """The latest `count` solves as (ms, penalty), newest first."""
+        return self.solve_store.recent(self.current_puzzle, self.current_session, count)
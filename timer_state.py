@@ -0,0 +1,173 @@
+import math
+
+from timing import SolveClock, now_ns, NS_PER_MS
+from solve_history import PENALTY_NONE, PENALTY_PLUS_TWO, PENALTY_DNF
+
+# Timer states
+IDLE = 'idle'
+INSPECTION = 'inspection'
+HOLDING = 'holding'
+READY = 'ready'
+RUNNING = 'running'
+STOPPED = 'stopped'
+
+# WCA inspection limits: over 15 s is +2, over 17 s is DNF
+INSPECTION_MS = 15000
+INSPECTION_DNF_MS = 17000
+
+
+class TimerStateMachine:
+    """
+    Hold-to-start timer with optional WCA inspection.
+
+    idle/stopped -> (press) holding -> (hold_ms elapses) ready -> (release) running -> (press) stopped
+    With inspection on, releasing the key in idle/stopped starts a 15 s
+    inspection first, and holding/ready return to it instead of idle.
+
+    Nothing polls: the hold threshold and inspection milestones are one-shot
+    events from `schedule(callback, delay_seconds)`, which must return an
+    object with a cancel() method (Kivy's Clock.schedule_once does).
+    """
+
+    def __init__(self, schedule, hold_ms=500, inspection=False):
+        self.schedule = schedule
+        self.hold_ms = hold_ms
+        self.inspection = inspection
+
+        self.state = IDLE
+        self.clock = SolveClock()
+        self.penalty = PENALTY_NONE
+        self.inspection_start_ns = None
+
+        self.on_state = None  # callback(state), also fired on inspection ticks
+        self.on_solve = None  # callback(ms, penalty)
+
+        self._hold_event = None
+        self._inspection_event = None
+        self._await_release = False
+
+    # --- Input ---
+
+    def press(self, at_ns):
+        if self._await_release:
+            # Key repeat from the press that stopped the last solve
+            return
+        if self.state == RUNNING:
+            self._stop(at_ns)
+        elif self.state == INSPECTION or (self.state in (IDLE, STOPPED) and not self.inspection):
+            self._begin_hold(at_ns)
+
+    def release(self, at_ns):
+        if self._await_release:
+            self._await_release = False
+            return
+        if self.state == READY:
+            self._start(at_ns)
+        elif self.state == HOLDING:
+            self._cancel_event('_hold_event')
+            self._set_state(INSPECTION if self.inspection_start_ns is not None else IDLE)
+        elif self.state in (IDLE, STOPPED) and self.inspection:
+            self._begin_inspection(at_ns)
+
+    def cancel(self):
+        """Drops back to idle from any state except running."""
+        if self.state == RUNNING:
+            return
+        self._cancel_event('_hold_event')
+        self._cancel_event('_inspection_event')
+        self.inspection_start_ns = None
+        self._await_release = False
+        self._set_state(IDLE)
+
+    # --- Transitions ---
+
+    def _set_state(self, state):
+        self.state = state
+        if self.on_state:
+            self.on_state(state)
+
+    def _cancel_event(self, name):
+        event = getattr(self, name)
+        if event is not None:
+            event.cancel()
+            setattr(self, name, None)
+
+    def _begin_hold(self, at_ns):
+        if self.hold_ms <= 0:
+            self._set_state(READY)
+            return
+        self._set_state(HOLDING)
+        # The press may have been handled a little late, count from the event itself
+        remaining_ms = self.hold_ms - (now_ns() - at_ns) / NS_PER_MS
+        self._hold_event = self.schedule(self._hold_elapsed, max(0.0, remaining_ms / 1000))
+
+    def _hold_elapsed(self):
+        self._hold_event = None
+        if self.state == HOLDING:
+            self._set_state(READY)
+
+    def _begin_inspection(self, at_ns):
+        self.inspection_start_ns = at_ns
+        self.penalty = PENALTY_NONE
+        self._set_state(INSPECTION)
+        self._schedule_inspection_tick()
+
+    def inspection_elapsed_ms(self, at_ns=None):
+        if self.inspection_start_ns is None:
+            return 0
+        return ((now_ns() if at_ns is None else at_ns) - self.inspection_start_ns) / NS_PER_MS
+
+    def inspection_display(self):
+        """Countdown text for the timer label: seconds left, then +2, then DNF."""
+        elapsed = self.inspection_elapsed_ms()
+        if elapsed >= INSPECTION_DNF_MS:
+            return "DNF"
+        if elapsed >= INSPECTION_MS:
+            return "+2"
+        return str(math.ceil((INSPECTION_MS - elapsed) / 1000))
+
+    def _schedule_inspection_tick(self):
+        # Wake up on the next whole second only, to refresh the countdown
+        elapsed = self.inspection_elapsed_ms()
+        next_ms = (int(elapsed // 1000) + 1) * 1000
+        self._inspection_event = self.schedule(self._inspection_tick, (next_ms - elapsed) / 1000)
+
+    def _inspection_tick(self):
+        self._inspection_event = None
+        if self.state not in (INSPECTION, HOLDING, READY):
+            return
+        if self.inspection_elapsed_ms() >= INSPECTION_DNF_MS:
+            self._cancel_event('_hold_event')
+            self.inspection_start_ns = None
+            self.penalty = PENALTY_DNF
+            # The key may still be down, its release must not start a new inspection
+            self._await_release = self.state in (HOLDING, READY)
+            self._set_state(STOPPED)
+            if self.on_solve:
+                self.on_solve(0, PENALTY_DNF)
+            return
+        if self.on_state:
+            self.on_state(self.state)
+        self._schedule_inspection_tick()
+
+    def _start(self, at_ns):
+        if self.inspection_start_ns is not None:
+            elapsed = self.inspection_elapsed_ms(at_ns)
+            if elapsed >= INSPECTION_DNF_MS:
+                self.penalty = PENALTY_DNF
+            elif elapsed >= INSPECTION_MS:
+                self.penalty = PENALTY_PLUS_TWO
+            self._cancel_event('_inspection_event')
+            self.inspection_start_ns = None
+        else:
+            self.penalty = PENALTY_NONE
+
+        self.clock.start(at_ns)
+        self._set_state(RUNNING)
+
+    def _stop(self, at_ns):
+        ms = self.clock.stop(at_ns)
+        self._await_release = True
+        self._set_state(STOPPED)
+        if self.on_solve:
+            self.on_solve(ms, self.penalty)
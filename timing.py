@@ -0,0 +1,58 @@
+import math
+import time
+
+from profiler import profiled
+
+NS_PER_MS = 1_000_000
+
+# Pre-built zero padded pieces so the running display never goes through str.format
+_TWO_DIGITS = [f"{i:02}" for i in range(100)]
+
+
+def now_ns():
+    """Monotonic, high resolution timestamp. Take it as early as possible in an event handler."""
+    return time.perf_counter_ns()
+
+
+def ns_to_ms(ns):
+    # Truncate like a stackmat: 12.3459 s is recorded as 12.345 s
+    return ns // NS_PER_MS
+
+
+# Runs every frame while the timer runs, the overlay shows what it costs
+@profiled('format_ms', 'ui')
+def format_ms(ms):
+    """Formats a duration in milliseconds as m:ss.cc (centiseconds truncated)."""
+    if ms == math.inf:
+        return "DNF"
+    centis_total = int(ms) // 10
+    seconds_total, centis = divmod(centis_total, 100)
+    mins, secs = divmod(seconds_total, 60)
+    return str(mins) + ":" + _TWO_DIGITS[secs] + "." + _TWO_DIGITS[centis]
+
+
+class SolveClock:
+    """
+    Stopwatch for a single solve, driven by event timestamps rather than by
+    when the UI gets around to handling them. Times are integer nanoseconds
+    internally and integer milliseconds when recorded.
+    """
+
+    def __init__(self):
+        self.start_ns = 0
+        self.stop_ns = 0
+        self.running = False
+
+    def start(self, at_ns=None):
+        self.start_ns = now_ns() if at_ns is None else at_ns
+        self.running = True
+
+    def stop(self, at_ns=None):
+        """Stops the clock and returns the solve time in milliseconds."""
+        self.stop_ns = now_ns() if at_ns is None else at_ns
+        self.running = False
+        return ns_to_ms(self.stop_ns - self.start_ns)
+
+    def elapsed_ms(self):
+        end_ns = now_ns() if self.running else self.stop_ns
+        return ns_to_ms(end_ns - self.start_ns)